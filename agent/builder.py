@@ -0,0 +1,172 @@
+from typing import Final, Optional, List, Dict, Any, Union
+from agent.config import Build
+from threading import Event, Lock
+from pathlib import Path
+import hashlib
+import frida
+import json
+import time
+import sys
+import os
+
+
+# 参与构建的源码后缀, 以及项目根目录下影响构建结果的文件
+SOURCE_SUFFIXES: Final[frozenset] = frozenset(['.ts', '.mts', '.js', '.mjs', '.cjs'])
+PROJECT_FILES: Final[List[str]] = ['package.json', 'package-lock.json', 'tsconfig.json']
+SKIP_DIRS: Final[frozenset] = frozenset(['node_modules', '__pycache__'])
+
+CACHE_DIRNAME: Final[str] = '.frida-analykit'
+
+
+class AgentBuilder:
+    # 用frida自带的编译器在进程内打包agent, 取代单独运行的 frida-compile.
+    # 源码摘要与产物hash记录在 project_root/.frida-analykit/build.json, 源码未变化时直接使用已有产物;
+    # watch模式下编译器常驻, 文件变化后增量重编并原子替换jsfile
+    conf: Final[Build]
+    output: Final[Path]
+    entrypoint: Final[Path]
+    project_root: Final[Path]
+    cache_path: Final[Path]
+    history: List[Dict[str, Any]]
+
+    _compiler: Optional[frida.Compiler]
+    _started_at: float
+    # 本轮编译开始时的源码摘要; 编译期间源码可能又被修改, 不能在输出时再计算
+    _build_digest: str
+    _produced: bool
+    _finished: Event
+    _lock: Lock
+
+    def __init__(self, output: Union[str, Path], conf: Build):
+        self.conf = conf
+        self.output = Path(output).absolute()
+        self.entrypoint = Path(conf.entrypoint).absolute()
+        self.project_root = Path(conf.project_root).absolute() if conf.project_root else self.entrypoint.parent
+        self.cache_path = self.project_root / CACHE_DIRNAME / 'build.json'
+        self.history = []
+        self._compiler = None
+        self._started_at = 0
+        self._build_digest = ''
+        self._produced = False
+        self._finished = Event()
+        self._lock = Lock()
+
+    def _options(self) -> Dict[str, str]:
+        return {
+            'project_root': str(self.project_root),
+            'source_maps': self.conf.source_maps,
+            'compression': self.conf.compression,
+        }
+
+    def sources(self) -> List[Path]:
+        files = [self.project_root / v for v in PROJECT_FILES if (self.project_root / v).is_file()]
+        for dirpath, dirnames, filenames in os.walk(self.project_root, followlinks=True):
+            dirnames[:] = sorted(v for v in dirnames if v not in SKIP_DIRS and not v.startswith('.'))
+            for name in sorted(filenames):
+                fp = Path(dirpath) / name
+                if fp.suffix in SOURCE_SUFFIXES and fp != self.output:
+                    files.append(fp)
+        return files
+
+    def digest(self) -> str:
+        # 以路径+大小+修改时间计算摘要, 不读取文件内容
+        h = hashlib.sha256(json.dumps(self._options(), sort_keys=True).encode())
+        for fp in self.sources():
+            st = fp.stat()
+            h.update(f'{fp.relative_to(self.project_root)}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8', 'surrogateescape'))
+        return h.hexdigest()
+
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.cache_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def is_fresh(self, digest: Optional[str] = None) -> bool:
+        cache = self._load_cache()
+        if not self.output.is_file() or cache.get('digest') != (digest or self.digest()):
+            return False
+        return cache.get('output') == hashlib.sha256(self.output.read_bytes()).hexdigest()
+
+    def _store(self, bundle: str, digest: str, elapsed: float):
+        data = bundle.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        changed = not self.output.is_file() or hashlib.sha256(self.output.read_bytes()).hexdigest() != sha256
+        if changed:
+            self.output.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.output.with_name(f'.{self.output.name}.{os.getpid()}.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, self.output)
+        record = {'digest': digest, 'output': sha256, 'size': len(data), 'elapsed': round(elapsed, 3), 'built_at': time.time()}
+        self.history.append(record)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_text(json.dumps(record), encoding='utf-8')
+        print(f'[build] {self.output.name} {len(data)}字节 耗时{elapsed:.2f}s{"" if changed else " (无变化)"}')
+
+    @staticmethod
+    def _on_diagnostics(diagnostics: List[Dict[str, Any]]):
+        for diag in diagnostics:
+            loc = ''
+            if 'file' in diag:
+                file = diag['file']
+                loc = f'{file["path"]}:{file["line"] + 1}:{file["character"] + 1} '
+            print(f'[build] {loc}{diag["category"]} TS{diag["code"]}: {diag["text"]}', file=sys.stderr)
+
+    def build(self, force: bool = False) -> Path:
+        digest = self.digest()
+        if not force and self.is_fresh(digest):
+            print(f'[build] 源码未变化, 使用已有的 {self.output.name}')
+            return self.output
+        compiler = frida.Compiler()
+        compiler.on('diagnostics', self._on_diagnostics)
+        started_at = time.time()
+        bundle = compiler.build(str(self.entrypoint), **self._options())
+        self._store(bundle, digest, time.time() - started_at)
+        return self.output
+
+    def _on_starting(self):
+        with self._lock:
+            self._started_at = time.time()
+            self._build_digest = self.digest()
+            self._produced = False
+
+    def _on_output(self, bundle: str):
+        with self._lock:
+            self._produced = True
+            self._store(bundle, self._build_digest, time.time() - self._started_at)
+
+    def _on_finished(self):
+        with self._lock:
+            if not self._produced:
+                print(f'[build] 编译失败, 保留上次的 {self.output.name}', file=sys.stderr)
+        self._finished.set()
+
+    def watch(self, wait: bool = True, timeout: Optional[float] = None) -> Path:
+        # wait为True且已有产物不是最新时, 阻塞到首次编译结束, 保证随后加载的是新产物
+        if self._compiler is not None:
+            return self.output
+        fresh = self.is_fresh()
+        compiler = frida.Compiler()
+        compiler.on('starting', self._on_starting)
+        compiler.on('output', self._on_output)
+        compiler.on('finished', self._on_finished)
+        compiler.on('diagnostics', self._on_diagnostics)
+        self._finished.clear()
+        compiler.watch(str(self.entrypoint), **self._options())
+        self._compiler = compiler
+        if wait and not fresh:
+            self._finished.wait(timeout)
+            if not self.output.is_file():
+                raise FileNotFoundError(f'[build] 编译未生成 {self.output}')
+        return self.output
+
+
+def build_agent(output: Union[str, Path], conf: Build) -> Optional[AgentBuilder]:
+    if not conf.enable:
+        return None
+    builder = AgentBuilder(output, conf)
+    if conf.watch:
+        builder.watch()
+    else:
+        builder.build()
+    return builder
@@ -1,6 +1,6 @@
 from enum import Enum
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, model_validator
+from typing import Optional, List, Literal
 from ruamel.yaml import YAML
 import codecs
 
@@ -43,15 +43,140 @@ class Server(BaseModel):
 
 
 
+class Reattach(BaseModel):
+    enable: bool = False
+    # 轮询目标进程的间隔(秒)
+    interval: float = 1.0
+    # 超过该时长(秒)仍未找回目标则放弃, None为一直等待
+    timeout: Optional[float] = None
+
+
+class FlowControl(BaseModel):
+    enable: bool = False
+    # 下发流控参数的周期(秒)
+    interval: float = 0.5
+    # 单条消息处理耗时预算(秒), 超出即视为高负载
+    latency_budget: float = 0.002
+    min_batch_size: int = 16
+    max_batch_size: int = 4096
+    batch_bytes: int = 1 << 20
+    # 批次滞留时间范围(ms)
+    min_age: int = 50
+    max_age: int = 2000
+    # 缓冲区有积压时每周期放行的最大批次数
+    window: int = 32
+
+
+class SendRule(BaseModel):
+    type: Optional[str] = None
+    source: Optional[str] = None
+    tag: Optional[str] = None
+    action: Literal['keep', 'drop', 'sample', 'rate_limit'] = 'keep'
+    # sample: 每n条放行1条
+    n: Optional[int] = None
+    # rate_limit: 每秒放行条数, burst为突发容量(默认等于rate)
+    rate: Optional[float] = None
+    burst: Optional[float] = None
+
+    @model_validator(mode='after')
+    def check(self) -> 'SendRule':
+        if self.type is not None:
+            from agent.rpc.message import RPCMsgType
+            types = [v.value for v in RPCMsgType]
+            if self.type not in types:
+                raise ValueError(f'type[{self.type}] 不是有效的RPCMsgType: {types}')
+        if self.action == 'sample' and (self.n is None or self.n < 1):
+            raise ValueError(f'sample规则需要指定 n >= 1')
+        if self.action == 'rate_limit' and (self.rate is None or self.rate <= 0):
+            raise ValueError(f'rate_limit规则需要指定 rate > 0')
+        if self.burst is not None and self.burst < 1:
+            raise ValueError(f'burst[{self.burst}] 不能小于1')
+        return self
+
+
+class Store(BaseModel):
+    # fixed: 按固定大小分块(默认页大小, 便于按页diff); cdc: 按内容定义切分, chunk_size为平均块大小
+    chunking: Literal['fixed', 'cdc'] = 'fixed'
+    chunk_size: int = 0x1000
+
+
+class Pipeline(BaseModel):
+    # SAVE_FILE落盘后按source执行的后处理阶段, 见 agent/pipeline.py
+    enable: bool = False
+    # 进程池大小, 默认为CPU核数
+    workers: Optional[int] = None
+    # 同时调度的文件数
+    max_jobs: int = 2
+    # 积压上限, 超过后丢弃新任务
+    max_pending: int = 64
+
+
+class TimeSeries(BaseModel):
+    # 把收到的消息按类型写入列式存储, 见 agent/timeseries.py
+    enable: bool = False
+    # 为空时记录全部类型
+    types: List[str] = []
+    exclude: List[str] = ['SCOPE_CALL', 'SCOPE_EVAL', 'SCOPE_GET', 'ENUMERATE_OBJ_PROPS', 'SNAPSHOT_CHUNK']
+    # 每块行数, 满后落盘
+    block_rows: int = 8192
+    # 未满的块最长滞留时间(秒)
+    flush_interval: float = 5.0
+
+
+class LogCollapse(BaseModel):
+    enable: bool = False
+    # 跟踪最近的不同日志行数, 为1时只折叠连续重复
+    window: int = 32
+    # 比较前把指针/数字归一化
+    normalize: bool = False
+    # 重复计数最长滞留时间(秒)
+    flush_interval: float = 1.0
+
+
+class Build(BaseModel):
+    # 用frida编译器在进程内打包jsfile, 代替 npm run build/watch
+    enable: bool = False
+    entrypoint: str = 'index.ts'
+    # 默认为entrypoint所在目录, 需包含node_modules
+    project_root: Optional[str] = None
+    # 文件变化后增量重编
+    watch: bool = True
+    source_maps: Literal['included', 'omitted'] = 'included'
+    compression: Literal['none', 'terser'] = 'none'
+
+
 class Agent(BaseModel):
     datadir: Optional[str] = None
     stdout: Optional[str] = None
     stderr: Optional[str] = None
-
+    log_collapse: LogCollapse = LogCollapse()
+    build: Build = Build()
+    reattach: Reattach = Reattach()
+    store: Store = Store()
+    pipeline: Pipeline = Pipeline()
+    timeseries: TimeSeries = TimeSeries()
+    flow_control: FlowControl = FlowControl()
+    # 按顺序匹配, 首条命中的规则生效
+    send_rules: List[SendRule] = []
+    # 主机侧符号化时查找ELF文件的目录(如从设备pull下来的系统库)
+    symbol_dirs: List[str] = []
+    # 按build-id缓存模块符号表, agent加载ElfModuleX时由主机下发, 未命中才在设备上解析
+    symbol_cache: bool = False
+
+
+
+class SslPcapng(BaseModel):
+    # 输出的pcapng文件, TLS密钥以DSB写入, Wireshark打开即可解密
+    output: str
+    # 要合并的抓包文件或命名管道(pcap/pcapng), 如 tcpdump -w 的输出
+    capture: Optional[str] = None
+    # 读到抓包文件末尾后继续等待新数据
+    follow: bool = True
 
 
 class ScriptNetTools(BaseModel):
     ssl_log_secret: Optional[str] = None
+    ssl_pcapng: Optional[SslPcapng] = None
     
 
 class Script(BaseModel):
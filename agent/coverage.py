@@ -0,0 +1,255 @@
+from typing import Final, Optional, List, Dict, Tuple, Union
+from agent.procmaps import ProcMaps, PROC_MAPS
+from agent.config import Config
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import hashlib
+import atexit
+import time
+import os
+
+
+# 覆盖率按粒度记录, 2字节可兼容thumb指令
+DEFAULT_GRANULARITY: Final[int] = 2
+
+_DRCOV_BB: Final[np.dtype] = np.dtype([('start', '<u4'), ('size', '<u2'), ('mod_id', '<u2')])
+
+
+class ModuleCoverage:
+    path: Final[str]
+    granularity: Final[int]
+    size: int
+    # 每bit对应一个粒度单元, 只与模块大小有关, 长时间trace不会增长
+    bitmap: np.ndarray
+
+    def __init__(self, path: str, size: int, granularity: int = DEFAULT_GRANULARITY, bitmap: Optional[np.ndarray] = None):
+        self.path = path
+        self.granularity = granularity
+        self.size = 0
+        self.bitmap = np.zeros(0, dtype=np.uint8)
+        self.grow(size)
+        if bitmap is not None:
+            self.merge_bitmap(bitmap)
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit('/', 1)[-1]
+
+    @property
+    def units(self) -> int:
+        return -(-self.size // self.granularity)
+
+    def __repr__(self):
+        return f'<ModuleCoverage {self.name} {self.covered()}/{self.size} bytes>'
+
+    def grow(self, size: int):
+        if size <= self.size:
+            return
+        self.size = size
+        need = -(-self.units // 8)
+        if need > len(self.bitmap):
+            bitmap = np.zeros(need, dtype=np.uint8)
+            bitmap[:len(self.bitmap)] = self.bitmap
+            self.bitmap = bitmap
+
+    def merge_bitmap(self, bitmap: np.ndarray):
+        if len(bitmap) > len(self.bitmap):
+            self.grow(len(bitmap) * 8 * self.granularity)
+        self.bitmap[:len(bitmap)] |= bitmap
+
+    def mark(self, offsets: np.ndarray, sizes: np.ndarray):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        ends = np.minimum(offsets + np.asarray(sizes, dtype=np.int64), self.size)
+        first = offsets // self.granularity
+        last = -(-ends // self.granularity)
+        lengths = np.maximum(last - first, 0)
+        total = int(lengths.sum())
+        if not total:
+            return
+        # 把每个块展开成它覆盖的单元下标
+        starts = np.repeat(first - (np.cumsum(lengths) - lengths), lengths)
+        units = starts + np.arange(total, dtype=np.int64)
+        np.bitwise_or.at(self.bitmap, units >> 3, (1 << (units & 7)).astype(np.uint8))
+
+    def covered(self) -> int:
+        return int(np.unpackbits(self.bitmap, bitorder='little').sum()) * self.granularity
+
+    def blocks(self, max_size: int = 0xffff) -> Tuple[np.ndarray, np.ndarray]:
+        # 把连续覆盖的单元还原成块(偏移, 大小), 供drcov导出
+        bits = np.unpackbits(self.bitmap, bitorder='little')[:self.units].astype(np.int8)
+        edges = np.diff(np.concatenate(([0], bits, [0])))
+        starts = np.flatnonzero(edges == 1) * self.granularity
+        ends = np.minimum(np.flatnonzero(edges == -1) * self.granularity, self.size)
+        if not len(starts):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # drcov块大小为u16, 超长的区间拆开
+        counts = -(-(ends - starts) // max_size)
+        offsets = np.repeat(starts, counts) + (
+            np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        ) * max_size
+        sizes = np.minimum(np.repeat(ends, counts) - offsets, max_size)
+        return offsets, sizes
+
+
+class CoverageMap:
+    maps: Final[ProcMaps]
+    root: Optional[Path]
+    granularity: Final[int]
+    modules: Dict[str, ModuleCoverage]
+    # 无法归属到模块的块数(如匿名映射中的jit代码)
+    unmapped: int
+    save_interval: float
+
+    _dirty: bool
+    _last_save: float
+    _lock: Lock
+
+    def __init__(
+        self, maps: ProcMaps = PROC_MAPS, root: Optional[Union[str, Path]] = None,
+        granularity: int = DEFAULT_GRANULARITY, save_interval: float = 10,
+    ):
+        self.maps = maps
+        self.root = Path(root) if root is not None else None
+        self.granularity = granularity
+        self.modules = {}
+        self.unmapped = 0
+        self.save_interval = save_interval
+        self._dirty = False
+        self._last_save = time.time()
+        self._lock = Lock()
+        if self.root is not None:
+            self.load(self.root)
+
+    def __repr__(self):
+        return f'<CoverageMap modules={len(self.modules)} unmapped={self.unmapped}>'
+
+    def _module(self, path: str, size: int) -> ModuleCoverage:
+        cov = self.modules.get(path)
+        if cov is None:
+            cov = self.modules[path] = ModuleCoverage(path, size, self.granularity)
+        else:
+            cov.grow(size)
+        return cov
+
+    def add_blocks(self, starts: np.ndarray, sizes: np.ndarray):
+        module_ids, offsets = self.maps.resolve(starts)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        with self._lock:
+            self.unmapped += int((module_ids < 0).sum())
+            for mid in np.unique(module_ids[module_ids >= 0]).tolist():
+                mod = self.maps.modules[mid]
+                sel = module_ids == mid
+                self._module(mod.path, mod.size).mark(offsets[sel].astype(np.int64), sizes[sel])
+            self._dirty = True
+        if self.root is not None and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def merge(self, other: 'CoverageMap'):
+        with self._lock:
+            for path, cov in other.modules.items():
+                self._module(path, cov.size).merge_bitmap(cov.bitmap)
+            self.unmapped += other.unmapped
+            self._dirty = True
+
+    def summary(self) -> List[Tuple[str, int, int]]:
+        return [(cov.name, cov.covered(), cov.size) for cov in self.modules.values()]
+
+    @staticmethod
+    def _file_name(path: str) -> str:
+        return f'{path.rsplit("/", 1)[-1]}.{hashlib.md5(path.encode()).hexdigest()[:8]}.npz'
+
+    def save(self, root: Optional[Union[str, Path]] = None):
+        root = Path(root) if root is not None else self.root
+        if root is None:
+            return
+        root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            items = [(path, cov.size, cov.granularity, cov.bitmap.copy()) for path, cov in self.modules.items()]
+            self._dirty = False
+            self._last_save = time.time()
+        for path, size, granularity, bitmap in items:
+            fp = root / self._file_name(path)
+            tmp = fp.with_name(f'{fp.stem}.{os.getpid()}.tmp.npz')
+            np.savez(tmp, path=np.array(path), size=np.array(size), granularity=np.array(granularity), bitmap=bitmap)
+            os.replace(tmp, fp)
+        self.export_drcov(root / 'coverage.drcov')
+
+    def load(self, root: Union[str, Path]):
+        # 合并之前运行保存的覆盖率
+        for fp in sorted(Path(root).glob('*.npz')):
+            try:
+                with np.load(fp) as f:
+                    path, size, granularity = str(f['path']), int(f['size']), int(f['granularity'])
+                    bitmap = f['bitmap']
+            except (OSError, ValueError, KeyError):
+                continue
+            if granularity != self.granularity:
+                continue
+            with self._lock:
+                self._module(path, size).merge_bitmap(bitmap)
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    def export_drcov(self, dst: Union[str, Path]):
+        # drcov v2, lighthouse/bncov等可直接加载
+        with self._lock:
+            items = list(self.modules.values())
+            blocks = [cov.blocks() for cov in items]
+        lines = [
+            'DRCOV VERSION: 2',
+            'DRCOV FLAVOR: frida-analykit',
+            f'Module Table: version 2, count {len(items)}',
+            'Columns: id, base, end, entry, checksum, timestamp, path',
+        ]
+        for i, cov in enumerate(items):
+            mod = self.maps.find_module_by_name(cov.path)
+            base = mod.base if mod is not None else 0
+            lines.append(f'{i:3d}, {base:#018x}, {base + cov.size:#018x}, {0:#018x}, {0:#010x}, {0:#010x}, {cov.path}')
+        count = sum(len(v[0]) for v in blocks)
+        lines.append(f'BB Table: {count} bbs')
+
+        table = np.empty(count, dtype=_DRCOV_BB)
+        inc = 0
+        for i, (offsets, sizes) in enumerate(blocks):
+            n = len(offsets)
+            table['start'][inc: inc + n] = offsets
+            table['size'][inc: inc + n] = sizes
+            table['mod_id'][inc: inc + n] = i
+            inc += n
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with open(dst, 'wb') as f:
+            f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            f.write(table.tobytes())
+
+
+def read_drcov(path: Union[str, Path]) -> Tuple[List[str], np.ndarray]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    head, sep, rest = data.partition(b'BB Table: ')
+    count_line, _, table = rest.partition(b'\n')
+    count = int(count_line.split()[0])
+    modules = []
+    for line in head.decode('utf-8').splitlines():
+        parts = [v.strip() for v in line.split(',')]
+        if len(parts) >= 7 and parts[0].isdigit():
+            modules.append(parts[6])
+    return modules, np.frombuffer(table, dtype=_DRCOV_BB, count=count)
+
+
+_COVERAGE: Optional[CoverageMap] = None
+_COVERAGE_LOCK: Final[Lock] = Lock()
+
+
+def get_coverage() -> CoverageMap:
+    global _COVERAGE
+    if _COVERAGE is None:
+        with _COVERAGE_LOCK:
+            if _COVERAGE is None:
+                datadir = Config.get().agent.datadir
+                _COVERAGE = CoverageMap(root=Path(datadir) / 'coverage' if datadir else None)
+                atexit.register(_COVERAGE.flush)
+    return _COVERAGE
@@ -0,0 +1,148 @@
+from typing import Final, Optional, Dict, Union
+from agent.elf.module import ElfImage
+from agent.elf.symbols import SymbolTable
+from agent.config import Config
+from collections import OrderedDict
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import os
+
+
+class ElfInfo:
+    # ElfImage 的分析结果, 与底层缓冲区无关, 可按build-id持久化
+    build_id: Final[str]
+    ei_class: Final[int]
+    machine: Final[int]
+    symbols: Final[SymbolTable]
+    imports: Final[Dict[str, int]]
+    # 合并后的 rela/plt_rela: r_offset(模块内偏移), r_type, r_sym, r_addend
+    relocs: Final[np.ndarray]
+
+    RELOC_DTYPE: Final[np.dtype] = np.dtype([
+        ('r_offset', '<u8'), ('r_type', '<u4'), ('r_sym', '<u4'), ('r_addend', '<i8'),
+    ])
+
+    def __init__(
+        self, build_id: str, ei_class: int, machine: int,
+        symbols: SymbolTable, imports: Dict[str, int], relocs: np.ndarray,
+    ):
+        self.build_id = build_id
+        self.ei_class = ei_class
+        self.machine = machine
+        self.symbols = symbols
+        self.imports = imports
+        self.relocs = relocs
+
+    def __repr__(self):
+        return f'<ElfInfo {self.build_id} symbols={len(self.symbols)} imports={len(self.imports)} relocs={len(self.relocs)}>'
+
+    @classmethod
+    def from_image(cls, image: ElfImage) -> 'ElfInfo':
+        parts = []
+        for relas in (image.rela, image.plt_rela):
+            syms, types = image.rela_info(relas)
+            part = np.empty(len(relas), dtype=cls.RELOC_DTYPE)
+            part['r_offset'] = relas['r_offset'].astype(np.int64) - image.min_vaddr
+            part['r_type'] = types
+            part['r_sym'] = syms
+            part['r_addend'] = relas['r_addend']
+            parts.append(part)
+        return cls(
+            image.build_id, image.ei_class, image.machine,
+            image.symbol_table(), image.imports(), np.concatenate(parts),
+        )
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez(
+            tmp,
+            meta=np.array([self.ei_class, self.machine], dtype=np.int64),
+            sym_values=self.symbols.values,
+            sym_sizes=self.symbols.sizes,
+            sym_names=np.array(self.symbols.names, dtype=str),
+            import_names=np.array(list(self.imports.keys()), dtype=str),
+            import_offsets=np.array(list(self.imports.values()), dtype=np.uint64),
+            relocs=self.relocs,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'ElfInfo':
+        with np.load(path) as f:
+            ei_class, machine = f['meta'].tolist()
+            symbols = SymbolTable.from_arrays(f['sym_values'], f['sym_sizes'], f['sym_names'].tolist())
+            imports = dict(zip(f['import_names'].tolist(), f['import_offsets'].tolist()))
+            relocs = f['relocs']
+        return cls(Path(path).stem, ei_class, machine, symbols, imports, relocs)
+
+
+class ElfCache:
+    root: Final[Optional[Path]]
+    maxsize: Final[int]
+
+    _items: 'OrderedDict[str, ElfInfo]'
+    _lock: Lock
+
+    def __init__(self, root: Optional[Union[str, Path]] = None, maxsize: int = 64):
+        self.root = Path(root) if root else None
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def _path(self, build_id: str) -> Optional[Path]:
+        return self.root / f'{build_id}.npz' if self.root else None
+
+    def get(self, build_id: str) -> Optional[ElfInfo]:
+        with self._lock:
+            info = self._items.get(build_id)
+            if info is not None:
+                self._items.move_to_end(build_id)
+                return info
+        path = self._path(build_id)
+        if path is None or not path.exists():
+            return None
+        info = ElfInfo.load(path)
+        self._remember(info)
+        return info
+
+    def _remember(self, info: ElfInfo):
+        with self._lock:
+            self._items[info.build_id] = info
+            self._items.move_to_end(info.build_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def analyze(self, image: ElfImage) -> ElfInfo:
+        info = self.get(image.build_id)
+        if info is not None:
+            return info
+        info = ElfInfo.from_image(image)
+        self._remember(info)
+        path = self._path(info.build_id)
+        if path is not None:
+            info.save(path)
+        return info
+
+    def analyze_file(self, path: Union[str, Path], is_image: bool = False, base: int = 0) -> ElfInfo:
+        with ElfImage.open(path, is_image, base) as image:
+            return self.analyze(image)
+
+    def analyze_bytes(self, data: bytes, is_image: bool = False, base: int = 0) -> ElfInfo:
+        return self.analyze(ElfImage(data, is_image, base))
+
+
+_ELF_CACHE: Optional[ElfCache] = None
+_ELF_CACHE_LOCK: Final[Lock] = Lock()
+
+
+def get_elf_cache() -> ElfCache:
+    global _ELF_CACHE
+    if _ELF_CACHE is None:
+        with _ELF_CACHE_LOCK:
+            if _ELF_CACHE is None:
+                datadir = Config.get().agent.datadir
+                _ELF_CACHE = ElfCache(Path(datadir) / 'elf' if datadir else None)
+    return _ELF_CACHE
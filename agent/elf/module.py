@@ -0,0 +1,419 @@
+from typing import Final, Optional, List, Tuple, Dict, Union
+from agent.elf.struct import (
+    ELF_MAGIC, ELFCLASS64, EHDR, PHDR, SHDR, DYN, SYM, RELA, RELA_INFO_SYM, RELA_INFO_TYPE,
+    PhdrType, ShdrType, DyntabTag,
+    STT_FUNC, STT_OBJECT, SHN_UNDEF, SHN_ABS, NT_GNU_BUILD_ID, SHF_ALLOC, SHF_WRITE,
+)
+from agent.elf.symbols import SymbolTable
+from pathlib import Path
+import numpy as np
+import hashlib
+import mmap
+
+
+class ElfImage:
+    # 离线解析 ElfModuleX.dump 得到的内存映像(is_image=True, 按vaddr排布)或磁盘上的ELF文件.
+    # 结构体通过numpy结构化dtype直接映射到底层缓冲区上, 不做拷贝.
+    is_image: Final[bool]
+    # dump时模块的运行时基址, 用于还原被linker改写为绝对地址的dynamic项
+    base: Final[int]
+    ei_class: Final[int]
+    ehdr: np.void
+    phdrs: np.ndarray
+    shdrs: Optional[np.ndarray]
+    dynamic: Dict[int, int]
+    needed: List[int]
+    min_vaddr: int
+
+    _buf: Union[bytes, memoryview, mmap.mmap]
+    _mm: Optional[mmap.mmap]
+    _file: Optional['ElfImage']
+    _build_id: Optional[str]
+
+    def __init__(self, data: Union[bytes, memoryview, mmap.mmap], is_image: bool = False, base: int = 0):
+        if bytes(data[:4]) != ELF_MAGIC:
+            raise ValueError('not an elf')
+        self.is_image = is_image
+        self.base = base
+        self._buf = data
+        self._mm = None
+        self._file = None
+        self._build_id = None
+        self.ei_class = data[4]
+        self.ehdr = self.view(EHDR[self.ei_class], 0, 1)[0].copy()
+        self.phdrs = self.view(PHDR[self.ei_class], int(self.ehdr['e_phoff']), int(self.ehdr['e_phnum'])).copy()
+        loads = self.phdrs[self.phdrs['p_type'] == PhdrType.PT_LOAD]
+        self.min_vaddr = int(loads['p_vaddr'].min()) & ~0xfff if len(loads) else 0
+        self.dynamic, self.needed = self._read_dynamic()
+        self.shdrs = None if is_image else self._read_shdrs()
+
+    @classmethod
+    def open(cls, path: Union[str, Path], is_image: bool = False, base: int = 0) -> 'ElfImage':
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        image = cls(mm, is_image, base)
+        image._mm = mm
+        return image
+
+    def close(self):
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # 仍有numpy视图引用映射, 交给gc回收
+                pass
+            self._mm = None
+
+    def __enter__(self) -> 'ElfImage':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __repr__(self):
+        return f'<ElfImage class={self.ei_class} image={self.is_image} size={hex(len(self))}>'
+
+    @property
+    def is64(self) -> bool:
+        return self.ei_class == ELFCLASS64
+
+    @property
+    def machine(self) -> int:
+        return int(self.ehdr['e_machine'])
+
+    def view(self, dtype: np.dtype, offset: int, count: int) -> np.ndarray:
+        if offset < 0 or count <= 0 or offset >= len(self._buf):
+            return np.empty(0, dtype=dtype)
+        count = min(count, (len(self._buf) - offset) // dtype.itemsize)
+        return np.frombuffer(self._buf, dtype=dtype, count=count, offset=offset)
+
+    def cstr(self, offset: int, limit: int = 4096) -> str:
+        chunk = bytes(self._buf[offset: offset + limit])
+        end = chunk.find(b'\0')
+        return chunk[:end if end >= 0 else limit].decode('utf-8', errors='replace')
+
+    def _ptr(self, value: int) -> int:
+        # 部分linker(如glibc)会把dynamic中的指针改写为运行时绝对地址
+        if self.is_image and self.base and value >= self.base:
+            return value - self.base + self.min_vaddr
+        return value
+
+    def vaddr_to_offset(self, vaddr: int) -> Optional[int]:
+        if self.is_image:
+            off = vaddr - self.min_vaddr
+            return off if 0 <= off < len(self._buf) else None
+        for ph in self.phdrs:
+            if ph['p_type'] != PhdrType.PT_LOAD:
+                continue
+            p_vaddr, p_filesz = int(ph['p_vaddr']), int(ph['p_filesz'])
+            if p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + int(ph['p_offset'])
+        return None
+
+    def offset_to_vaddr(self, offset: int) -> Optional[int]:
+        # 同 ElfModuleX.off2addr
+        dst = None
+        for ph in self.phdrs:
+            if ph['p_type'] != PhdrType.PT_LOAD:
+                continue
+            p_offset, p_filesz = int(ph['p_offset']), int(ph['p_filesz'])
+            file_page_start = p_offset & ~0xfff
+            if dst is None or p_offset + p_filesz >= int(dst['p_offset']) + int(dst['p_filesz']):
+                dst = ph
+            if file_page_start <= offset < p_offset + p_filesz:
+                dst = ph
+                break
+        if dst is None:
+            return None
+        return (int(dst['p_vaddr']) & ~0xfff) - (int(dst['p_offset']) & ~0xfff) + offset
+
+    def _read_dynamic(self) -> Tuple[Dict[int, int], List[int]]:
+        dyn_phdrs = self.phdrs[self.phdrs['p_type'] == PhdrType.PT_DYNAMIC]
+        if not len(dyn_phdrs):
+            return {}, []
+        ph = dyn_phdrs[-1]
+        off = self.vaddr_to_offset(int(ph['p_vaddr'])) if self.is_image else int(ph['p_offset'])
+        if off is None:
+            return {}, []
+        dtype = DYN[self.ei_class]
+        dyns = self.view(dtype, off, int(ph['p_filesz']) // dtype.itemsize)
+        tags: Dict[int, int] = {}
+        needed: List[int] = []
+        for d_tag, d_un in zip(dyns['d_tag'].tolist(), dyns['d_un'].tolist()):
+            if d_tag == DyntabTag.DT_NULL:
+                break
+            if d_tag == DyntabTag.DT_NEEDED:
+                needed.append(d_un)
+            else:
+                tags.setdefault(d_tag, d_un)
+        return tags, needed
+
+    def _dyn_offset(self, tag: int) -> Optional[int]:
+        value = self.dynamic.get(tag)
+        if value is None:
+            return None
+        return self.vaddr_to_offset(self._ptr(value))
+
+    def _read_shdrs(self) -> Optional[np.ndarray]:
+        e_shoff, e_shnum = int(self.ehdr['e_shoff']), int(self.ehdr['e_shnum'])
+        dtype = SHDR[self.ei_class]
+        if not e_shoff or e_shoff + e_shnum * dtype.itemsize > len(self._buf):
+            return None
+        return self.view(dtype, e_shoff, e_shnum)
+
+    def section_name(self, shdr: np.void) -> str:
+        owner = self._file if self._file is not None else self
+        shdrs = owner.shdrs
+        shstr = shdrs[int(owner.ehdr['e_shstrndx'])]
+        return owner.cstr(int(shstr['sh_offset']) + int(shdr['sh_name']))
+
+    def sections(self) -> Dict[str, np.void]:
+        if self.shdrs is None:
+            return {}
+        return {self.section_name(v): v for v in self.shdrs}
+
+    def fix_shdrs(self, file: 'ElfImage') -> bool:
+        # 同 ElfFileFixer: 内存映像中通常没有节头, 从磁盘上的原文件补全
+        if file.shdrs is None or file.ei_class != self.ei_class:
+            return False
+        self._file = file
+        self.shdrs = file.shdrs
+        return True
+
+    @property
+    def build_id(self) -> str:
+        if self._build_id is None:
+            self._build_id = self._read_build_id() or hashlib.blake2b(self._buf, digest_size=20).hexdigest()
+        return self._build_id
+
+    def _read_build_id(self) -> Optional[str]:
+        for ph in self.phdrs[self.phdrs['p_type'] == PhdrType.PT_NOTE]:
+            off = self.vaddr_to_offset(int(ph['p_vaddr'])) if self.is_image else int(ph['p_offset'])
+            if off is None:
+                continue
+            end = min(off + int(ph['p_filesz']), len(self._buf))
+            while off + 12 <= end:
+                namesz, descsz, n_type = np.frombuffer(self._buf, dtype='<u4', count=3, offset=off).tolist()
+                name_off = off + 12
+                desc_off = name_off + ((namesz + 3) & ~3)
+                if n_type == NT_GNU_BUILD_ID and bytes(self._buf[name_off: name_off + namesz]).rstrip(b'\0') == b'GNU':
+                    return bytes(self._buf[desc_off: desc_off + descsz]).hex()
+                off = desc_off + ((descsz + 3) & ~3)
+        return None
+
+    def _dynsym_count(self) -> int:
+        sym_size = SYM[self.ei_class].itemsize
+        if self.shdrs is not None:
+            for v in self.shdrs:
+                if v['sh_type'] == ShdrType.SHT_DYNSYM:
+                    return int(v['sh_size']) // sym_size
+        hash_off = self._dyn_offset(DyntabTag.DT_HASH)
+        if hash_off is not None:
+            return int(np.frombuffer(self._buf, dtype='<u4', count=2, offset=hash_off)[1])
+        gnu_hash_off = self._dyn_offset(DyntabTag.DT_GNU_HASH)
+        if gnu_hash_off is not None:
+            nbuckets, symoffset, bloom_size, _ = np.frombuffer(self._buf, dtype='<u4', count=4, offset=gnu_hash_off).tolist()
+            buckets_off = gnu_hash_off + 16 + bloom_size * (8 if self.is64 else 4)
+            buckets = np.frombuffer(self._buf, dtype='<u4', count=nbuckets, offset=buckets_off)
+            last = int(buckets.max()) if nbuckets else 0
+            if last < symoffset:
+                return symoffset
+            # 从最大的bucket起沿chain走到末尾(最低位为1)即为符号总数
+            chain_off = buckets_off + nbuckets * 4 + (last - symoffset) * 4
+            chains = self.view(np.dtype('<u4'), chain_off, (len(self._buf) - chain_off) // 4)
+            ends = np.flatnonzero(chains & 1)
+            return last + (int(ends[0]) + 1 if len(ends) else 0)
+        symtab, strtab = self.dynamic.get(DyntabTag.DT_SYMTAB), self.dynamic.get(DyntabTag.DT_STRTAB)
+        if symtab is not None and strtab is not None and strtab > symtab:
+            # 常见布局下 .dynstr 紧跟 .dynsym
+            return (strtab - symtab) // self.dynamic.get(DyntabTag.DT_SYMENT, sym_size)
+        return 0
+
+    @property
+    def dynsym(self) -> np.ndarray:
+        off = self._dyn_offset(DyntabTag.DT_SYMTAB)
+        if off is None:
+            return np.empty(0, dtype=SYM[self.ei_class])
+        return self.view(SYM[self.ei_class], off, self._dynsym_count())
+
+    def dynsym_names(self) -> List[str]:
+        return self._sym_names(self.dynsym, self._dyn_offset(DyntabTag.DT_STRTAB))
+
+    def _symtab_section(self) -> Tuple[Optional[np.ndarray], Optional[int], 'ElfImage']:
+        owner = self._file if self._file is not None else self
+        if owner.shdrs is None:
+            return None, None, owner
+        for v in owner.shdrs:
+            if v['sh_type'] == ShdrType.SHT_SYMTAB:
+                strtab = owner.shdrs[int(v['sh_link'])]
+                dtype = SYM[owner.ei_class]
+                syms = owner.view(dtype, int(v['sh_offset']), int(v['sh_size']) // dtype.itemsize)
+                return syms, int(strtab['sh_offset']), owner
+        return None, None, owner
+
+    @property
+    def symtab(self) -> Optional[np.ndarray]:
+        return self._symtab_section()[0]
+
+    def symtab_names(self) -> List[str]:
+        syms, strtab, owner = self._symtab_section()
+        return owner._sym_names(syms, strtab) if syms is not None else []
+
+    def _sym_names(self, syms: np.ndarray, strtab: Optional[int]) -> List[str]:
+        if strtab is None:
+            return [''] * len(syms)
+        cache: Dict[int, str] = {}
+        names = []
+        for st_name in syms['st_name'].tolist():
+            name = cache.get(st_name)
+            if name is None:
+                name = cache[st_name] = self.cstr(strtab + st_name)
+            names.append(name)
+        return names
+
+    def _rela(self, tag: int, size_tag: int) -> np.ndarray:
+        dtype = RELA[self.ei_class]
+        off = self._dyn_offset(tag)
+        if off is None:
+            return np.empty(0, dtype=dtype)
+        return self.view(dtype, off, self.dynamic.get(size_tag, 0) // dtype.itemsize)
+
+    @property
+    def rela(self) -> np.ndarray:
+        return self._rela(DyntabTag.DT_RELA, DyntabTag.DT_RELASZ)
+
+    @property
+    def plt_rela(self) -> np.ndarray:
+        if self.dynamic.get(DyntabTag.DT_PLTREL, DyntabTag.DT_RELA) != DyntabTag.DT_RELA:
+            return np.empty(0, dtype=RELA[self.ei_class])
+        return self._rela(DyntabTag.DT_JMPREL, DyntabTag.DT_PLTRELSZ)
+
+    def rela_info(self, relas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        info = relas['r_info'].astype(np.uint64)
+        syms = (info >> np.uint64(RELA_INFO_SYM[self.ei_class])).astype(np.int64)
+        types = (info & np.uint64(RELA_INFO_TYPE[self.ei_class])).astype(np.int64)
+        return syms, types
+
+    def imports(self) -> Dict[str, int]:
+        # 同 ElfModuleX.link_image: 符号名 => 重定位槽位(GOT)的模块内偏移
+        names = self.dynsym_names()
+        result: Dict[str, int] = {}
+        for relas in (self.rela, self.plt_rela):
+            syms, types = self.rela_info(relas)
+            for r_offset, sym, type_ in zip(relas['r_offset'].tolist(), syms.tolist(), types.tolist()):
+                if type_ == 0 or sym == 0 or sym >= len(names) or not names[sym]:
+                    continue
+                result.setdefault(names[sym], self._ptr(r_offset) - self.min_vaddr)
+        return result
+
+    def symbol_table(self) -> SymbolTable:
+        symbols: List[Tuple[int, int, str]] = []
+        groups = [(self.dynsym, self.dynsym_names())]
+        symtab = self.symtab
+        if symtab is not None:
+            groups.append((symtab, self.symtab_names()))
+        for syms, names in groups:
+            if not len(syms):
+                continue
+            mask = (
+                (syms['st_shndx'] != SHN_UNDEF) & (syms['st_shndx'] != SHN_ABS) & (syms['st_value'] != 0)
+                & np.isin(syms['st_info'] & 0xf, (STT_FUNC, STT_OBJECT))
+            )
+            values = syms['st_value'].astype(np.int64) - self.min_vaddr
+            sizes = syms['st_size'].astype(np.int64)
+            for i in np.flatnonzero(mask).tolist():
+                symbols.append((int(values[i]), int(sizes[i]), names[i]))
+        return SymbolTable(symbols)
+
+    def rebuild_shdrs(self) -> Tuple[np.ndarray, bytes]:
+        # 根据dynamic信息重建最小节头表(.dynsym/.dynstr/.rela.*/.dynamic/...), 用于修复dump出的so
+        dtype = SHDR[self.ei_class]
+        sym_size = SYM[self.ei_class].itemsize
+        rela_size = RELA[self.ei_class].itemsize
+        word = 8 if self.is64 else 4
+        entries: List[Tuple[str, int, int, int, int, int, int]] = [('', ShdrType.SHT_NULL, 0, 0, 0, 0, 0)]
+
+        def add(name: str, sh_type: int, tag: int, size: int, flags: int = SHF_ALLOC, entsize: int = 0, align: int = word):
+            value = self.dynamic.get(tag)
+            if value is None or not size:
+                return
+            entries.append((name, sh_type, flags, self._ptr(value), size, entsize, align))
+
+        add('.dynsym', ShdrType.SHT_DYNSYM, DyntabTag.DT_SYMTAB, self._dynsym_count() * sym_size, entsize=sym_size)
+        add('.dynstr', ShdrType.SHT_STRTAB, DyntabTag.DT_STRTAB, self.dynamic.get(DyntabTag.DT_STRSZ, 0), align=1)
+        add('.rela.dyn', ShdrType.SHT_RELA, DyntabTag.DT_RELA, self.dynamic.get(DyntabTag.DT_RELASZ, 0), entsize=rela_size)
+        add('.rela.plt', ShdrType.SHT_RELA, DyntabTag.DT_JMPREL, self.dynamic.get(DyntabTag.DT_PLTRELSZ, 0), entsize=rela_size)
+        add('.init_array', ShdrType.SHT_INIT_ARRAY, DyntabTag.DT_INIT_ARRAY, self.dynamic.get(DyntabTag.DT_INIT_ARRAYSZ, 0), SHF_ALLOC | SHF_WRITE)
+        add('.fini_array', ShdrType.SHT_FINI_ARRAY, DyntabTag.DT_FINI_ARRAY, self.dynamic.get(DyntabTag.DT_FINI_ARRAYSZ, 0), SHF_ALLOC | SHF_WRITE)
+        for ph in self.phdrs[self.phdrs['p_type'] == PhdrType.PT_DYNAMIC]:
+            entries.append(('.dynamic', ShdrType.SHT_DYNAMIC, SHF_ALLOC | SHF_WRITE, int(ph['p_vaddr']), int(ph['p_filesz']), DYN[self.ei_class].itemsize, word))
+
+        names = [v[0] for v in entries] + ['.shstrtab']
+        shstrtab = b'\0'
+        name_offs = {}
+        for name in names:
+            if name and name not in name_offs:
+                name_offs[name] = len(shstrtab)
+                shstrtab += name.encode() + b'\0'
+
+        shdrs = np.zeros(len(entries) + 1, dtype=dtype)
+        link_dynstr = next((i for i, v in enumerate(entries) if v[0] == '.dynstr'), 0)
+        link_dynsym = next((i for i, v in enumerate(entries) if v[0] == '.dynsym'), 0)
+        for i, (name, sh_type, flags, addr, size, entsize, align) in enumerate(entries):
+            shdrs[i] = (
+                name_offs.get(name, 0), sh_type, flags, addr,
+                addr - self.min_vaddr if self.is_image else (self.vaddr_to_offset(addr) or 0),
+                size, 0, 0, align, entsize,
+            )
+            if sh_type in (ShdrType.SHT_DYNSYM, ShdrType.SHT_DYNAMIC):
+                shdrs[i]['sh_link'] = link_dynstr
+                if sh_type == ShdrType.SHT_DYNSYM:
+                    shdrs[i]['sh_info'] = 1
+            elif sh_type == ShdrType.SHT_RELA:
+                shdrs[i]['sh_link'] = link_dynsym
+        shdrs[-1]['sh_name'] = name_offs['.shstrtab']
+        shdrs[-1]['sh_type'] = ShdrType.SHT_STRTAB
+        shdrs[-1]['sh_size'] = len(shstrtab)
+        shdrs[-1]['sh_addralign'] = 1
+        return shdrs, shstrtab
+
+    def write_fixed(self, dst: Union[str, Path]) -> Path:
+        # 把内存映像修复为可被静态分析工具加载的文件: 段的文件偏移对齐到vaddr, 追加重建的节头
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        out = bytearray(self._buf)
+        shdrs, shstrtab = self.rebuild_shdrs()
+        if self.is_image:
+            phdrs = np.frombuffer(out, dtype=PHDR[self.ei_class], count=len(self.phdrs), offset=int(self.ehdr['e_phoff']))
+            phdrs['p_offset'] = phdrs['p_vaddr'] - self.min_vaddr
+            loads = phdrs['p_type'] == PhdrType.PT_LOAD
+            phdrs['p_filesz'][loads] = phdrs['p_memsz'][loads]
+            dyn = phdrs[phdrs['p_type'] == PhdrType.PT_DYNAMIC]
+            if self.base and len(dyn):
+                # 还原被linker重定位过的dynamic指针
+                dtype = DYN[self.ei_class]
+                off = int(dyn[-1]['p_vaddr']) - self.min_vaddr
+                dyns = np.frombuffer(out, dtype=dtype, count=int(dyn[-1]['p_filesz']) // dtype.itemsize, offset=off)
+                relocated = (dyns['d_un'] >= self.base) & (dyns['d_un'] < self.base + len(out))
+                dyns['d_un'][relocated] -= np.asarray(self.base - self.min_vaddr, dtype=dyns['d_un'].dtype)
+                del dyns
+            del phdrs, dyn
+
+        shstrtab_off = len(out)
+        out += shstrtab
+        out += b'\0' * (-len(out) % 8)
+        shoff = len(out)
+        shdrs[-1]['sh_offset'] = shstrtab_off
+        out += shdrs.tobytes()
+
+        ehdr = np.frombuffer(out, dtype=EHDR[self.ei_class], count=1, offset=0)
+        ehdr['e_shoff'] = shoff
+        ehdr['e_shentsize'] = shdrs.dtype.itemsize
+        ehdr['e_shnum'] = len(shdrs)
+        ehdr['e_shstrndx'] = len(shdrs) - 1
+        del ehdr
+        dst.write_bytes(out)
+        return dst
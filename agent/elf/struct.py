@@ -0,0 +1,144 @@
+from typing import Final, Dict
+from enum import IntEnum
+import numpy as np
+
+
+ELF_MAGIC: Final[bytes] = b'\x7fELF'
+
+ELFCLASS32: Final[int] = 1
+ELFCLASS64: Final[int] = 2
+
+
+class PhdrType(IntEnum):
+    PT_NULL = 0
+    PT_LOAD = 1
+    PT_DYNAMIC = 2
+    PT_INTERP = 3
+    PT_NOTE = 4
+    PT_PHDR = 6
+    PT_GNU_EH_FRAME = 0x6474e550
+    PT_GNU_RELRO = 0x6474e552
+
+
+class ShdrType(IntEnum):
+    SHT_NULL = 0
+    SHT_PROGBITS = 1
+    SHT_SYMTAB = 2
+    SHT_STRTAB = 3
+    SHT_RELA = 4
+    SHT_HASH = 5
+    SHT_DYNAMIC = 6
+    SHT_NOTE = 7
+    SHT_NOBITS = 8
+    SHT_REL = 9
+    SHT_DYNSYM = 11
+    SHT_INIT_ARRAY = 14
+    SHT_FINI_ARRAY = 15
+    SHT_GNU_HASH = 0x6ffffff6
+
+
+class DyntabTag(IntEnum):
+    DT_NULL = 0
+    DT_NEEDED = 1
+    DT_PLTRELSZ = 2
+    DT_PLTGOT = 3
+    DT_HASH = 4
+    DT_STRTAB = 5
+    DT_SYMTAB = 6
+    DT_RELA = 7
+    DT_RELASZ = 8
+    DT_RELAENT = 9
+    DT_STRSZ = 10
+    DT_SYMENT = 11
+    DT_INIT = 12
+    DT_FINI = 13
+    DT_SONAME = 14
+    DT_REL = 17
+    DT_RELSZ = 18
+    DT_PLTREL = 20
+    DT_JMPREL = 23
+    DT_INIT_ARRAY = 25
+    DT_FINI_ARRAY = 26
+    DT_INIT_ARRAYSZ = 27
+    DT_FINI_ARRAYSZ = 28
+    DT_GNU_HASH = 0x6ffffef5
+    DT_RELR = 0x6fffe000
+    DT_RELRSZ = 0x6fffe001
+
+
+STT_OBJECT: Final[int] = 1
+STT_FUNC: Final[int] = 2
+SHN_UNDEF: Final[int] = 0
+SHN_ABS: Final[int] = 0xfff1
+
+NT_GNU_BUILD_ID: Final[int] = 3
+
+SHF_WRITE: Final[int] = 0x1
+SHF_ALLOC: Final[int] = 0x2
+SHF_EXECINSTR: Final[int] = 0x4
+
+
+# 与 script/elf/struct.ts 中 Elf_* 的 B32/B64 布局一致
+EHDR: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([
+        ('e_ident', 'u1', 16), ('e_type', '<u2'), ('e_machine', '<u2'), ('e_version', '<u4'),
+        ('e_entry', '<u4'), ('e_phoff', '<u4'), ('e_shoff', '<u4'), ('e_flags', '<u4'),
+        ('e_ehsize', '<u2'), ('e_phentsize', '<u2'), ('e_phnum', '<u2'),
+        ('e_shentsize', '<u2'), ('e_shnum', '<u2'), ('e_shstrndx', '<u2'),
+    ]),
+    ELFCLASS64: np.dtype([
+        ('e_ident', 'u1', 16), ('e_type', '<u2'), ('e_machine', '<u2'), ('e_version', '<u4'),
+        ('e_entry', '<u8'), ('e_phoff', '<u8'), ('e_shoff', '<u8'), ('e_flags', '<u4'),
+        ('e_ehsize', '<u2'), ('e_phentsize', '<u2'), ('e_phnum', '<u2'),
+        ('e_shentsize', '<u2'), ('e_shnum', '<u2'), ('e_shstrndx', '<u2'),
+    ]),
+}
+
+PHDR: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([
+        ('p_type', '<u4'), ('p_offset', '<u4'), ('p_vaddr', '<u4'), ('p_paddr', '<u4'),
+        ('p_filesz', '<u4'), ('p_memsz', '<u4'), ('p_flags', '<u4'), ('p_align', '<u4'),
+    ]),
+    ELFCLASS64: np.dtype([
+        ('p_type', '<u4'), ('p_flags', '<u4'), ('p_offset', '<u8'), ('p_vaddr', '<u8'),
+        ('p_paddr', '<u8'), ('p_filesz', '<u8'), ('p_memsz', '<u8'), ('p_align', '<u8'),
+    ]),
+}
+
+SHDR: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([
+        ('sh_name', '<u4'), ('sh_type', '<u4'), ('sh_flags', '<u4'), ('sh_addr', '<u4'),
+        ('sh_offset', '<u4'), ('sh_size', '<u4'), ('sh_link', '<u4'), ('sh_info', '<u4'),
+        ('sh_addralign', '<u4'), ('sh_entsize', '<u4'),
+    ]),
+    ELFCLASS64: np.dtype([
+        ('sh_name', '<u4'), ('sh_type', '<u4'), ('sh_flags', '<u8'), ('sh_addr', '<u8'),
+        ('sh_offset', '<u8'), ('sh_size', '<u8'), ('sh_link', '<u4'), ('sh_info', '<u4'),
+        ('sh_addralign', '<u8'), ('sh_entsize', '<u8'),
+    ]),
+}
+
+DYN: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([('d_tag', '<i4'), ('d_un', '<u4')]),
+    ELFCLASS64: np.dtype([('d_tag', '<i8'), ('d_un', '<u8')]),
+}
+
+SYM: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([
+        ('st_name', '<u4'), ('st_value', '<u4'), ('st_size', '<u4'),
+        ('st_info', 'u1'), ('st_other', 'u1'), ('st_shndx', '<u2'),
+    ]),
+    ELFCLASS64: np.dtype([
+        ('st_name', '<u4'), ('st_info', 'u1'), ('st_other', 'u1'), ('st_shndx', '<u2'),
+        ('st_value', '<u8'), ('st_size', '<u8'),
+    ]),
+}
+
+RELA: Final[Dict[int, np.dtype]] = {
+    ELFCLASS32: np.dtype([('r_offset', '<u4'), ('r_info', '<u4'), ('r_addend', '<i4')]),
+    ELFCLASS64: np.dtype([('r_offset', '<u8'), ('r_info', '<u8'), ('r_addend', '<i8')]),
+}
+
+# r_info 中符号下标的位移与类型掩码
+RELA_INFO_SYM: Final[Dict[int, int]] = {ELFCLASS32: 8, ELFCLASS64: 32}
+RELA_INFO_TYPE: Final[Dict[int, int]] = {ELFCLASS32: 0xff, ELFCLASS64: 0xffffffff}
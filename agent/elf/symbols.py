@@ -0,0 +1,45 @@
+from typing import Optional, List, Tuple, Sequence
+import numpy as np
+
+
+class SymbolTable:
+    values: np.ndarray
+    sizes: np.ndarray
+    names: List[str]
+
+    def __init__(self, symbols: List[Tuple[int, int, str]]):
+        symbols = sorted(set(symbols))
+        self.values = np.array([v[0] for v in symbols], dtype=np.uint64)
+        self.sizes = np.array([v[1] for v in symbols], dtype=np.uint64)
+        self.names = [v[2] for v in symbols]
+
+    @classmethod
+    def from_arrays(cls, values: np.ndarray, sizes: np.ndarray, names: Sequence[str]) -> 'SymbolTable':
+        # values 需已排序
+        table = cls.__new__(cls)
+        table.values = np.asarray(values, dtype=np.uint64)
+        table.sizes = np.asarray(sizes, dtype=np.uint64)
+        table.names = list(names)
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f'<SymbolTable [{len(self)}]>'
+
+    def lookup(self, offset: int) -> Optional[Tuple[str, int]]:
+        i = int(np.searchsorted(self.values, np.uint64(offset), side='right')) - 1
+        if i < 0:
+            return None
+        delta = offset - int(self.values[i])
+        size = int(self.sizes[i])
+        if size and delta >= size:
+            return None
+        return self.names[i], delta
+
+    def find(self, name: str) -> Optional[int]:
+        try:
+            return int(self.values[self.names.index(name)])
+        except ValueError:
+            return None
@@ -0,0 +1,195 @@
+from typing import Final, Optional, List, Dict, Set, Tuple, Union
+from agent.elf.module import ElfImage
+from agent.elf.cache import ElfCache, get_elf_cache
+from agent.store.chunk import get_chunk_store
+from agent.config import Config
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import os
+
+
+# 与agent端ElfModuleX.dynSymbols/symtab一一对应的原始符号项(不做过滤, 保持下标以便重定位引用)
+CACHED_SYM_DTYPE: Final[np.dtype] = np.dtype([
+    ('st_value', '<u8'), ('st_size', '<u8'), ('st_name', '<u4'),
+    ('st_shndx', '<u2'), ('st_info', 'u1'), ('st_other', 'u1'),
+])
+
+# 下发给agent时按列排布, 每列都是自然对齐的
+_COLUMNS: Final[List[str]] = ['st_value', 'st_size', 'st_name', 'st_shndx', 'st_info', 'st_other']
+
+
+class SymbolTables:
+    build_id: Final[str]
+    tables: Dict[str, Tuple[np.ndarray, List[str]]]
+
+    def __init__(self, build_id: str, tables: Optional[Dict[str, Tuple[np.ndarray, List[str]]]] = None):
+        self.build_id = build_id
+        self.tables = tables or {}
+
+    def __repr__(self):
+        return f'<SymbolTables {self.build_id} {", ".join(f"{k}[{len(v[0])}]" for k, v in self.tables.items())}>'
+
+    @classmethod
+    def from_image(cls, image: ElfImage) -> 'SymbolTables':
+        tables: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+        for kind, syms, names in (
+            ('dynsym', image.dynsym, image.dynsym_names()),
+            ('symtab', image.symtab, image.symtab_names()),
+        ):
+            if syms is None or not len(syms):
+                continue
+            arr = np.empty(len(syms), dtype=CACHED_SYM_DTYPE)
+            for col in _COLUMNS:
+                arr[col] = syms[col]
+            tables[kind] = (arr, names)
+        return cls(image.build_id, tables)
+
+    def encode(self) -> Tuple[List[Dict[str, Union[str, int]]], bytes]:
+        metas = []
+        parts = []
+        size = 0
+        for kind, (arr, names) in self.tables.items():
+            names_blob = '\0'.join(names).encode('utf-8') + b'\0'
+            for col in _COLUMNS:
+                parts.append(np.ascontiguousarray(arr[col]).tobytes())
+            parts.append(names_blob)
+            pad = -(len(arr) * CACHED_SYM_DTYPE.itemsize + len(names_blob)) % 8
+            parts.append(b'\0' * pad)
+            metas.append({'kind': kind, 'offset': size, 'count': len(arr), 'names_size': len(names_blob)})
+            size += len(arr) * CACHED_SYM_DTYPE.itemsize + len(names_blob) + pad
+        return metas, b''.join(parts)
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        arrays = {}
+        for kind, (arr, names) in self.tables.items():
+            arrays[kind] = arr
+            arrays[f'{kind}_names'] = np.array(names, dtype=str)
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], build_id: str) -> 'SymbolTables':
+        tables = {}
+        with np.load(path) as f:
+            for kind in ('dynsym', 'symtab'):
+                if kind in f:
+                    tables[kind] = (f[kind], f[f'{kind}_names'].tolist())
+        return cls(build_id, tables)
+
+
+class SymbolStore:
+    # 按build-id缓存的符号表, 由主机侧在agent加载模块时下发.
+    # 与ElfCache共用目录(<build_id>.syms.npz 与 ElfInfo 的 <build_id>.npz 并列), 同一镜像只解析一次
+    elf_cache: Final[ElfCache]
+    symbol_dirs: List[Path]
+
+    _items: Dict[str, SymbolTables]
+    # 已确认无法构建的build-id, 避免每次查询都重新扫描symbol_dirs与已dump的模块
+    _missing: Set[str]
+    _lock: Lock
+
+    def __init__(self, elf_cache: ElfCache, symbol_dirs: List[Union[str, Path]] = []):
+        self.elf_cache = elf_cache
+        self.symbol_dirs = [Path(v) for v in symbol_dirs]
+        self._items = {}
+        self._missing = set()
+        self._lock = Lock()
+
+    def _path(self, build_id: str) -> Optional[Path]:
+        root = self.elf_cache.root
+        return root / f'{build_id}.syms.npz' if root else None
+
+    def put(self, tables: SymbolTables):
+        with self._lock:
+            self._items[tables.build_id] = tables
+            self._missing.discard(tables.build_id)
+        path = self._path(tables.build_id)
+        if path is not None:
+            tables.save(path)
+
+    def put_image(self, image: ElfImage) -> SymbolTables:
+        if image.build_id:
+            self.elf_cache.analyze(image)
+        tables = SymbolTables.from_image(image)
+        self.put(tables)
+        return tables
+
+    def get(self, build_id: str) -> Optional[SymbolTables]:
+        with self._lock:
+            tables = self._items.get(build_id)
+            if tables is not None:
+                return tables
+        path = self._path(build_id)
+        if path is None or not path.exists():
+            return None
+        tables = SymbolTables.load(path, build_id)
+        with self._lock:
+            self._items[build_id] = tables
+        return tables
+
+    def lookup(self, build_id: str, name: str) -> Optional[SymbolTables]:
+        tables = self.get(build_id)
+        if tables is not None:
+            return tables
+        with self._lock:
+            if build_id in self._missing:
+                return None
+        # 未命中时尝试从本地ELF文件或已dump的模块中构建
+        tables = self._build_from_files(build_id, name) or self._build_from_store(build_id)
+        if tables is None:
+            with self._lock:
+                self._missing.add(build_id)
+            return None
+        self.put(tables)
+        return tables
+
+    def _build_from_files(self, build_id: str, name: str) -> Optional[SymbolTables]:
+        for d in self.symbol_dirs:
+            for fp in [d / name, *d.rglob(name)]:
+                if not fp.is_file():
+                    continue
+                try:
+                    with ElfImage.open(fp) as image:
+                        if image.build_id == build_id:
+                            self.elf_cache.analyze(image)
+                            return SymbolTables.from_image(image)
+                except (ValueError, IndexError, OSError):
+                    pass
+        return None
+
+    def _build_from_store(self, build_id: str) -> Optional[SymbolTables]:
+        # dump以tag命名, 按manifest中记录的build-id查找
+        store = get_chunk_store()
+        if store is None:
+            return None
+        manifest = store.find('elfModule', build_id=build_id)
+        if manifest is None:
+            return None
+        try:
+            image = ElfImage(store.materialize(manifest), is_image=True)
+            if image.build_id == build_id:
+                self.elf_cache.analyze(image)
+                return SymbolTables.from_image(image)
+        except (ValueError, IndexError, OSError):
+            pass
+        return None
+
+
+_SYMBOL_STORE: Optional[SymbolStore] = None
+_SYMBOL_STORE_LOCK: Final[Lock] = Lock()
+
+
+def get_symbol_store() -> Optional[SymbolStore]:
+    global _SYMBOL_STORE
+    if _SYMBOL_STORE is None:
+        conf = Config.get()
+        if not conf.agent.datadir:
+            return None
+        with _SYMBOL_STORE_LOCK:
+            if _SYMBOL_STORE is None:
+                _SYMBOL_STORE = SymbolStore(get_elf_cache(), conf.agent.symbol_dirs)
+    return _SYMBOL_STORE
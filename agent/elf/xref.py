@@ -0,0 +1,155 @@
+from typing import Final, Optional, List, Dict, Tuple, NamedTuple, Iterable, Union
+from concurrent.futures import ProcessPoolExecutor
+from agent.elf.module import ElfImage
+from agent.elf.struct import PhdrType
+import numpy as np
+import os
+
+
+PF_X: Final[int] = 0x1
+
+# adrp: op=1, 28..24 = 10000
+ADRP_MASK: Final[np.uint32] = np.uint32(0x9f000000)
+ADRP_BITS: Final[np.uint32] = np.uint32(0x90000000)
+# add Xd, Xn, #imm: sf=1 op=0 S=0, 28..23 = 100010
+ADD_IMM_MASK: Final[np.uint32] = np.uint32(0xff800000)
+ADD_IMM_BITS: Final[np.uint32] = np.uint32(0x91000000)
+
+# 小于该大小的区间不值得分发到进程池
+PARALLEL_MIN_SIZE: Final[int] = 4 << 20
+
+
+class Adrl(NamedTuple):
+    # 与agent端 Adrl 对应: $handle 为adrp所在地址, add 为配对的 add 指令地址(未找到时为None)
+    adrp: int
+    add: Optional[int]
+    rd: int
+    target: int
+
+    def toJSON(self) -> Dict[str, Optional[str]]:
+        return {
+            '$handle': hex(self.adrp),
+            'adrp': hex(self.adrp),
+            'add': hex(self.add) if self.add is not None else None,
+            'target': hex(self.target),
+        }
+
+
+def _sign_extend(value: np.ndarray, bits: int) -> np.ndarray:
+    value = value.astype(np.int64)
+    sign = np.int64(1 << (bits - 1))
+    return (value ^ sign) - sign
+
+
+def scan_words(
+    words: np.ndarray, base: int, targets: np.ndarray, max_gap_to_add: int = 16, limit: Optional[int] = None,
+) -> List[Adrl]:
+    # words: 小端u32指令流, base: words[0] 的地址; limit: 只报告下标小于limit的adrp(分块重叠区由下一块负责)
+    words = np.asarray(words, dtype=np.uint32)
+    limit = len(words) if limit is None else min(limit, len(words))
+    targets = np.unique(np.asarray(targets, dtype=np.uint64)).astype(np.int64)
+    if not len(targets) or not limit:
+        return []
+
+    idx = np.flatnonzero((words[:limit] & ADRP_MASK) == ADRP_BITS)
+    w = words[idx]
+    imm = ((w >> np.uint32(29)) & np.uint32(0x3)) | (((w >> np.uint32(5)) & np.uint32(0x7ffff)) << np.uint32(2))
+    pcs = np.int64(base) + idx.astype(np.int64) * 4
+    pages = (pcs & ~np.int64(0xfff)) + (_sign_extend(imm, 21) << 12)
+
+    # 只保留页命中任一目标页的adrp
+    keep = np.isin(pages, np.unique(targets & ~np.int64(0xfff)))
+    idx, w, pages = idx[keep], w[keep], pages[keep]
+    rd = (w & np.uint32(0x1f)).astype(np.int64)
+
+    resolved = pages.copy()
+    add_idx = np.full(len(idx), -1, dtype=np.int64)
+    pending = np.ones(len(idx), dtype=bool)
+    # 同 Adrl.getTarget: 在其后 maxGapToAdd 条内找 Rd==Rn==adrp.Rd 的 add
+    for gap in range(1, max_gap_to_add):
+        pos = idx + gap
+        valid = pending & (pos < len(words))
+        if not valid.any():
+            break
+        nxt = words[np.minimum(pos, len(words) - 1)]
+        is_add = (nxt & ADD_IMM_MASK) == ADD_IMM_BITS
+        add_rd = (nxt & np.uint32(0x1f)).astype(np.int64)
+        add_rn = ((nxt >> np.uint32(5)) & np.uint32(0x1f)).astype(np.int64)
+        hit = valid & is_add & (add_rd == rd) & (add_rn == rd)
+        if hit.any():
+            imm12 = ((nxt >> np.uint32(10)) & np.uint32(0xfff)).astype(np.int64)
+            shift = np.where(nxt & np.uint32(1 << 22), 12, 0)
+            resolved = np.where(hit, pages + (imm12 << shift), resolved)
+            add_idx = np.where(hit, pos, add_idx)
+            pending &= ~hit
+
+    matched = np.flatnonzero(np.isin(resolved, targets))
+    return [
+        Adrl(
+            adrp=base + int(idx[i]) * 4,
+            add=base + int(add_idx[i]) * 4 if add_idx[i] >= 0 else None,
+            rd=int(rd[i]),
+            target=int(resolved[i]),
+        )
+        for i in matched.tolist()
+    ]
+
+
+def _scan_chunk(args: Tuple[bytes, int, np.ndarray, int, int]) -> List[Adrl]:
+    data, base, targets, max_gap_to_add, limit = args
+    return scan_words(np.frombuffer(data, dtype='<u4'), base, targets, max_gap_to_add, limit)
+
+
+def scan_adrl(
+    data: Union[bytes, memoryview, np.ndarray], base: int, targets: Iterable[int],
+    max_gap_to_add: int = 16, workers: Optional[int] = None, chunk_size: int = PARALLEL_MIN_SIZE,
+) -> Dict[int, List[Adrl]]:
+    # 一次扫描同时回答多个目标, 结果按目标地址分组
+    targets = np.unique(np.fromiter(targets, dtype=np.uint64))
+    view = memoryview(data).cast('B')
+    # 指令按4字节对齐
+    skip = -base % 4
+    view = view[skip: skip + (len(view) - skip) // 4 * 4]
+    base += skip
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    chunk_size = max(4, chunk_size // 4 * 4)
+    if workers <= 1 or len(view) <= chunk_size:
+        found = scan_words(np.frombuffer(view, dtype='<u4'), base, targets, max_gap_to_add)
+    else:
+        overlap = max_gap_to_add * 4
+        jobs = [
+            (bytes(view[off: off + chunk_size + overlap]), base + off, targets, max_gap_to_add, chunk_size // 4)
+            for off in range(0, len(view), chunk_size)
+        ]
+        found = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            for part in pool.map(_scan_chunk, jobs):
+                found.extend(part)
+
+    results: Dict[int, List[Adrl]] = {int(v): [] for v in targets.tolist()}
+    for adrl in found:
+        results[adrl.target].append(adrl)
+    return results
+
+
+def scan_module_adrl(
+    image: ElfImage, targets: Iterable[int], base: int = 0,
+    max_gap_to_add: int = 16, workers: Optional[int] = None,
+) -> Dict[int, List[Adrl]]:
+    # 扫描模块的所有可执行段; base为模块基址, targets/结果均为 base 下的地址
+    targets = list(targets)
+    results: Dict[int, List[Adrl]] = {int(v): [] for v in targets}
+    for ph in image.phdrs:
+        if ph['p_type'] != PhdrType.PT_LOAD or not int(ph['p_flags']) & PF_X:
+            continue
+        vaddr = int(ph['p_vaddr'])
+        off = image.vaddr_to_offset(vaddr)
+        if off is None:
+            continue
+        size = int(ph['p_memsz'] if image.is_image else ph['p_filesz'])
+        data = image.view(np.dtype('u1'), off, size)
+        seg_base = base + vaddr - image.min_vaddr
+        for target, adrls in scan_adrl(data, seg_base, targets, max_gap_to_add, workers).items():
+            results[target].extend(adrls)
+    return results
@@ -0,0 +1,104 @@
+from typing import Final, Optional, Callable, Tuple
+from agent.config import LogCollapse
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Thread, Event, Lock
+import atexit
+import time
+import re
+
+
+REG_LOG_POINTER: Final[re.Pattern] = re.compile(r'0x[0-9a-fA-F]+')
+REG_LOG_NUMBER: Final[re.Pattern] = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+
+
+def normalize_log(text: str) -> str:
+    return REG_LOG_NUMBER.sub('#', REG_LOG_POINTER.sub('0x?', text))
+
+
+@dataclass
+class _Repeat:
+    text: str
+    # 上次输出后被折叠的次数
+    count: int
+    first_at: float
+    last_at: float
+
+
+class LogCollapser:
+    # 放在set_logger的日志处理器之前: 首次出现的行立即输出, 窗口内的重复行只计数,
+    # 在被挤出窗口或定时刷新时输出一行 "xN/时间跨度" 汇总
+    conf: Final[LogCollapse]
+
+    _emit: Callable[[str, str], None]
+    _recent: 'OrderedDict[Tuple[str, str], _Repeat]'
+    _lock: Lock
+    _stopped: Event
+    _thread: Optional[Thread]
+
+    def __init__(self, emit: Callable[[str, str], None], conf: LogCollapse):
+        self.conf = conf
+        self._emit = emit
+        self._recent = OrderedDict()
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self) -> 'LogCollapser':
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, name='LogCollapser', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.conf.flush_interval):
+            self.flush(time.time() - self.conf.flush_interval)
+
+    @staticmethod
+    def _summary(repeat: _Repeat) -> str:
+        return f'{repeat.text} [x{repeat.count} {repeat.last_at - repeat.first_at:.2f}s]'
+
+    def __call__(self, level: str, text: str):
+        key = (level, normalize_log(text) if self.conf.normalize else text)
+        now = time.time()
+        pending = []
+        with self._lock:
+            repeat = self._recent.get(key)
+            if repeat is not None:
+                if not repeat.count:
+                    repeat.first_at = now
+                repeat.count += 1
+                repeat.text = text
+                repeat.last_at = now
+                self._recent.move_to_end(key)
+                return
+            self._recent[key] = _Repeat(text, 0, now, now)
+            while len(self._recent) > self.conf.window:
+                (old_level, _), old = self._recent.popitem(last=False)
+                if old.count:
+                    pending.append((old_level, self._summary(old)))
+        for v in pending:
+            self._emit(*v)
+        self._emit(level, text)
+
+    def flush(self, before: Optional[float] = None):
+        # 输出重复计数; before不为空时只输出首次折叠早于该时间的项(持续重复的行也按周期输出),
+        # 并清理没有待输出计数且最后出现早于该时间的行
+        pending = []
+        with self._lock:
+            for key, repeat in list(self._recent.items()):
+                if repeat.count:
+                    if before is None or repeat.first_at <= before:
+                        pending.append((key[0], self._summary(repeat)))
+                        repeat.count = 0
+                elif before is not None and repeat.last_at <= before:
+                    del self._recent[key]
+        for v in pending:
+            self._emit(*v)
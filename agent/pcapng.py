@@ -0,0 +1,269 @@
+from typing import Final, Optional, List, Dict, Tuple, Iterator, BinaryIO, Union
+from threading import Thread, Event, Lock
+from pathlib import Path
+import struct
+import time
+
+
+BT_SHB: Final[int] = 0x0A0D0D0A
+BT_IDB: Final[int] = 0x00000001
+BT_SPB: Final[int] = 0x00000003
+BT_EPB: Final[int] = 0x00000006
+BT_DSB: Final[int] = 0x0000000A
+
+BYTE_ORDER_MAGIC: Final[int] = 0x1A2B3C4D
+# Decryption Secrets Block 中的 TLS Key Log (NSS keylog格式)
+SECRETS_TYPE_TLS: Final[int] = 0x544C534B
+
+OPT_ENDOFOPT: Final[int] = 0
+OPT_SHB_USERAPPL: Final[int] = 4
+OPT_IF_NAME: Final[int] = 2
+OPT_IF_TSRESOL: Final[int] = 9
+
+PCAP_MAGIC_US: Final[int] = 0xA1B2C3D4
+PCAP_MAGIC_NS: Final[int] = 0xA1B23C4D
+
+
+def _pad4(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _option(code: int, value: bytes) -> bytes:
+    return struct.pack('<HH', code, len(value)) + _pad4(value)
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    size = 12 + len(body)
+    return struct.pack('<II', block_type, size) + body + struct.pack('<I', size)
+
+
+class Packet:
+    __slots__ = ('linktype', 'snaplen', 'ifname', 'ts_ns', 'data', 'orig_len')
+
+    def __init__(self, linktype: int, snaplen: int, ifname: str, ts_ns: int, data: bytes, orig_len: int):
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.ifname = ifname
+        self.ts_ns = ts_ns
+        self.data = data
+        self.orig_len = orig_len
+
+
+class PcapngWriter:
+    # 只写小端单section的pcapng; 所有接口的时间戳精度统一为ns
+    path: Final[Path]
+
+    _file: BinaryIO
+    _interfaces: Dict[Tuple[int, int, str], int]
+    _lock: Lock
+
+    def __init__(self, path: Union[str, Path], userappl: str = 'frida-analykit'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'wb')
+        self._interfaces = {}
+        self._lock = Lock()
+        body = struct.pack('<IHHq', BYTE_ORDER_MAGIC, 1, 0, -1)
+        body += _option(OPT_SHB_USERAPPL, userappl.encode('utf-8')) + _option(OPT_ENDOFOPT, b'')
+        self._write(_block(BT_SHB, body))
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+
+    def interface(self, linktype: int, snaplen: int = 0, name: str = '') -> int:
+        key = (linktype, snaplen, name)
+        with self._lock:
+            if_id = self._interfaces.get(key)
+            if if_id is None:
+                if_id = self._interfaces[key] = len(self._interfaces)
+                body = struct.pack('<HHI', linktype, 0, snaplen)
+                if name:
+                    body += _option(OPT_IF_NAME, name.encode('utf-8'))
+                body += _option(OPT_IF_TSRESOL, b'\x09') + _option(OPT_ENDOFOPT, b'')
+                self._write(_block(BT_IDB, body))
+            return if_id
+
+    def write_packet(self, packet: Packet):
+        if_id = self.interface(packet.linktype, packet.snaplen, packet.ifname)
+        body = struct.pack(
+            '<IIIII', if_id, (packet.ts_ns >> 32) & 0xffffffff, packet.ts_ns & 0xffffffff,
+            len(packet.data), packet.orig_len,
+        ) + _pad4(packet.data)
+        with self._lock:
+            self._write(_block(BT_EPB, body))
+
+    def write_secrets(self, secrets: bytes, secrets_type: int = SECRETS_TYPE_TLS):
+        body = struct.pack('<II', secrets_type, len(secrets)) + _pad4(secrets)
+        with self._lock:
+            self._write(_block(BT_DSB, body))
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _read_exact(f: BinaryIO, size: int, follow: Optional[Event] = None) -> bytes:
+    # follow不为空时, 读到文件尾会等待新数据(用于tcpdump正在写入的文件或管道), 直到Event被设置
+    buf = b''
+    while len(buf) < size:
+        chunk = f.read(size - len(buf))
+        if chunk:
+            buf += chunk
+            continue
+        if follow is None or follow.is_set():
+            break
+        time.sleep(0.1)
+    return buf
+
+
+def _read_pcap(f: BinaryIO, magic: bytes, follow: Optional[Event]) -> Iterator[Packet]:
+    endian = '<' if struct.unpack('<I', magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) else '>'
+    nano = struct.unpack(f'{endian}I', magic)[0] == PCAP_MAGIC_NS
+    head = _read_exact(f, 20, follow)
+    if len(head) < 20:
+        return
+    _, _, _, _, snaplen, linktype = struct.unpack(f'{endian}HHiIII', head)
+    linktype &= 0xffff
+    while True:
+        rec = _read_exact(f, 16, follow)
+        if len(rec) < 16:
+            return
+        sec, frac, cap_len, orig_len = struct.unpack(f'{endian}IIII', rec)
+        data = _read_exact(f, cap_len, follow)
+        if len(data) < cap_len:
+            return
+        yield Packet(linktype, snaplen, '', sec * 1_000_000_000 + frac * (1 if nano else 1000), data, orig_len)
+
+
+def _tsresol_ns(value: int) -> Tuple[int, int]:
+    # 返回 (分子, 分母), ts * 分子 // 分母 即为ns
+    if value & 0x80:
+        return 1_000_000_000, 1 << (value & 0x7f)
+    exp = value & 0x7f
+    if exp <= 9:
+        return 10 ** (9 - exp), 1
+    return 1, 10 ** (exp - 9)
+
+
+def _parse_options(data: bytes, endian: str) -> Dict[int, bytes]:
+    opts: Dict[int, bytes] = {}
+    off = 0
+    while off + 4 <= len(data):
+        code, size = struct.unpack_from(f'{endian}HH', data, off)
+        if code == OPT_ENDOFOPT:
+            break
+        opts.setdefault(code, data[off + 4: off + 4 + size])
+        off += 4 + size + (-size % 4)
+    return opts
+
+
+def _read_pcapng(f: BinaryIO, first: bytes, follow: Optional[Event]) -> Iterator[Packet]:
+    endian = '<'
+    interfaces: List[Tuple[int, int, str, Tuple[int, int]]] = []
+    head = first
+    while True:
+        if len(head) < 8:
+            return
+        if head[:4] == struct.pack('<I', BT_SHB):
+            # SHB的长度字段依赖其后的字节序标记
+            bom = _read_exact(f, 4, follow)
+            if len(bom) < 4:
+                return
+            endian = '<' if struct.unpack('<I', bom)[0] == BYTE_ORDER_MAGIC else '>'
+            size = struct.unpack(f'{endian}I', head[4:8])[0]
+            if len(_read_exact(f, size - 12, follow)) < size - 12:
+                return
+            interfaces = []
+        else:
+            block_type, size = struct.unpack(f'{endian}II', head)
+            body = _read_exact(f, size - 8, follow)
+            if len(body) < size - 8:
+                return
+            body = body[:-4]
+            if block_type == BT_IDB:
+                linktype, _, snaplen = struct.unpack_from(f'{endian}HHI', body)
+                opts = _parse_options(body[8:], endian)
+                tsresol = _tsresol_ns(opts[OPT_IF_TSRESOL][0]) if OPT_IF_TSRESOL in opts else (1000, 1)
+                interfaces.append((linktype, snaplen, opts.get(OPT_IF_NAME, b'').decode('utf-8', 'replace'), tsresol))
+            elif block_type == BT_EPB:
+                if_id, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(f'{endian}IIIII', body)
+                linktype, snaplen, name, (num, den) = interfaces[if_id]
+                ts = ((ts_high << 32) | ts_low) * num // den
+                yield Packet(linktype, snaplen, name, ts, body[20: 20 + cap_len], orig_len)
+            elif block_type == BT_SPB and interfaces:
+                orig_len = struct.unpack_from(f'{endian}I', body)[0]
+                linktype, snaplen, name, _ = interfaces[0]
+                cap_len = min(orig_len, snaplen or orig_len, len(body) - 4)
+                yield Packet(linktype, snaplen, name, time.time_ns(), body[4: 4 + cap_len], orig_len)
+        head = _read_exact(f, 8, follow)
+
+
+def read_packets(f: BinaryIO, follow: Optional[Event] = None) -> Iterator[Packet]:
+    # 支持pcap(任意字节序/us或ns精度)与pcapng
+    magic = _read_exact(f, 4, follow)
+    if len(magic) < 4:
+        return
+    if struct.unpack('<I', magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or struct.unpack('>I', magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        yield from _read_pcap(f, magic, follow)
+    elif struct.unpack('<I', magic)[0] == BT_SHB:
+        yield from _read_pcapng(f, magic + _read_exact(f, 4, follow), follow)
+    else:
+        raise ValueError(f'未知的抓包文件格式: {magic.hex()}')
+
+
+class SecretsPcapng:
+    # 把TLS密钥以DSB写入pcapng, 并可同时合并来自抓包文件/管道的数据包, 输出可直接在Wireshark中解密
+    writer: Final[PcapngWriter]
+    capture: Optional[str]
+    follow: bool
+
+    _stopped: Event
+    _thread: Optional[Thread]
+
+    def __init__(self, output: Union[str, Path], capture: Optional[str] = None, follow: bool = True):
+        self.writer = PcapngWriter(output)
+        self.capture = capture
+        self.follow = follow
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self) -> 'SecretsPcapng':
+        if self.capture and self._thread is None:
+            self._thread = Thread(target=self._merge, name='SecretsPcapng', daemon=True)
+            self._thread.start()
+        return self
+
+    def _merge(self):
+        count = 0
+        try:
+            with open(self.capture, 'rb') as f:
+                for packet in read_packets(f, self._stopped if self.follow else None):
+                    self.writer.write_packet(packet)
+                    count += 1
+                    if count % 256 == 0:
+                        self.writer.flush()
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            print(f'[pcapng] 读取抓包[{self.capture}]失败: {e}')
+        self.writer.flush()
+
+    def add_secret(self, label: str, client_random: str, secret: str):
+        self.writer.write_secrets(f'{label} {client_random} {secret}\n'.encode('utf-8'))
+        self.writer.flush()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        self.writer.close()
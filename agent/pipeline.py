@@ -0,0 +1,308 @@
+from typing import Final, Optional, List, Dict, Tuple, Any, Callable, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from agent.config import Config, Pipeline
+from dataclasses import dataclass, field
+from threading import Lock, BoundedSemaphore
+from pathlib import Path
+import hashlib
+import json
+import threading
+import sys
+import os
+
+
+@dataclass
+class StageContext:
+    # 传给worker进程, 只包含可序列化的数据
+    source: str
+    stage: str
+    name: str
+    path: str
+    sha256: str
+    outdir: str
+    datadir: str
+    # 依赖阶段的返回值
+    deps: Dict[str, Any] = field(default_factory=dict)
+    # 随输入一起提交的元数据, 如elfModule的模块路径(module)与build_id
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+StageFunc = Callable[[StageContext], Any]
+
+
+@dataclass
+class Stage:
+    source: str
+    name: str
+    func: StageFunc
+    depends: Tuple[str, ...] = ()
+
+
+class StageRegistry:
+    _stages: Dict[str, Dict[str, Stage]]
+
+    def __init__(self):
+        self._stages = {}
+
+    def stage(self, source: str, name: Optional[str] = None, depends: Tuple[str, ...] = ()):
+        # 阶段函数需定义在模块顶层, 以便在worker进程中反序列化
+        def wrapper(func: StageFunc) -> StageFunc:
+            stage = Stage(source, name or func.__name__, func, tuple(depends))
+            self._stages.setdefault(source, {})[stage.name] = stage
+            return func
+        return wrapper
+
+    def remove(self, source: str, name: str):
+        self._stages.get(source, {}).pop(name, None)
+
+    def stages(self, source: str) -> List[Stage]:
+        # 按依赖拓扑排序
+        stages = self._stages.get(source, {})
+        order: List[Stage] = []
+        visiting: Dict[str, bool] = {}
+
+        def visit(name: str):
+            if visiting.get(name) is False:
+                return
+            if visiting.get(name) is True:
+                raise ValueError(f'[{source}] 阶段依赖存在环: {name}')
+            if name not in stages:
+                raise KeyError(f'[{source}] 依赖的阶段[{name}]未注册')
+            visiting[name] = True
+            for dep in stages[name].depends:
+                visit(dep)
+            visiting[name] = False
+            order.append(stages[name])
+
+        for name in stages:
+            visit(name)
+        return order
+
+    def __contains__(self, source: str):
+        return bool(self._stages.get(source))
+
+
+STAGES: Final[StageRegistry] = StageRegistry()
+
+
+def _run_stage(func: StageFunc, ctx: StageContext) -> Any:
+    Path(ctx.outdir).mkdir(parents=True, exist_ok=True)
+    return func(ctx)
+
+
+class PipelineRunner:
+    # SAVE_FILE落盘后的后处理: 协调线程按依赖调度, 实际计算在进程池中进行, 不占用RPC线程.
+    # 每个阶段的结果按输入内容hash记录, 相同输入不会重复处理
+    conf: Final[Pipeline]
+    registry: Final[StageRegistry]
+    root: Final[Path]
+    datadir: Final[str]
+
+    _pool: Optional[ProcessPoolExecutor]
+    _coordinator: ThreadPoolExecutor
+    _pending: BoundedSemaphore
+    _lock: Lock
+
+    def __init__(self, datadir: Union[str, Path], conf: Pipeline, registry: StageRegistry = STAGES):
+        self.conf = conf
+        self.registry = registry
+        self.datadir = str(datadir)
+        self.root = Path(datadir) / 'pipeline'
+        self._pool = None
+        self._coordinator = ThreadPoolExecutor(max_workers=conf.max_jobs, thread_name_prefix='Pipeline')
+        self._pending = BoundedSemaphore(conf.max_pending)
+        self._lock = Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.conf.workers or os.cpu_count() or 1)
+            return self._pool
+
+    def _result_path(self, source: str, stage: str, sha256: str) -> Path:
+        return self.root / source / stage / f'{sha256[:32]}.json'
+
+    def submit(
+        self, source: str, name: str, *, path: Optional[Union[str, Path]] = None,
+        data: Optional[bytes] = None, sha256: Optional[str] = None, meta: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Future]:
+        if source not in self.registry:
+            return None
+        # 不阻塞RPC线程, 积压过多时直接丢弃
+        if not self._pending.acquire(blocking=False):
+            print(f'[pipeline] 积压任务超过{self.conf.max_pending}, 丢弃 {source}/{name}', file=sys.stderr)
+            return None
+        fut = self._coordinator.submit(self._run, source, name, path, data, sha256, meta or {})
+        fut.add_done_callback(lambda _: self._pending.release())
+        return fut
+
+    def _run(
+        self, source: str, name: str, path: Optional[Union[str, Path]],
+        data: Optional[bytes], sha256: Optional[str], meta: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        if sha256 is None:
+            if data is not None:
+                sha256 = hashlib.sha256(data).hexdigest()
+            else:
+                h = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        h.update(chunk)
+                sha256 = h.hexdigest()
+
+        stages = self.registry.stages(source)
+        results: Dict[str, Any] = {}
+        todo: List[Stage] = []
+        for stage in stages:
+            fp = self._result_path(source, stage.name, sha256)
+            if fp.exists():
+                results[stage.name] = json.loads(fp.read_text(encoding='utf-8'))
+            else:
+                todo.append(stage)
+        if not todo:
+            return results
+
+        tmp_input = None
+        if path is None:
+            # 同一内容可能同时被多个任务处理, 临时文件按任务区分, 避免被先结束的任务删掉
+            tmp_input = self.root / '.inputs' / f'{sha256}.{os.getpid()}.{threading.get_ident()}.bin'
+            tmp_input.parent.mkdir(parents=True, exist_ok=True)
+            tmp_input.write_bytes(data)
+            path = tmp_input
+        try:
+            self._schedule(source, name, str(path), sha256, todo, results, meta)
+        finally:
+            if tmp_input is not None:
+                tmp_input.unlink(missing_ok=True)
+        return results
+
+    def _schedule(
+        self, source: str, name: str, path: str, sha256: str,
+        todo: List[Stage], results: Dict[str, Any], meta: Dict[str, Any],
+    ):
+        running: Dict[Future, Stage] = {}
+        failed: Dict[str, bool] = {}
+        while todo or running:
+            for stage in list(todo):
+                if any(dep in failed for dep in stage.depends):
+                    todo.remove(stage)
+                    failed[stage.name] = True
+                    continue
+                if not all(dep in results for dep in stage.depends):
+                    continue
+                todo.remove(stage)
+                ctx = StageContext(
+                    source=source, stage=stage.name, name=name, path=path, sha256=sha256,
+                    outdir=str(self.root / source / stage.name), datadir=self.datadir,
+                    deps={dep: results[dep] for dep in stage.depends}, meta=meta,
+                )
+                running[self.pool.submit(_run_stage, stage.func, ctx)] = stage
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage = running.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    failed[stage.name] = True
+                    print(f'[pipeline] {source}/{stage.name} {name} 失败: {e}', file=sys.stderr)
+                    continue
+                results[stage.name] = result
+                fp = self._result_path(source, stage.name, sha256)
+                fp.parent.mkdir(parents=True, exist_ok=True)
+                fp.write_text(json.dumps(result, ensure_ascii=False, default=str), encoding='utf-8')
+                print(f'[pipeline] {source}/{stage.name} {name} 完成')
+
+    def shutdown(self, wait: bool = True):
+        self._coordinator.shutdown(wait=wait)
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+
+_PIPELINE: Optional[PipelineRunner] = None
+_PIPELINE_LOCK: Final[Lock] = Lock()
+
+
+def get_pipeline() -> Optional[PipelineRunner]:
+    global _PIPELINE
+    if _PIPELINE is None:
+        conf = Config.get()
+        if not conf.agent.datadir or not conf.agent.pipeline.enable:
+            return None
+        with _PIPELINE_LOCK:
+            if _PIPELINE is None:
+                _PIPELINE = PipelineRunner(conf.agent.datadir, conf.agent.pipeline)
+    return _PIPELINE
+
+
+# 内置阶段
+
+@STAGES.stage('elfModule', 'info')
+def elf_module_info(ctx: StageContext) -> Dict[str, Any]:
+    from agent.elf.module import ElfImage
+    from agent.elf.struct import DyntabTag
+    with ElfImage.open(ctx.path, is_image=True) as image:
+        strtab = image._dyn_offset(DyntabTag.DT_STRTAB)
+        return {
+            'build_id': image.build_id,
+            'needed': [image.cstr(strtab + v) for v in image.needed] if strtab is not None else [],
+            'dynsym': len(image.dynsym),
+            'imports': len(image.imports()),
+        }
+
+
+@STAGES.stage('elfModule', 'fixed', depends=('info',))
+def elf_module_fixed(ctx: StageContext) -> Dict[str, Any]:
+    # 修复section header, 输出可直接用反汇编工具加载的文件
+    from agent.elf.module import ElfImage
+    dst = Path(ctx.outdir) / f'{ctx.deps["info"]["build_id"]}_{Path(ctx.name).name}'
+    with ElfImage.open(ctx.path, is_image=True) as image:
+        image.write_fixed(dst)
+    return {'path': str(dst)}
+
+
+@STAGES.stage('elfModule', 'strings')
+def elf_module_strings(ctx: StageContext) -> Dict[str, Any]:
+    # 模块dump按内存映像排布, 地址记为模块内偏移, 查询时按模块路径在maps中的基址换算
+    from agent.strindex import get_string_index
+    index = get_string_index(ctx.datadir)
+    with open(ctx.path, 'rb') as f:
+        seg = index.add_ranges(
+            Path(ctx.name).name, [(0, f.read())], ctx.sha256, ctx.source, relative=True, module=ctx.meta.get('module'),
+        )
+    return {'segment': seg}
+
+
+@STAGES.stage('snapshot', 'strings')
+def snapshot_strings(ctx: StageContext) -> Dict[str, Any]:
+    from agent.strindex import get_string_index
+    from agent.snapshot import MemorySnapshot
+    index = get_string_index(ctx.datadir)
+    with MemorySnapshot(Path(ctx.path).parent) as snapshot:
+        # 逐个区间交给索引按窗口处理, 不同时持有整个快照
+        ranges = ((base, snapshot.array(base, size)) for base, size, _, _ in snapshot.iter_ranges())
+        seg = index.add_ranges(f'snapshot:{ctx.name}', ranges, ctx.sha256, ctx.source)
+        del ranges
+    return {'segment': seg}
+
+
+@STAGES.stage('procMaps', 'modules')
+def proc_maps_modules(ctx: StageContext) -> Dict[str, Any]:
+    from agent.procmaps import ProcMaps
+    with open(ctx.path, 'r', encoding='utf-8', errors='replace') as f:
+        maps = ProcMaps(f.read())
+    return {
+        'ranges': len(maps),
+        'modules': [{'name': v.name, 'path': v.path, 'base': hex(v.base), 'size': v.size} for v in maps.modules],
+    }
+
+
+@STAGES.stage('textFile', 'lines')
+def text_file_lines(ctx: StageContext) -> Dict[str, Any]:
+    with open(ctx.path, 'rb') as f:
+        data = f.read()
+    return {'size': len(data), 'lines': data.count(b'\n')}
@@ -0,0 +1,186 @@
+from typing import Final, Optional, List, Tuple, Dict, NamedTuple, Union, Sequence
+from dataclasses import dataclass, field
+from threading import Lock
+import numpy as np
+import bisect
+import re
+
+
+REG_PROC_MAPS_LINE: Final[re.Pattern] = re.compile(
+    r'^([a-fA-F0-9]+)-([a-fA-F0-9]+)\s+([rwxsp\-]+)\s+([a-fA-F0-9]+)\s+(\w+):(\w+)\s+(\d+)\s*(.*)$'
+)
+
+
+class ProcMapItem(NamedTuple):
+    start: int
+    end: int
+    prots: str
+    offset: int
+    dev: str
+    inode: int
+    pathname: str
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    def __str__(self):
+        return f'{self.start:x}-{self.end:x} {self.prots} {self.offset:x} {self.dev} {self.inode} {self.pathname}'
+
+
+class ModuleRange(NamedTuple):
+    name: str
+    path: str
+    base: int
+    end: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.base
+
+
+@dataclass
+class MapsDiff:
+    added: List[ProcMapItem] = field(default_factory=list)
+    removed: List[ProcMapItem] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed)
+
+
+def parse_line(line: str) -> Optional[ProcMapItem]:
+    m = REG_PROC_MAPS_LINE.match(line.strip())
+    if not m:
+        return None
+    start, end, prots, offset, major, minor, inode, pathname = m.groups()
+    return ProcMapItem(int(start, 16), int(end, 16), prots, int(offset, 16), f'{major}:{minor}', int(inode), pathname.strip())
+
+
+def is_module_path(pathname: str) -> bool:
+    return pathname.startswith('/') and not pathname.startswith('/dev/')
+
+
+class ProcMaps:
+    items: List[ProcMapItem]
+    modules: List[ModuleRange]
+    # 每次索引重建后递增, 供下游缓存判断失效
+    generation: int
+
+    # 按起始地址排序的区间索引
+    starts: np.ndarray
+    ends: np.ndarray
+    # 每个区间所属模块在 modules 中的下标, -1为非模块映射
+    module_ids: np.ndarray
+
+    _lines: Dict[str, ProcMapItem]
+    _starts_list: List[int]
+    _lock: Lock
+
+    def __init__(self, text: str = ''):
+        self.items = []
+        self.modules = []
+        self._lines = {}
+        self._starts_list = []
+        self._lock = Lock()
+        self.generation = 0
+        self._build([])
+        if text:
+            self.update(text)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f'<ProcMaps items={len(self.items)} modules={len(self.modules)}>'
+
+    def update(self, text: str) -> MapsDiff:
+        lines: Dict[str, ProcMapItem] = {}
+        diff = MapsDiff()
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            # 未变化的行直接复用上次解析结果
+            item = self._lines.get(line)
+            if item is None:
+                item = parse_line(line)
+                if item is None:
+                    continue
+                diff.added.append(item)
+            lines[line] = item
+        diff.removed = [v for k, v in self._lines.items() if k not in lines]
+        if diff or not self._lines:
+            with self._lock:
+                self._lines = lines
+                self._build(sorted(lines.values()))
+        return diff
+
+    def _build(self, items: List[ProcMapItem]):
+        modules: List[ModuleRange] = []
+        module_ids = np.full(len(items), -1, dtype=np.int32)
+        # 只合并同一次加载的映射: 与上一个文件映射同路径, 且文件偏移不回退.
+        # 中间可以夹着匿名映射(.bss等), 但夹着其他文件或偏移回到开头时视为另一个映射
+        last_idx, last_offset = -1, -1
+        for i, item in enumerate(items):
+            if not is_module_path(item.pathname):
+                continue
+            if last_idx >= 0 and modules[last_idx].path == item.pathname and item.offset >= last_offset:
+                idx = last_idx
+                mod = modules[idx]
+                modules[idx] = mod._replace(end=max(mod.end, item.end))
+            else:
+                idx = len(modules)
+                modules.append(ModuleRange(item.pathname.rsplit('/', 1)[-1], item.pathname, item.start, item.end))
+            last_idx, last_offset = idx, item.offset
+            module_ids[i] = idx
+
+        self.items = items
+        self.modules = modules
+        self.starts = np.fromiter((v.start for v in items), dtype=np.uint64, count=len(items))
+        self.ends = np.fromiter((v.end for v in items), dtype=np.uint64, count=len(items))
+        self.module_ids = module_ids
+        self._starts_list = [v.start for v in items]
+        self.generation += 1
+
+    def find(self, addr: int) -> Optional[ProcMapItem]:
+        i = bisect.bisect_right(self._starts_list, addr) - 1
+        if i < 0:
+            return None
+        item = self.items[i]
+        return item if addr < item.end else None
+
+    def find_module(self, addr: int) -> Optional[ModuleRange]:
+        i = bisect.bisect_right(self._starts_list, addr) - 1
+        if i < 0 or addr >= self.items[i].end or self.module_ids[i] < 0:
+            return None
+        return self.modules[self.module_ids[i]]
+
+    def find_module_by_name(self, name: str) -> Optional[ModuleRange]:
+        for mod in self.modules:
+            if mod.name == name or mod.path == name:
+                return mod
+        return None
+
+    def resolve(self, addrs: Union[np.ndarray, Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        idx = np.searchsorted(self.starts, addrs, side='right').astype(np.int64) - 1
+        hit = idx >= 0
+        safe_idx = np.where(hit, idx, 0)
+        if len(self.items):
+            hit &= addrs < self.ends[safe_idx]
+            module_ids = np.where(hit, self.module_ids[safe_idx], -1)
+        else:
+            module_ids = np.full(len(addrs), -1, dtype=np.int32)
+        bases = np.array([v.base for v in self.modules] or [0], dtype=np.uint64)
+        offsets = np.where(module_ids >= 0, addrs - bases[np.maximum(module_ids, 0)], addrs)
+        return module_ids.astype(np.int32), offsets.astype(np.uint64)
+
+    def resolve_names(self, addrs: Union[np.ndarray, Sequence[int]]) -> List[Tuple[Optional[str], int]]:
+        module_ids, offsets = self.resolve(addrs)
+        return [
+            (self.modules[m].name if m >= 0 else None, o)
+            for m, o in zip(module_ids.tolist(), offsets.tolist())
+        ]
+
+
+# 最近一次从agent收到的maps快照
+PROC_MAPS: Final[ProcMaps] = ProcMaps()
@@ -0,0 +1,154 @@
+from typing import Final, Optional, List, Dict, Tuple, Any
+from agent.logger import LoggerName, get_logger
+from collections import OrderedDict
+from threading import Lock, Timer
+import numpy as np
+import atexit
+
+
+class StreamingHistogram:
+    # 按2的幂分桶的耗时直方图(ms), 占用固定内存
+    BUCKETS: Final[int] = 32
+
+    counts: np.ndarray
+    count: int
+    total: float
+    min: float
+    max: float
+
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = float('inf')
+        self.max = 0
+
+    def add(self, value: float):
+        value = max(value, 0)
+        self.counts[min(int(value).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q: float) -> float:
+        # 返回所在桶的上界
+        if not self.count:
+            return 0
+        i = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        return min(float((1 << i) - 1 if i else 0), self.max)
+
+    def __repr__(self):
+        return f'<StreamingHistogram n={self.count} mean={self.mean:.1f} p50={self.quantile(0.5):.0f} p90={self.quantile(0.9):.0f} max={self.max:.0f}>'
+
+
+class TagProgress:
+    tag: Final[str]
+    steps: int
+    errors: int
+    durations: StreamingHistogram
+    last_intro: str
+    # 上次输出时的步数, 用于计算区间增量
+    rendered_steps: int
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.steps = 0
+        self.errors = 0
+        self.durations = StreamingHistogram()
+        self.last_intro = ''
+        self.rendered_steps = 0
+
+
+class ProgressTracker:
+    # 以(tag, id)跟踪每个ProgressNotify实例, 用agent端时间戳计算相邻step耗时,
+    # 按interval限频输出每个tag一行汇总, 与agent发送频率无关
+    interval: float
+    max_active: int
+
+    tags: Dict[str, TagProgress]
+    # (tag, id) -> (step, time)
+    _active: 'OrderedDict[Tuple[str, int], Tuple[int, int]]'
+    _dirty: bool
+    _timer: Optional[Timer]
+    _lock: Lock
+
+    def __init__(self, interval: float = 1.0, max_active: int = 4096):
+        self.interval = interval
+        self.max_active = max_active
+        self.tags = {}
+        self._active = OrderedDict()
+        self._dirty = False
+        self._timer = None
+        self._lock = Lock()
+
+    def update(self, tag: str, id: int, step: int, time: int, extra: Dict[str, Any], error: Any = None):
+        key = (tag, id)
+        with self._lock:
+            stats = self.tags.get(tag)
+            if stats is None:
+                stats = self.tags[tag] = TagProgress(tag)
+            stats.steps += 1
+            last = self._active.pop(key, None)
+            if last is not None and step > last[0]:
+                stats.durations.add(time - last[1])
+            self._active[key] = (step, time)
+            # agent端不通知结束, 长期不更新的实例按LRU淘汰
+            while len(self._active) > self.max_active:
+                self._active.popitem(last=False)
+            if error is not None:
+                stats.errors += 1
+            if extra:
+                stats.last_intro = str(extra.get('intro', ','.join(extra.keys())))
+            self._dirty = True
+            if self._timer is None:
+                self._timer = Timer(self.interval, self.render)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def active(self, tag: Optional[str] = None) -> int:
+        return sum(1 for k in list(self._active) if tag is None or k[0] == tag)
+
+    def summary(self) -> List[str]:
+        lines = []
+        for stats in self.tags.values():
+            if stats.steps == stats.rendered_steps:
+                continue
+            hist = stats.durations
+            line = (
+                f'[~] | {stats.tag} | steps={stats.steps}(+{stats.steps - stats.rendered_steps}) '
+                f'active={self.active(stats.tag)} '
+                f'p50={hist.quantile(0.5):.0f}ms p90={hist.quantile(0.9):.0f}ms max={hist.max:.0f}ms'
+            )
+            if stats.errors:
+                line += f' errors={stats.errors}'
+            if stats.last_intro:
+                line += f' => {stats.last_intro}'
+            lines.append(line)
+            stats.rendered_steps = stats.steps
+        return lines
+
+    def render(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            lines = self.summary()
+        if lines:
+            print('\n'.join(lines), file=get_logger(LoggerName.stdout))
+
+    def flush(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self.render()
+
+
+PROGRESS: Final[ProgressTracker] = ProgressTracker()
+atexit.register(PROGRESS.flush)
@@ -0,0 +1,131 @@
+from typing import Final, List, Dict, Tuple, Callable, Iterator, Sequence, Any, Union
+from agent.config import Config
+from collections import namedtuple
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import json
+
+
+EventHandler = Callable[[np.ndarray], None]
+
+
+def _field_dtype(type_: str) -> str:
+    # agent端ptr按u64小端写入
+    if type_ == 'ptr':
+        return '<u8'
+    if type_ in ('u1', 'i1'):
+        return type_
+    return f'<{type_}'
+
+
+class EventSchema:
+    name: Final[str]
+    fields: Final[List[Tuple[str, str]]]
+    dtype: Final[np.dtype]
+
+    _record_type: type
+
+    def __init__(self, name: str, fields: Sequence[Tuple[str, str]]):
+        self.name = name
+        self.fields = [(k, v) for k, v in fields]
+        # 与agent端EventSchema一致: 紧凑排布, 无对齐填充
+        self.dtype = np.dtype([(k, _field_dtype(v)) for k, v in self.fields])
+        self._record_type = namedtuple(f'Event_{name}'.replace('.', '_'), [k for k, _ in self.fields], rename=True)
+
+    def __repr__(self):
+        return f'<EventSchema {self.name} {self.fields} size={self.dtype.itemsize}>'
+
+    def decode(self, data: Union[bytes, memoryview]) -> np.ndarray:
+        return np.frombuffer(data, dtype=self.dtype, count=len(data) // self.dtype.itemsize)
+
+    def records(self, arr: np.ndarray) -> Iterator[Any]:
+        make = self._record_type._make
+        for v in arr.tolist():
+            yield make(v)
+
+
+class EventRegistry:
+    _schemas: Dict[str, EventSchema]
+    _handlers: Dict[str, List[EventHandler]]
+    _sinks: Dict[str, Path]
+    _lock: Lock
+
+    def __init__(self):
+        self._schemas = {}
+        self._handlers = {}
+        self._sinks = {}
+        self._lock = Lock()
+
+    def __contains__(self, name: str):
+        return name in self._schemas
+
+    def __getitem__(self, name: str) -> EventSchema:
+        return self._schemas[name]
+
+    def register(self, name: str, fields: Sequence[Tuple[str, str]]) -> EventSchema:
+        schema = EventSchema(name, fields)
+        old = self._schemas.get(name)
+        if old is not None and old.dtype != schema.dtype:
+            # 布局变化后旧的落盘文件不再可用
+            self._sinks.pop(name, None)
+        self._schemas[name] = schema
+        return schema
+
+    def on(self, name: str):
+        def wrapper(func: EventHandler) -> EventHandler:
+            with self._lock:
+                self._handlers[name] = self._handlers.get(name, []) + [func]
+            return func
+        return wrapper
+
+    def off(self, name: str, func: EventHandler):
+        with self._lock:
+            self._handlers[name] = [v for v in self._handlers.get(name, []) if v is not func]
+
+    def decode(self, name: str, data: Union[bytes, memoryview]) -> np.ndarray:
+        schema = self._schemas.get(name)
+        if schema is None:
+            raise KeyError(f'事件schema[{name}]未注册')
+        return schema.decode(data)
+
+    def records(self, name: str, arr: np.ndarray) -> Iterator[Any]:
+        return self._schemas[name].records(arr)
+
+    def dispatch(self, name: str, arr: np.ndarray):
+        handlers = self._handlers.get(name)
+        if handlers:
+            for handler in handlers:
+                handler(arr)
+        else:
+            self._sink(name, arr)
+
+    def _sink(self, name: str, arr: np.ndarray):
+        # 未注册处理器的事件按原始布局追加到 <datadir>/events/<name>.bin, 可用 load 直接映射回结构化数组
+        path = self._sinks.get(name)
+        if path is None:
+            datadir = Config.get().agent.datadir
+            if not datadir:
+                return
+            path = Path(datadir) / 'events' / f'{name}.bin'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            schema = self._schemas[name]
+            meta = path.with_suffix('.json')
+            if meta.exists() and json.loads(meta.read_text(encoding='utf-8')).get('fields') != [list(v) for v in schema.fields]:
+                path.unlink(missing_ok=True)
+            meta.write_text(json.dumps({'name': name, 'fields': schema.fields}, ensure_ascii=False), encoding='utf-8')
+            self._sinks[name] = path
+        with open(path, 'ab') as f:
+            f.write(arr.tobytes())
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> np.ndarray:
+        path = Path(path)
+        meta = json.loads(path.with_suffix('.json').read_text(encoding='utf-8'))
+        schema = EventSchema(meta['name'], meta['fields'])
+        if not path.stat().st_size:
+            return np.empty(0, dtype=schema.dtype)
+        return np.memmap(path, dtype=schema.dtype, mode='r')
+
+
+EVENTS: Final[EventRegistry] = EventRegistry()
@@ -0,0 +1,104 @@
+from typing import Final, Optional, TYPE_CHECKING
+from agent.rpc.message import RPCMessage, RPCMsgType, RPCMsg_FLOW_CONTROL
+from agent.rpc.resolver import RPCResolver
+from agent.config import FlowControl
+from threading import Thread, Event
+import frida
+import sys
+
+
+if TYPE_CHECKING:
+    from agent.session import ScriptWrapper
+
+
+class FlowController:
+    # 根据主机侧的负载(处理器耗时, 以及有订阅者时的订阅缓冲占用率)调整agent端BatchSender的批量参数.
+    # 负载高时成倍放大批次与滞留时间以减少IPC次数, 负载低时逐步收缩以降低延迟(AIMD).
+    conf: Final[FlowControl]
+    state: RPCMsg_FLOW_CONTROL
+
+    _script: 'ScriptWrapper'
+    _resolver: RPCResolver
+    _stopped: Event
+    _thread: Optional[Thread]
+
+    HIGH_LOAD: Final[float] = 0.8
+    LOW_LOAD: Final[float] = 0.3
+    # 缓冲区接近满时暂停agent发送(直到其硬上限)
+    PAUSE_FILL: Final[float] = 0.95
+
+    def __init__(self, script: 'ScriptWrapper', resolver: RPCResolver, conf: FlowControl):
+        self.conf = conf
+        self.state = RPCMsg_FLOW_CONTROL(
+            batch_size=conf.min_batch_size,
+            batch_bytes=conf.batch_bytes,
+            max_age=conf.min_age,
+            credit=-1,
+        )
+        self._script = script
+        self._resolver = resolver
+        self._stopped = Event()
+        self._thread = None
+
+    @property
+    def load(self) -> float:
+        latency_load = self._resolver.handler_latency / self.conf.latency_budget
+        return max(self._resolver.queue_fill(), latency_load)
+
+    def adjust(self) -> RPCMsg_FLOW_CONTROL:
+        conf, state = self.conf, self.state
+        load = self.load
+        if load >= self.HIGH_LOAD:
+            batch_size = min(conf.max_batch_size, state.batch_size * 2)
+            max_age = min(conf.max_age, state.max_age * 2)
+        elif load <= self.LOW_LOAD:
+            batch_size = max(conf.min_batch_size, state.batch_size - conf.min_batch_size)
+            max_age = max(conf.min_age, state.max_age - conf.min_age)
+        else:
+            batch_size, max_age = state.batch_size, state.max_age
+
+        fill = self._resolver.queue_fill()
+        if fill >= self.PAUSE_FILL:
+            credit = 0
+        elif fill > 0:
+            # 按剩余缓冲放行批次
+            credit = max(1, int((1 - fill) * conf.window))
+        else:
+            credit = -1
+
+        self.state = RPCMsg_FLOW_CONTROL(
+            batch_size=batch_size,
+            batch_bytes=conf.batch_bytes,
+            max_age=max_age,
+            credit=credit,
+        )
+        return self.state
+
+    def post(self):
+        self._script.post(RPCMessage(type=RPCMsgType.FLOW_CONTROL.value, data=self.state))
+
+    def start(self) -> 'FlowController':
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.conf.interval):
+            self.adjust()
+            try:
+                # 每个周期都下发, 脚本重建后agent可直接恢复到当前状态
+                self.post()
+            except frida.InvalidOperationError as e:
+                # 脚本已销毁, 重连后由supervisor重新启动
+                print(f'[FlowController] 脚本已不可用, 停止流控: {e}', file=sys.stderr)
+                self._stopped.set()
+            except frida.TransportError as e:
+                print(f'[FlowController] post失败: {e}', file=sys.stderr)
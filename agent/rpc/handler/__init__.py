@@ -1,5 +1,11 @@
 
 from agent.rpc.handler import (
+    backtrace,
+    coverage,
+    event,
     nettools,
     progressing,
+    savefile,
+    snapshot,
+    symcache,
 )
\ No newline at end of file
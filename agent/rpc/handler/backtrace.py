@@ -0,0 +1,18 @@
+from agent.rpc.resolver import RPC
+from agent.rpc.message import RPCMsgSource, RPCPayload, unpack_batch_payload
+from agent.logger import LoggerName, get_logger
+from agent.symbolize import get_symbolizer
+import numpy as np
+
+
+@RPC.on_batch(RPCMsgSource.backtrace)
+def on_backtrace(payload: RPCPayload):
+    symbolizer = get_symbolizer()
+    out = get_logger(LoggerName.stdout)
+    for item in unpack_batch_payload(payload):
+        data = item.message.data
+        addrs = np.frombuffer(item.data or b'', dtype='<u8')
+        stacks = symbolizer.symbolize(addrs)
+        print(f'[+] | Helper.backtrace | <{data.tid}> - {data.tag}', file=out)
+        if stacks:
+            print('[>] ' + '\n'.join(stacks), file=out)
@@ -0,0 +1,9 @@
+from agent.rpc.event import EVENTS
+from agent.coverage import get_coverage
+import numpy as np
+
+
+# agent端 Coverage 通过 EventChannel('coverage') 上报新编译的基本块
+@EVENTS.on('coverage')
+def on_coverage(arr: np.ndarray):
+    get_coverage().add_blocks(arr['start'], arr['size'])
@@ -0,0 +1,30 @@
+from agent.rpc.resolver import RPC
+from agent.rpc.message import RPCMsgType, RPCMsgSource, RPCPayload
+from agent.rpc.event import EVENTS
+from typing import Dict, List
+import sys
+
+
+@RPC.on_message(RPCMsgType.EVENT_SCHEMA)
+def on_event_schema(payload: RPCPayload):
+    data = payload.message.data
+    schema = EVENTS.register(data.name, data.fields)
+    print(f'[event] {schema}')
+
+
+@RPC.on_batch(RPCMsgSource.event)
+def on_event_batch(payload: RPCPayload):
+    # 同一批次内相同schema的数据拼接后一次性解码, 不为单个事件构造对象
+    message, data = payload.message, payload.data or b''
+    view = memoryview(data)
+    parts: Dict[str, List[memoryview]] = {}
+    inc = 0
+    for msg, size in zip(message.data.message_list, message.data.data_sizes):
+        parts.setdefault(msg.data.schema_name, []).append(view[inc: inc + size])
+        inc += size
+    for name, chunks in parts.items():
+        if name not in EVENTS:
+            print(f'[event] schema[{name}]未注册, 丢弃{sum(len(v) for v in chunks)}字节', file=sys.stderr)
+            continue
+        buff = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        EVENTS.dispatch(name, EVENTS.decode(name, buff))
@@ -1,5 +1,7 @@
-from typing import Final, FrozenSet, MutableMapping, Optional, Union, List, Tuple, Any, Callable, Dict, TYPE_CHECKING
+from typing import Final, FrozenSet, MutableMapping, Optional, Union, List, Tuple, Set, Any, Callable, Dict, TYPE_CHECKING
 from agent.rpc.message import RPCPayload
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 import os
 import functools 
 import weakref
@@ -32,15 +34,218 @@ class Unset:
 _SCOPE_GET_PREFIX = '__get__$$'
 
 
+class PropsCache:
+    # (scope_id, inst_id) -> {属性名: 类型}, 补全直接从这里取, 枚举放到后台线程.
+    # 原型链部分按agent返回的shape id缓存, 同类实例只需传自身属性; shape在引用它的实例全部被清掉后释放.
+    # 缓存只对当前agent实例(epoch)有效: epoch变化或脚本重建时整体清空
+    max_size: int
+    timeout: float
+
+    _items: 'OrderedDict[Tuple[str, str], Dict[str, str]]'
+    _pending: Dict[Tuple[str, str], Future]
+    _shapes: Dict[int, Dict[str, str]]
+    _shape_refs: Dict[int, Set[Tuple[str, str]]]
+    _item_shape: Dict[Tuple[str, str], int]
+    _epoch: str
+    # reset时递增, 丢弃重置前发出的枚举结果
+    _generation: int
+    _executor: ThreadPoolExecutor
+    _lock: Lock
+
+    def __init__(self, max_size: int = 4096, timeout: float = 0.5, workers: int = 2):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._pending = {}
+        self._shapes = {}
+        self._shape_refs = {}
+        self._item_shape = {}
+        self._epoch = ''
+        self._generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='JsHandleProps')
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def shapes(self) -> int:
+        return len(self._shapes)
+
+    def get(self, scope_id: str, inst_id: str) -> Optional[Dict[str, str]]:
+        key = (scope_id, inst_id)
+        with self._lock:
+            props = self._items.get(key)
+            if props is not None:
+                self._items.move_to_end(key)
+            return props
+
+    def put(self, scope_id: str, inst_id: str, props: Dict[str, str], shape: int = -1):
+        key = (scope_id, inst_id)
+        with self._lock:
+            self._drop(key)
+            self._items[key] = props
+            if shape >= 0 and shape in self._shapes:
+                self._item_shape[key] = shape
+                self._shape_refs.setdefault(shape, set()).add(key)
+            while len(self._items) > self.max_size:
+                self._drop(next(iter(self._items)))
+
+    def _drop(self, key: Tuple[str, str]):
+        self._items.pop(key, None)
+        shape = self._item_shape.pop(key, None)
+        if shape is None:
+            return
+        refs = self._shape_refs.get(shape)
+        if refs is not None:
+            refs.discard(key)
+            if not refs:
+                del self._shape_refs[shape]
+                self._shapes.pop(shape, None)
+
+    def evict(self, scope_id: str, inst_id: Optional[str] = None):
+        # inst_id为空时清掉整个scope, 否则连同以它为前缀的子路径一起清掉
+        with self._lock:
+            for key in [
+                k for k in self._items
+                if k[0] == scope_id and (inst_id is None or k[1] == inst_id or k[1].startswith(inst_id + '/'))
+            ]:
+                self._drop(key)
+
+    def reset(self):
+        # 脚本重建后scope_id不变, 但其中的对象已全部失效
+        with self._lock:
+            self._items.clear()
+            self._pending.clear()
+            self._shapes.clear()
+            self._shape_refs.clear()
+            self._item_shape.clear()
+            self._epoch = ''
+            self._generation += 1
+
+    def fetch(self, script: 'ScriptWrapper', inst_ids: List[str], scope_id: str) -> Dict[str, Future]:
+        # 缺失的合并成一次批量枚举, 已在途的直接复用
+        futures: Dict[str, Future] = {}
+        missing: List[str] = []
+        with self._lock:
+            for inst_id in inst_ids:
+                key = (scope_id, inst_id)
+                props = self._items.get(key)
+                if props is not None:
+                    fut = Future()
+                    fut.set_result(props)
+                elif key in self._pending:
+                    fut = self._pending[key]
+                else:
+                    fut = self._pending[key] = Future()
+                    missing.append(inst_id)
+                futures[inst_id] = fut
+        if missing:
+            self._executor.submit(self._enumerate, script, missing, scope_id, [futures[v] for v in missing])
+        return futures
+
+    def _enumerate(self, script: 'ScriptWrapper', inst_ids: List[str], scope_id: str, futures: List[Future]):
+        with self._lock:
+            # 请求期间shape可能被释放, 按发出请求时的快照解析
+            known = dict(self._shapes)
+            epoch = self._epoch
+            generation = self._generation
+        try:
+            data = script.exports_sync.enumerate_obj_props(inst_ids, scope_id, list(known), epoch).message.data
+        except Exception as e:
+            self._finish(scope_id, inst_ids, futures, generation)
+            for fut in futures:
+                fut.set_exception(e)
+            return
+        if data.epoch != epoch:
+            known = {}
+        known.update(data.shape_props)
+        with self._lock:
+            stale = generation != self._generation
+            if not stale:
+                if data.epoch != self._epoch:
+                    # agent已重新加载, 之前缓存的实例属性与shape都不再可信
+                    self._epoch = data.epoch
+                    self._items.clear()
+                    self._shapes.clear()
+                    self._shape_refs.clear()
+                    self._item_shape.clear()
+                for shape, props in data.shape_props.items():
+                    self._shapes.setdefault(shape, props)
+        shapes = data.shapes or [-1] * len(inst_ids)
+        results = []
+        for inst_id, own, shape in zip(inst_ids, data.props, shapes):
+            props = dict(own)
+            for name, typ in known.get(shape, {}).items():
+                props.setdefault(name, typ)
+            results.append(props)
+            if stale:
+                continue
+            with self._lock:
+                if shape in known and shape not in self._shapes:
+                    self._shapes[shape] = known[shape]
+            self.put(scope_id, inst_id, props, shape)
+        self._finish(scope_id, inst_ids, futures, generation)
+        for fut, props in zip(futures, results):
+            fut.set_result(props)
+
+    def _finish(self, scope_id: str, inst_ids: List[str], futures: List[Future], generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            for inst_id, fut in zip(inst_ids, futures):
+                if self._pending.get((scope_id, inst_id)) is fut:
+                    del self._pending[(scope_id, inst_id)]
+
+    def prefetch(self, script: 'ScriptWrapper', inst_ids: List[str], scope_id: str):
+        if inst_ids:
+            self.fetch(script, inst_ids, scope_id)
+
+
+PROPS_CACHE: Final[PropsCache] = PropsCache()
+
+
+def _fill_props(
+    props: MutableMapping[str, Any], fut: Future, timeout: Optional[float] = None,
+    done: Optional[Callable[[], None]] = None,
+) -> bool:
+    # 超时不阻塞提示符, 结果回来后再补进handle自己的属性表. 返回属性是否已完整
+    def update(f: Future):
+        if f.exception() is not None:
+            return
+        for name, typ in f.result().items():
+            if name not in props:
+                props[name] = Unset(typ)
+        if done is not None:
+            done()
+    try:
+        fut.result(timeout=PROPS_CACHE.timeout if timeout is None else timeout)
+        update(fut)
+        return True
+    except FutureTimeoutError:
+        fut.add_done_callback(update)
+    except Exception:
+        pass
+    return False
+
+
+def _scope_del(script: 'ScriptWrapper', inst_id: str, scope_id: str):
+    PROPS_CACHE.evict(scope_id, inst_id)
+    script.exports_sync.scope_del(inst_id, scope_id)
+
+
 class JsHandle:
     __parent: 'JsHandle'
     __path: str
     __script: 'ScriptWrapper'
-    __props: MutableMapping[str, Optional['JsHandle']] = {}
+    # 每个handle独立的属性表, 元数据由 PROPS_CACHE 缓存
+    __props: MutableMapping[str, Union['JsHandle', Unset]]
     __typ: str = 'unknown'
     __scope_id: str = ''
     __inst_id: Union[str, bool, None] = None
     __value: Any = Unset('any')
+    # 属性枚举超时或失败时为True, 此时属性表不完整
+    __partial: bool = False
 
     __lock: Lock = Lock()
 
@@ -53,12 +258,16 @@ class JsHandle:
         '__scope_id',
         '__inst_id',
         '__value',
+        '__partial',
         '__lock',
+        '__prefetch',
+        '__set_complete',
     ]])
 
     __LATER_PROP__: Final[FrozenSet[str]] = frozenset([
         'value',
         'type',
+        'partial',
     ])
 
 
@@ -82,15 +291,20 @@ class JsHandle:
         else:
             raise TypeError(f'unexpected type of {type(inst_id)}')
         self.__inst_id = inst_id
-        self.__props = props if props is not None else {
-            name: Unset(typ) 
-            for name, typ in self.__script.exports_sync.enumerate_obj_props(inst_id, scope_id).message.data.props[0].items()
-        }
+        if props is None:
+            props = {}
+            self.__partial = True
+            if _fill_props(props, PROPS_CACHE.fetch(script, [inst_id], scope_id)[inst_id], done=self.__set_complete):
+                self.__partial = False
+        self.__props = props
 
-        weakref.finalize(self, functools.partial(self.__script.exports_sync.scope_del, inst_id, scope_id))
+        weakref.finalize(self, functools.partial(_scope_del, script, inst_id, scope_id))
 
     def __repr__(self):
-        return f'<JsHandle: [{self.__typ}] {str(self)}>'
+        return f'<JsHandle: [{self.__typ}] {str(self)}{" (partial)" if self.__partial else ""}>'
+
+    def __set_complete(self):
+        self.__partial = False
 
     def __str__(self):
         if self.__parent is None:
@@ -100,8 +314,16 @@ class JsHandle:
         return str(self.__parent) + '/' + self.__path
 
     def __dir__(self):
+        # 只用本地已有的属性, 同时在后台预取子属性以便下一次补全
+        self.__prefetch()
         return tuple(self.__props) + tuple(JsHandle.__LATER_PROP__)
 
+    def __prefetch(self):
+        prefix = str(self)
+        PROPS_CACHE.prefetch(self.__script, [
+            f'{prefix}/{k}' for k, v in list(self.__props.items()) if type(v) is Unset
+        ], self.__scope_id)
+
     def __call__(self, *args):
         if len(args) > 0:
             args_list = []
@@ -145,6 +367,10 @@ class JsHandle:
     def type(self):
         return self.__typ
 
+    @property
+    def partial(self) -> bool:
+        return self.__partial
+
     def __getattribute__(self, name):
         if name.startswith('__') or name in JsHandle.__INTERNAL_PROP__:
             return object.__getattribute__(self, name)
@@ -159,29 +385,23 @@ class JsHandle:
             if REPL:
                 self.__lock.acquire()
                 unset_childs: Dict[str, JsHandle] = {}
-                unset_props: Dict[str, Dict] = {}
                 order_inst_ids = []
                 for k, v in props.items():
                     if type(v) is not Unset:
                         continue
-                    later_update_props = {}
-                    handle = JsHandle(k, self, script=self.__script, typ=v.name, scope_id=self.__scope_id, inst_id=None, props=later_update_props)
+                    handle = JsHandle(k, self, script=self.__script, typ=v.name, scope_id=self.__scope_id, inst_id=None, props={})
                     props[k] = handle
                     key = handle._JsHandle__inst_id
                     unset_childs[key] = handle
-                    unset_props[key] = later_update_props
                     order_inst_ids.append(key)
 
                 self.__lock.release()
-                
-                batch_result = self.__script.exports_sync.enumerate_obj_props(order_inst_ids, self.__scope_id)
-                for i, p in enumerate(batch_result.message.data.props):
-                    key = order_inst_ids[i]
-                    unset_props[key].update({
-                        k: Unset(v)
-                        for k, v in p.items()
-                    })
+
+                futures = PROPS_CACHE.fetch(self.__script, order_inst_ids, self.__scope_id)
+                for key, handle in unset_childs.items():
+                    _fill_props(handle._JsHandle__props, futures[key], 0 if handle is not props[name] else None)
                 val = props[name]
+                val._JsHandle__prefetch()
             else:
                 val = JsHandle(name, self, script=self.__script, typ=val.name, scope_id=self.__scope_id, inst_id=None)
                 props[name] = val
@@ -3,9 +3,11 @@ from agent.rpc.resolver import RPC
 from agent.rpc.message import RPCMsgType, RPCPayload
 from agent.logger import FileLogger, LoggerName
 from agent.config import Config
-from typing import MutableMapping
+from agent.pcapng import SecretsPcapng
+from typing import MutableMapping, Optional
 from pathlib import Path
 from threading import Lock
+import atexit
 
 
 _SSL_SECRET_FILELOGGER: MutableMapping[str, FileLogger] = {}
@@ -27,10 +29,31 @@ def __get_secret_logger(tag: str) -> FileLogger:
     return logger
 
 
+_SSL_PCAPNG: Optional[SecretsPcapng] = None
+_SSL_PCAPNG_LOCK: Lock = Lock()
+
+def __get_secret_pcapng() -> Optional[SecretsPcapng]:
+    global _SSL_PCAPNG
+
+    conf = Config.get().script.nettools.ssl_pcapng
+    if conf is None:
+        return None
+    if _SSL_PCAPNG is None:
+        with _SSL_PCAPNG_LOCK:
+            if _SSL_PCAPNG is None:
+                _SSL_PCAPNG = SecretsPcapng(conf.output, conf.capture, conf.follow).start()
+                atexit.register(_SSL_PCAPNG.stop)
+    return _SSL_PCAPNG
+
+
 
 @RPC.on_message(RPCMsgType.SSL_SECRET)
 def ssl_log_secret(payload: RPCPayload):
     tag = Path(payload.message.data.tag)
-    logger = __get_secret_logger(tag.name)
     data = payload.message.data
-    print(f'{data.label} {data.client_random} {data.secret}', file=logger)
\ No newline at end of file
+    if Config.get().script.nettools.ssl_log_secret:
+        logger = __get_secret_logger(tag.name)
+        print(f'{data.label} {data.client_random} {data.secret}', file=logger)
+    pcapng = __get_secret_pcapng()
+    if pcapng is not None:
+        pcapng.add_secret(data.label, data.client_random, data.secret)
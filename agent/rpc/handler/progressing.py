@@ -2,14 +2,14 @@
 from agent.rpc.resolver import RPC
 from agent.rpc.message import RPCMsgType, RPCPayload
 from agent.logger import LoggerName, get_logger
+from agent.progress import PROGRESS
 
 
 
 @RPC.on_message(RPCMsgType.PROGRESSING)
 def on_progressing(payload: RPCPayload):
     data = payload.message.data
+    PROGRESS.update(data.tag, data.id, data.step, data.time, data.extra, data.error)
+    # 错误仍逐条输出, 普通step由PROGRESS限频汇总
     if data.error:
-        print(f"[x] | {data.tag} | {data.step} => {data.error}", file=get_logger(LoggerName.stderr))
-    else:
-        print(f"[~] | {data.tag} | {data.step} => {data.extra.get('intro', ','.join(list(data.extra.keys())))}", 
-              file=get_logger(LoggerName.stdout))
\ No newline at end of file
+        print(f"[x] | {data.tag} | {data.id}:{data.step} => {data.error}", file=get_logger(LoggerName.stderr))
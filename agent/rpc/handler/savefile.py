@@ -0,0 +1,70 @@
+from agent.rpc.resolver import RPC
+from agent.rpc.message import RPCMsgType, RPCPayload
+from agent.store.chunk import get_chunk_store
+from agent.elf.module import ElfImage
+from agent.elf.symcache import get_symbol_store
+from agent.procmaps import PROC_MAPS
+from agent.symbolize import get_symbolizer
+from agent.pipeline import get_pipeline
+from agent.config import Config
+from agent.utils import ensure_filepath
+from typing import Final, FrozenSet
+from pathlib import Path
+import colorama
+
+
+# 会被反复dump的来源, 按内容分块去重存储
+CHUNKED_SOURCES: Final[FrozenSet[str]] = frozenset([
+    'elfModule',
+    'procMaps',
+])
+
+
+@RPC.on_message(RPCMsgType.SAVE_FILE)
+def save_file(payload: RPCPayload):
+    data = payload.message.data
+    buff = payload.data or b''
+    name = Path(data.filepath).name
+    if data.source == 'procMaps' and data.pid is None:
+        diff = PROC_MAPS.update(buff.decode('utf-8', errors='replace'))
+        print(f'[procMaps] {PROC_MAPS} +{len(diff.added)} -{len(diff.removed)}')
+
+    store = get_chunk_store()
+    if store is None:
+        print(f'{colorama.Fore.MAGENTA}[{data.source}] {data.filepath} {len(buff)}<drop>{colorama.Fore.RESET}')
+        return
+
+    if data.source in CHUNKED_SOURCES:
+        meta = {'filepath': data.filepath}
+        if data.module:
+            meta['module'] = data.module
+        if data.build_id:
+            meta['build_id'] = data.build_id
+        manifest = store.put(name, buff, data.source, meta)
+        print(f'{colorama.Fore.GREEN}[{data.source}] {manifest.id} {len(buff)} (+{manifest.meta["new_bytes"]}){colorama.Fore.RESET}')
+        if data.source == 'elfModule' and data.module:
+            # 之前没找到该模块符号的回溯, 之后可以用这份dump符号化
+            get_symbolizer().invalidate(data.module)
+        if data.source == 'elfModule' and Config.get().agent.symbol_cache:
+            try:
+                tables = get_symbol_store().put_image(ElfImage(buff, is_image=True))
+                print(f'[symcache] {tables}')
+            except (ValueError, IndexError) as e:
+                print(f'[symcache] {name} 解析失败: {e}')
+        pipeline = get_pipeline()
+        if pipeline is not None:
+            pipeline.submit(data.source, name, data=buff, sha256=manifest.sha256, meta=meta)
+    else:
+        filepath = Path(Config.get().agent.datadir) / data.source / name
+        if 'a' in data.mode:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            mode = 'ab'
+        else:
+            ensure_filepath(str(filepath))
+            mode = 'wb'
+        with open(filepath, mode) as f:
+            f.write(buff)
+        print(f'{colorama.Fore.GREEN}[{data.source}] {filepath} {len(buff)}{colorama.Fore.RESET}')
+        pipeline = get_pipeline()
+        if pipeline is not None:
+            pipeline.submit(data.source, name, path=filepath)
@@ -0,0 +1,48 @@
+from agent.rpc.resolver import RPC
+from agent.rpc.message import RPCMsgType, RPCMsgSource, RPCPayload, unpack_batch_payload
+from agent.snapshot import get_snapshots
+from agent.pipeline import get_pipeline
+import colorama
+
+
+def _on_state(data):
+    snapshots = get_snapshots()
+    if snapshots is None:
+        return
+    snapshot = snapshots.get(data.tag)
+    if data.state == 'begin':
+        snapshot.begin(data.ranges)
+        print(f'[snapshot] {snapshot}')
+    elif data.state == 'range':
+        snapshot.mark_done(int(data.base, 16))
+    elif data.state == 'end':
+        snapshot.finish()
+        print(f'{colorama.Fore.GREEN}[snapshot] {snapshot} {snapshot.root}{colorama.Fore.RESET}')
+        pipeline = get_pipeline()
+        if pipeline is not None:
+            pipeline.submit('snapshot', data.tag, path=snapshot.data_path)
+
+
+@RPC.on_message(RPCMsgType.SNAPSHOT)
+def on_snapshot(payload: RPCPayload):
+    _on_state(payload.message.data)
+
+
+@RPC.on_batch(RPCMsgSource.snapshot)
+def on_snapshot_batch(payload: RPCPayload):
+    snapshots = get_snapshots()
+    if snapshots is None:
+        print(f'{colorama.Fore.MAGENTA}[snapshot] 未配置datadir {len(payload.data or b"")}<drop>{colorama.Fore.RESET}')
+        return
+    chunks = {}
+    for item in unpack_batch_payload(payload):
+        data = item.message.data
+        if item.message.type == RPCMsgType.SNAPSHOT_CHUNK.value:
+            chunks.setdefault(data.tag, []).append((int(data.address, 16), item.data or b''))
+            continue
+        # 区间完成标记之前的数据需先落盘
+        if data.tag in chunks:
+            snapshots.get(data.tag).write_many(chunks.pop(data.tag), snapshots.executor)
+        _on_state(data)
+    for tag, items in chunks.items():
+        snapshots.get(tag).write_many(items, snapshots.executor)
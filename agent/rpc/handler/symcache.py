@@ -0,0 +1,8 @@
+from agent.rpc.resolver import RPC
+from agent.rpc.message import RPCMsgType, RPCPayload
+
+
+@RPC.on_message(RPCMsgType.SYMBOL_CACHE)
+def on_symbol_cache(payload: RPCPayload):
+    # 查询由 SymbolCacheServer 回复给发起请求的脚本, 这里只避免落入默认处理器
+    pass
@@ -1,7 +1,7 @@
 from enum import Enum, unique
 from dataclasses import dataclass
 from typing import Union, List, Optional, Dict, Any, Tuple, Callable
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic_core import core_schema
 from pydantic import GetCoreSchemaHandler
 
@@ -17,6 +17,14 @@ class RPCMsgType(Enum):
     SAVE_FILE: str = 'SAVE_FILE'
     SSL_SECRET: str = 'SSL_SECRET'
     PROGRESSING: str = 'PROGRESSING'
+    FLOW_CONTROL: str = 'FLOW_CONTROL'
+    SEND_RULE_STATS: str = 'SEND_RULE_STATS'
+    BACKTRACE: str = 'BACKTRACE'
+    SYMBOL_CACHE: str = 'SYMBOL_CACHE'
+    EVENT_SCHEMA: str = 'EVENT_SCHEMA'
+    EVENT: str = 'EVENT'
+    SNAPSHOT: str = 'SNAPSHOT'
+    SNAPSHOT_CHUNK: str = 'SNAPSHOT_CHUNK'
 
     @classmethod
     def __get_pydantic_core_schema__(
@@ -27,6 +35,9 @@ class RPCMsgType(Enum):
 
 @unique
 class RPCMsgSource(Enum):
+    backtrace: str = 'backtrace'
+    event: str = 'event'
+    snapshot: str = 'snapshot'
 
     @classmethod
     def __get_pydantic_core_schema__(
@@ -46,6 +57,8 @@ class NativePointer(str):
 class RPCMsg_INIT_CONFIG(BaseModel):
     OnRPC: bool = True
     LogCollapse: bool = False
+    SendRules: List[Dict[str, Any]] = []
+    SymbolCache: bool = False
     
 
 class RPCMsg_ERROR(BaseModel):
@@ -69,7 +82,11 @@ class RPCMsg_SCOPE_GET(BaseModel):
 
 
 class RPCMsg_ENUMERATE_OBJ_PROPS(BaseModel):
+    # props为对象自身的属性, 原型链上的属性按shape下发, 主机已缓存的shape不再重复发送
     props: List[Dict[str, Any]] = [{}]
+    shapes: List[int] = []
+    shape_props: Dict[int, Dict[str, Any]] = {}
+    epoch: str = ''
 
 
 class RPCMsg_BATCH(BaseModel):
@@ -81,6 +98,11 @@ class RPCMsg_SAVE_FILE(BaseModel):
     source: str
     filepath: str
     mode: str
+    # 内容来自其他进程时为其pid(如其他进程的maps)
+    pid: Optional[int] = None
+    # elfModule: 模块路径与build-id, 用于按模块查找dump, 与tag无关
+    module: Optional[str] = None
+    build_id: Optional[str] = None
 
 
 class RPCMsg_SSL_SECRET(BaseModel):
@@ -104,6 +126,51 @@ class RPCMsg_PROGRESSING(BaseModel):
     error: Optional[RPC_ErrorMsg] = None
 
 
+class RPCMsg_FLOW_CONTROL(BaseModel):
+    batch_size: int
+    batch_bytes: int
+    max_age: int
+    credit: int = -1
+
+class RPCMsg_SEND_RULE_STATS(BaseModel):
+    stats: List[Dict[str, Any]]
+
+class RPCMsg_BACKTRACE(BaseModel):
+    tag: str
+    tid: int
+    time: int
+
+class RPCMsg_SYMBOL_CACHE(BaseModel):
+    # agent请求时只带 build_id/name, 主机回复时附带 tables 描述二进制数据的布局
+    build_id: str
+    name: str
+    hit: bool = False
+    tables: List[Dict[str, Any]] = []
+
+class RPCMsg_EVENT_SCHEMA(BaseModel):
+    name: str
+    # [(字段名, numpy类型码)], ptr按u64
+    fields: List[Tuple[str, str]]
+
+
+class RPCMsg_EVENT(BaseModel):
+    schema_name: str = Field(alias='schema')
+    count: int
+
+
+class RPCMsg_SNAPSHOT(BaseModel):
+    tag: str
+    # begin: 附带全部区间; range: 区间base已发送完毕; end: 快照结束
+    state: str
+    ranges: List[Dict[str, Any]] = []
+    base: Optional[NativePointer] = None
+
+
+class RPCMsg_SNAPSHOT_CHUNK(BaseModel):
+    tag: str
+    address: NativePointer
+    size: int
+
 
 RPCMsgData = Union[
     RPCMsg_ERROR,
@@ -116,6 +183,14 @@ RPCMsgData = Union[
     RPCMsg_SAVE_FILE,
     RPCMsg_SSL_SECRET,
     RPCMsg_PROGRESSING,
+    RPCMsg_FLOW_CONTROL,
+    RPCMsg_SEND_RULE_STATS,
+    RPCMsg_BACKTRACE,
+    RPCMsg_SYMBOL_CACHE,
+    RPCMsg_EVENT_SCHEMA,
+    RPCMsg_EVENT,
+    RPCMsg_SNAPSHOT,
+    RPCMsg_SNAPSHOT_CHUNK,
 ]
 
 
@@ -1,17 +1,20 @@
 
 import functools
-from typing import Final, List, Optional, Set, Mapping, MutableMapping, Callable, Any
+from typing import Final, List, Optional, Set, Mapping, MutableMapping, Callable, Any, Union
 from frida.core import Script, ScriptMessage, ScriptErrorMessage
 from agent.rpc.message import (
     RPCMsgData, RPCMsgType, RPCMessage, 
     RPCMsgSource, RPCPayload, unpack_batch_payload, 
     register_payload_on_batch_default_handler, 
     register_payload_on_message_default_handler)
+from agent.rpc.stream import Subscription, SubscribeKey, Overflow
 from agent.config import Config
 from datetime import datetime
 from enum import Enum
+from threading import Lock
 import colorama
 import json
+import time
 import sys
 import os
 
@@ -21,34 +24,62 @@ class RPCResolver:
     _typ_handler: MutableMapping[str, Callable[[RPCPayload], None]]
     _batch_source_handler: MutableMapping[str, Callable[[List[RPCPayload]], None]]
     _exc_handler: Optional[Callable[[ScriptErrorMessage, Optional[bytes]], None]]
+    _subscribers: MutableMapping[str, List[Subscription]]
+    _sub_lock: Lock
+    # 收到的原始payload在分发前交给记录器, 参数为 (payload, data)
+    _recorder: Optional[Callable[[dict, Optional[bytes]], None]]
     _global: bool = False
 
+    # 单条消息处理耗时的指数移动平均(秒), 批次按其中的消息数均摊, 供流控参考
+    handler_latency: float = 0.0
+    HANDLER_LATENCY_ALPHA: Final[float] = 0.1
+
     def __init__(self):
         self._scripts = set()
         self._typ_handler = {}
         self._batch_source_handler = {}
         self._exc_handler = None
+        self._subscribers = {}
+        self._sub_lock = Lock()
+        self._recorder = None
+
+    def set_recorder(self, recorder: Optional[Callable[[dict, Optional[bytes]], None]]):
+        self._recorder = recorder
 
     def register_script(self, script: Script):
         if script not in self._scripts:
             script.on('message', self._on_message_handler)
             self._scripts.add(script)
 
+    def unregister_script(self, script: Script):
+        if script in self._scripts:
+            script.off('message', self._on_message_handler)
+            self._scripts.discard(script)
+
     def _on_message_handler(self, message: ScriptMessage, data: Optional[bytes]):
         if message['type'] == 'send':
             msg = RPCMessage.model_validate(message.get('payload', {}))
+            if self._recorder is not None:
+                self._recorder(message.get('payload', {}), data)
             
             handler = None
-            if msg.type == RPCMsgType.BATCH:
+            if msg.type == RPCMsgType.BATCH.value:
                 handler = self._batch_source_handler.get(msg.source, None)
-                payload = RPCPayload(message, data)
+                payload = RPCPayload(message=msg, data=data)
+                self._publish(payload)
                 if handler is None:
                     handler = self._default_batch_handler
-                handler(payload)
+                else:
+                    # 自定义批处理器不会逐条分发, 内部消息在这里发布给订阅者
+                    self._publish_batch(payload)
+                # 批次越大单次调用越慢, 按消息数均摊, 否则流控放大批次会反过来推高负载
+                self._timed_call(handler, payload, len(msg.data.message_list))
             else:
+                payload = RPCPayload(message=msg, data=data)
+                self._publish(payload)
                 handler = self._get_handler(msg.type)
                 if handler:
-                    handler(RPCPayload(message=msg, data=data))
+                    self._timed_call(handler, payload)
 
         elif message['type'] == 'error':
             if self._exc_handler:
@@ -56,6 +87,22 @@ class RPCResolver:
             else:
                 print(json.dumps(message, ensure_ascii=False), file=sys.stderr)
         
+    def _timed_call(self, handler: Callable[[RPCPayload], None], payload: RPCPayload, count: int = 1):
+        start = time.perf_counter()
+        try:
+            handler(payload)
+        finally:
+            cost = (time.perf_counter() - start) / max(count, 1)
+            self.handler_latency += (cost - self.handler_latency) * self.HANDLER_LATENCY_ALPHA
+
+    def queue_fill(self) -> float:
+        # 只反映订阅者缓冲的占用率, 没有订阅者时恒为0; frida消息线程上的积压无法观测, 由handler_latency体现
+        fill = 0.0
+        for subs in self._subscribers.values():
+            for sub in subs:
+                fill = max(fill, len(sub) / sub.maxsize)
+        return fill
+
     def _get_handler(self, typ: str) -> Callable[[RPCPayload], None]:
         handler = self._typ_handler.get(typ, None)
         if handler is None:
@@ -81,10 +128,50 @@ class RPCResolver:
     def _default_batch_handler(self, payload: RPCPayload):
         payload_list = unpack_batch_payload(payload)
         for payload in payload_list:
-            msg, data = payload.message, payload.data
-            handler = self._get_handler(msg.type)
+            self._publish(payload)
+            handler = self._get_handler(payload.message.type)
             if handler:
-                handler(msg, data)
+                handler(payload)
+
+    def _publish_batch(self, payload: RPCPayload):
+        if not self._subscribers:
+            return
+        for item in unpack_batch_payload(payload):
+            self._publish(item)
+
+    def _publish(self, payload: RPCPayload):
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        msg = payload.message
+        for key in (msg.type, msg.source):
+            if key is None:
+                continue
+            for sub in subscribers.get(key, ()):
+                sub.put(payload)
+
+    def subscribe(
+        self, key: SubscribeKey, maxsize: int = 1024, overflow: Union[Overflow, str] = Overflow.drop_oldest,
+    ) -> Subscription:
+        if isinstance(key, Enum):
+            key = key.value
+        sub = Subscription(key, maxsize, overflow, on_close=self._unsubscribe)
+        with self._sub_lock:
+            # 写时复制, 分发线程无需加锁
+            subscribers = dict(self._subscribers)
+            subscribers[key] = subscribers.get(key, []) + [sub]
+            self._subscribers = subscribers
+        return sub
+
+    def _unsubscribe(self, sub: Subscription):
+        with self._sub_lock:
+            subscribers = dict(self._subscribers)
+            remain = [v for v in subscribers.get(sub.key, []) if v is not sub]
+            if remain:
+                subscribers[sub.key] = remain
+            else:
+                subscribers.pop(sub.key, None)
+            self._subscribers = subscribers
 
     def on_exception(self, func: Callable[[RPCPayload], None]) -> Callable[[RPCPayload], None]:
         self._exc_handler = func
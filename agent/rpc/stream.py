@@ -0,0 +1,157 @@
+from typing import Final, Optional, Deque, List, Union, Callable
+from agent.rpc.message import RPCPayload, RPCMsgType, RPCMsgSource
+from collections import deque
+from threading import Condition
+from enum import Enum
+import asyncio
+import time
+
+
+class Overflow(Enum):
+    # 缓冲区满时丢弃最旧的消息, 不阻塞frida线程
+    drop_oldest: str = 'drop_oldest'
+    # 缓冲区满时阻塞frida线程直到消费者取走消息
+    block: str = 'block'
+
+
+SubscribeKey = Union[RPCMsgType, RPCMsgSource, str]
+
+
+class SubscriptionClosed(Exception):
+    pass
+
+
+class Subscription:
+    key: Final[str]
+    maxsize: Final[int]
+    overflow: Final[Overflow]
+    dropped: int
+
+    _buffer: Deque[RPCPayload]
+    _cond: Condition
+    _closed: bool
+    _async_waiters: List[Callable[[], None]]
+    _on_close: Optional[Callable[['Subscription'], None]]
+
+    def __init__(
+        self, key: str, maxsize: int = 1024, overflow: Union[Overflow, str] = Overflow.drop_oldest,
+        on_close: Optional[Callable[['Subscription'], None]] = None,
+    ):
+        if maxsize <= 0:
+            raise ValueError(f'maxsize[{maxsize}] 必须大于0')
+        self.key = key
+        self.maxsize = maxsize
+        self.overflow = Overflow(overflow)
+        self.dropped = 0
+        self._buffer = deque()
+        self._cond = Condition()
+        self._closed = False
+        self._async_waiters = []
+        self._on_close = on_close
+
+    def __repr__(self):
+        return f'<Subscription({self.key}) [{len(self._buffer)}/{self.maxsize}] dropped={self.dropped}>'
+
+    def __len__(self):
+        return len(self._buffer)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, payload: RPCPayload) -> bool:
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._buffer) >= self.maxsize:
+                if self.overflow is Overflow.drop_oldest:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                else:
+                    while not self._closed and len(self._buffer) >= self.maxsize:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+            self._buffer.append(payload)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for wake in waiters:
+            wake()
+        return True
+
+    def get(self, timeout: Optional[float] = None) -> RPCPayload:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._buffer:
+                if self._closed:
+                    raise SubscriptionClosed(self.key)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(self.key)
+                self._cond.wait(remaining)
+            payload = self._buffer.popleft()
+            self._cond.notify_all()
+            return payload
+
+    def get_nowait(self) -> Optional[RPCPayload]:
+        with self._cond:
+            if not self._buffer:
+                if self._closed:
+                    raise SubscriptionClosed(self.key)
+                return None
+            payload = self._buffer.popleft()
+            self._cond.notify_all()
+            return payload
+
+    async def get_async(self) -> RPCPayload:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._buffer:
+                    payload = self._buffer.popleft()
+                    self._cond.notify_all()
+                    return payload
+                if self._closed:
+                    raise SubscriptionClosed(self.key)
+                fut = loop.create_future()
+
+                def wake(fut: asyncio.Future = fut):
+                    loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+                self._async_waiters.append(wake)
+            await fut
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for wake in waiters:
+            wake()
+        if self._on_close:
+            self._on_close(self)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self) -> 'Subscription':
+        return self
+
+    def __next__(self) -> RPCPayload:
+        try:
+            return self.get()
+        except SubscriptionClosed:
+            raise StopIteration
+
+    def __aiter__(self) -> 'Subscription':
+        return self
+
+    async def __anext__(self) -> RPCPayload:
+        try:
+            return await self.get_async()
+        except SubscriptionClosed:
+            raise StopAsyncIteration
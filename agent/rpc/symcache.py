@@ -0,0 +1,64 @@
+from typing import Final, Optional, TYPE_CHECKING
+from agent.rpc.message import RPCMessage, RPCMsgType, RPCMsg_SYMBOL_CACHE
+from agent.elf.symcache import SymbolStore
+from frida.core import Script, ScriptMessage
+import frida
+import sys
+
+
+if TYPE_CHECKING:
+    from agent.session import ScriptWrapper
+
+
+class SymbolCacheServer:
+    # 应答agent端ElfModuleX加载时的符号表查询. 需要回复到发起请求的脚本, 因此直接挂在脚本的message信号上
+    store: Final[SymbolStore]
+    hits: int
+    misses: int
+
+    _wrapper: 'ScriptWrapper'
+    _script: Optional[Script]
+
+    def __init__(self, wrapper: 'ScriptWrapper', store: SymbolStore):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._wrapper = wrapper
+        self._script = None
+
+    def bind(self, script: Script) -> 'SymbolCacheServer':
+        self.unbind()
+        script.on('message', self._on_message)
+        self._script = script
+        return self
+
+    def unbind(self):
+        if self._script is not None:
+            self._script.off('message', self._on_message)
+            self._script = None
+
+    def _on_message(self, message: ScriptMessage, data: Optional[bytes]):
+        if message['type'] != 'send':
+            return
+        payload = message.get('payload')
+        if not isinstance(payload, dict) or payload.get('type') != RPCMsgType.SYMBOL_CACHE.value:
+            return
+        query = RPCMsg_SYMBOL_CACHE.model_validate(payload.get('data', {}))
+        reply = RPCMsg_SYMBOL_CACHE(build_id=query.build_id, name=query.name)
+        buff = None
+        try:
+            tables = self.store.lookup(query.build_id, query.name)
+        except Exception as e:
+            print(f'[SymbolCache] {query.name}({query.build_id}) 查询失败: {e}', file=sys.stderr)
+            tables = None
+        if tables is not None and tables.tables:
+            reply.tables, buff = tables.encode()
+            reply.hit = True
+            self.hits += 1
+        else:
+            self.misses += 1
+        try:
+            # agent在 recv().wait() 上阻塞, 无论是否命中都必须回复
+            self._wrapper.post(RPCMessage(type=RPCMsgType.SYMBOL_CACHE.value, data=reply), buff)
+        except (frida.InvalidOperationError, frida.TransportError) as e:
+            print(f'[SymbolCache] post失败: {e}', file=sys.stderr)
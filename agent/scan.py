@@ -0,0 +1,210 @@
+from typing import Final, Optional, List, Tuple, NamedTuple, Iterable, Iterator, Union
+from concurrent.futures import ProcessPoolExecutor
+from agent.store.chunk import ChunkStore, Manifest
+from pathlib import Path
+import numpy as np
+import mmap
+import os
+
+
+DEFAULT_CHUNK_SIZE: Final[int] = 16 << 20
+
+
+class ScanMatch(NamedTuple):
+    # 与 Memory.scanSync 返回的 MemoryScanMatch 一致
+    address: int
+    size: int
+
+    def toJSON(self):
+        return {'address': hex(self.address), 'size': self.size}
+
+
+class ScanPattern:
+    # frida Memory.scan 语法: "13 37 ?? f? : ff ff 00 f0"
+    pattern: Final[str]
+    values: Final[np.ndarray]
+    mask: Final[np.ndarray]
+    # 最长的全掩码字节串, 用作预过滤锚点
+    anchor: Final[bytes]
+    anchor_offset: Final[int]
+
+    def __init__(self, pattern: str):
+        pattern = pattern.strip()
+        if pattern.startswith('/') and pattern.endswith('/'):
+            raise ValueError('Regular expression patterns are not allowed')
+        bytes_part, _, mask_part = pattern.partition(':')
+        tokens = bytes_part.split()
+        if not tokens:
+            raise ValueError(f'pattern[{pattern}] 为空')
+
+        values = np.zeros(len(tokens), dtype=np.uint8)
+        mask = np.zeros(len(tokens), dtype=np.uint8)
+        for i, token in enumerate(tokens):
+            if len(token) != 2:
+                raise ValueError(f'pattern[{pattern}] 非法字节: {token}')
+            value, m = 0, 0
+            for c in token:
+                value <<= 4
+                m <<= 4
+                if c != '?':
+                    value |= int(c, 16)
+                    m |= 0xf
+            values[i], mask[i] = value, m
+
+        mask_tokens = mask_part.split()
+        if mask_tokens:
+            if len(mask_tokens) != len(tokens):
+                raise ValueError(f'pattern[{pattern}] 掩码长度与字节数不一致')
+            mask &= np.array([int(v, 16) for v in mask_tokens], dtype=np.uint8)
+        values &= mask
+
+        self.pattern = pattern
+        self.values = values
+        self.mask = mask
+        self.anchor, self.anchor_offset = self._pick_anchor()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f'<ScanPattern "{self.pattern}" anchor={self.anchor.hex()}@{self.anchor_offset}>'
+
+    def _pick_anchor(self) -> Tuple[bytes, int]:
+        best = (0, 0)
+        start = None
+        for i, m in enumerate(self.mask.tolist() + [0]):
+            if m == 0xff:
+                if start is None:
+                    start = i
+            elif start is not None:
+                if i - start > best[1] - best[0]:
+                    best = (start, i)
+                start = None
+        return self.values[best[0]: best[1]].tobytes(), best[0]
+
+    def match(self, data: Union[bytes, mmap.mmap], start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        # 返回 data 中起始偏移位于 [start, stop) 的所有匹配
+        size = len(data)
+        n = len(self)
+        last = size - n + 1
+        stop = last if stop is None else min(stop, last)
+        if stop <= start:
+            return np.empty(0, dtype=np.int64)
+
+        if self.anchor:
+            candidates = []
+            pos = data.find(self.anchor, start + self.anchor_offset)
+            while pos >= 0:
+                begin = pos - self.anchor_offset
+                if begin >= stop:
+                    break
+                candidates.append(begin)
+                pos = data.find(self.anchor, pos + 1)
+            candidates = np.array(candidates, dtype=np.int64)
+        else:
+            candidates = np.arange(start, stop, dtype=np.int64)
+
+        if not len(candidates) or len(self.anchor) == n:
+            return candidates
+
+        arr = np.frombuffer(data, dtype=np.uint8, count=size)
+        matched = []
+        # 分批校验, 避免候选过多时窗口矩阵过大
+        for i in range(0, len(candidates), 1 << 16):
+            batch = candidates[i: i + (1 << 16)]
+            windows = arr[batch[:, None] + np.arange(n)]
+            ok = ((windows & self.mask) == self.values).all(axis=1)
+            matched.append(batch[ok])
+        del arr
+        return np.concatenate(matched)
+
+
+def _scan_file_range(args: Tuple[str, str, int, int, int, int]) -> List[ScanMatch]:
+    path, pattern, offset, length, overlap, base = args
+    pat = ScanPattern(pattern)
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        end = min(file_size, offset + length + overlap)
+        if end <= offset:
+            return []
+        # mmap偏移需按分配粒度对齐
+        aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(f.fileno(), end - aligned, access=mmap.ACCESS_READ, offset=aligned) as mm:
+            hits = pat.match(mm, offset - aligned, offset - aligned + length)
+    return [ScanMatch(base + aligned + int(v), len(pat)) for v in hits.tolist()]
+
+
+def _scan_bytes_range(args: Tuple[bytes, str, int, int]) -> List[ScanMatch]:
+    data, pattern, limit, base = args
+    pat = ScanPattern(pattern)
+    return [ScanMatch(base + int(v), len(pat)) for v in pat.match(data, 0, limit).tolist()]
+
+
+def iter_scan_file(
+    path: Union[str, Path], pattern: str, base: int = 0,
+    workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[ScanMatch]:
+    # 按地址顺序流式返回结果, 各分块由worker进程各自mmap同一文件
+    pat = ScanPattern(pattern)
+    path = str(path)
+    size = os.path.getsize(path)
+    overlap = len(pat) - 1
+    jobs = [(path, pattern, off, min(chunk_size, size - off), overlap, base) for off in range(0, size, chunk_size)]
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield from _scan_file_range(job)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        for part in pool.map(_scan_file_range, jobs):
+            yield from part
+
+
+def iter_scan_bytes(
+    data: Union[bytes, memoryview], pattern: str, base: int = 0,
+    workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[ScanMatch]:
+    pat = ScanPattern(pattern)
+    view = data if isinstance(data, bytes) else bytes(data)
+    overlap = len(pat) - 1
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(view) <= chunk_size:
+        for v in pat.match(view).tolist():
+            yield ScanMatch(base + v, len(pat))
+        return
+    jobs = [
+        (view[off: off + chunk_size + overlap], pattern, chunk_size, base + off)
+        for off in range(0, len(view), chunk_size)
+    ]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        for part in pool.map(_scan_bytes_range, jobs):
+            yield from part
+
+
+def iter_scan_stream(chunks: Iterable[bytes], pattern: str, base: int = 0) -> Iterator[ScanMatch]:
+    # 对按顺序到达的数据块做扫描, 块尾保留 len(pattern)-1 字节与下一块拼接
+    pat = ScanPattern(pattern)
+    overlap = len(pat) - 1
+    carry = b''
+    offset = 0
+    for chunk in chunks:
+        buf = carry + chunk
+        for v in pat.match(buf, 0, len(buf) - overlap).tolist():
+            yield ScanMatch(base + offset + v, len(pat))
+        keep = min(overlap, len(buf))
+        carry = buf[len(buf) - keep:] if keep else b''
+        offset += len(buf) - keep
+
+
+def iter_scan_manifest(store: ChunkStore, manifest: Union[Manifest, str], pattern: str, base: int = 0) -> Iterator[ScanMatch]:
+    if isinstance(manifest, str):
+        manifest = store.load(manifest)
+    return iter_scan_stream(store.iter_chunks(manifest), pattern, base)
+
+
+def scan_file(path: Union[str, Path], pattern: str, base: int = 0, **kwargs) -> List[ScanMatch]:
+    return list(iter_scan_file(path, pattern, base, **kwargs))
+
+
+def scan_bytes(data: Union[bytes, memoryview], pattern: str, base: int = 0, **kwargs) -> List[ScanMatch]:
+    return list(iter_scan_bytes(data, pattern, base, **kwargs))
@@ -1,9 +1,16 @@
 from frida.core import Script, Session, ScriptExportsSync, ScriptExportsAsync, SessionDetachedCallback
-from typing import Final, Optional, Dict, Tuple, Protocol, List, Callable, Any, Literal, Set, FrozenSet, overload
+from typing import Final, Optional, Dict, Tuple, Protocol, List, Callable, Any, Literal, Set, FrozenSet, Union, overload
 from agent.rpc.message import RPCMsg_INIT_CONFIG, RPCMessage, RPCPayload, RPCMsgType, RPCMsgSource
 from agent.rpc.resolver import RPCResolver, RPC
+from agent.rpc.stream import Subscription, SubscribeKey, Overflow
+from agent.rpc.flow import FlowController
+from agent.rpc.symcache import SymbolCacheServer
+from agent.elf.symcache import SymbolStore, get_symbol_store
+from agent.snapshot import MemorySnapshot, get_snapshots
+from agent.config import FlowControl, SendRule, LogCollapse
+from agent.logcollapse import LogCollapser
 from agent.rpc.exports import ScriptExportsSyncWrapper
-from agent.rpc.handler.js_handle import JsHandle
+from agent.rpc.handler.js_handle import JsHandle, PROPS_CACHE
 from agent.logger import FileLogger, LoggerName
 from prompt_toolkit.layout.containers import HSplit, VSplit
 from datetime import datetime
@@ -64,10 +71,17 @@ class ScriptWrapper:
     def on_exception(self, func: Callable[[RPCPayload], None]) -> Callable[[RPCPayload], None]: ...
     def on_message(self, typ: RPCMsgType): ...
     def on_batch(self, source: RPCMsgSource): ...
+    def subscribe(self, key: SubscribeKey, maxsize: int = 1024, overflow: Union[Overflow, str] = Overflow.drop_oldest) -> Subscription: ...
     
     _script: Script
     _env: ScriptEnv
     _resolver: RPCResolver
+    _jsfile: Optional[str] = None
+    _source: Optional[str] = None
+    _log_handler: Optional[Callable[[str, str], None]] = None
+    _log_collapser: Optional[LogCollapser] = None
+    _flow_controller: Optional[FlowController] = None
+    _symbol_cache_server: Optional[SymbolCacheServer] = None
 
     __SCRIPT_EXPORT__: Final[FrozenSet[str]] = frozenset([
         'load', 'unload', 'eternalize', 
@@ -78,7 +92,7 @@ class ScriptWrapper:
     ])
 
     __RESOLVER_EXPORT__: Final[FrozenSet[str]] = frozenset([
-        'on_exception', 'on_message', 'on_batch', 
+        'on_exception', 'on_message', 'on_batch', 'subscribe',
     ])
 
     def __init__(self, script: Script, env: ScriptEnv, resolver: Optional[RPCResolver] = None) -> 'ScriptWrapper':
@@ -91,6 +105,17 @@ class ScriptWrapper:
         resolver.register_script(script)
         self.exports_sync = ScriptExportsSyncWrapper(script)
 
+    def rebind(self, script: Script) -> None:
+        self._resolver.unregister_script(self._script)
+        self._script = script
+        self._resolver.register_script(script)
+        self.exports_sync = ScriptExportsSyncWrapper(script)
+        PROPS_CACHE.reset()
+        if self._log_handler is not None:
+            script.set_log_handler(self._log_handler)
+        if self._symbol_cache_server is not None:
+            self._symbol_cache_server.bind(script)
+
     def post(self, message: RPCMessage, data: Optional[bytes] = None) -> None:
         self._script.post(message.model_dump(), data)
 
@@ -104,7 +129,7 @@ class ScriptWrapper:
     def __dir__(self):
         return tuple(object.__dir__(self)) + tuple(ScriptWrapper.__SCRIPT_EXPORT__) + tuple(ScriptWrapper.__RESOLVER_EXPORT__)
 
-    def set_logger(self, stdout: Optional[str] = None, stderr: Optional[str] = None):
+    def set_logger(self, stdout: Optional[str] = None, stderr: Optional[str] = None, collapse: Optional[LogCollapse] = None):
         err = sys.stderr
         out = sys.stdout
         if stdout == stderr:
@@ -125,8 +150,58 @@ class ScriptWrapper:
             else:
                 print(text, file=err)
 
+        if self._log_collapser is not None:
+            self._log_collapser.stop()
+            self._log_collapser = None
+        if collapse is not None and collapse.enable:
+            self._log_collapser = LogCollapser(handler, collapse).start()
+            handler = self._log_collapser
+
+        self._log_handler = handler
         self.set_log_handler(handler)
 
+    def start_flow_control(self, conf: Optional[FlowControl] = None) -> FlowController:
+        if self._flow_controller is None or self._flow_controller.stopped:
+            if conf is None and self._flow_controller is not None:
+                conf = self._flow_controller.conf
+            self._flow_controller = FlowController(self, self._resolver, conf or FlowControl()).start()
+        return self._flow_controller
+
+    def stop_flow_control(self):
+        if self._flow_controller is not None:
+            self._flow_controller.stop()
+            self._flow_controller = None
+
+    def serve_symbol_cache(self, store: Optional[SymbolStore] = None) -> Optional[SymbolCacheServer]:
+        # 需在load前调用: 脚本顶层代码创建ElfModuleX时就会同步等待应答
+        store = store or get_symbol_store()
+        if store is None:
+            print(f'[SymbolCache] 未配置datadir, 不启用符号缓存', file=sys.stderr)
+            return None
+        if self._symbol_cache_server is None:
+            self._symbol_cache_server = SymbolCacheServer(self, store).bind(self._script)
+        return self._symbol_cache_server
+
+    def update_send_rules(self, rules: List[SendRule]) -> None:
+        send_rules = [v.model_dump(exclude_none=True) for v in rules]
+        self._env = self._env.model_copy(update={'SendRules': send_rules})
+        self.post(RPCMessage(type=RPCMsgType.INIT_CONFIG.value, data=RPCMsg_INIT_CONFIG(**self._env.model_dump())))
+
+    def send_rule_stats(self) -> List[Dict[str, Any]]:
+        return self.exports_sync.send_rule_stats().message.data.stats
+
+    def snapshot_memory(self, tag: str, resume: bool = True) -> Optional[MemorySnapshot]:
+        # agent异步发送数据, 返回的快照对象在 state 变为 done 后即可按vaddr读取
+        snapshots = get_snapshots()
+        if snapshots is None:
+            print(f'[snapshot] 未配置datadir, 无法保存快照', file=sys.stderr)
+            return None
+        snapshot = snapshots.get(tag)
+        skip = snapshot.done_ranges() if resume else []
+        count = self.exports_sync.snapshot_memory(tag, skip)
+        print(f'[snapshot] {tag} 待读取区间: {count}, 跳过: {len(skip)}')
+        return snapshot
+
     def list_exports_sync(self) -> List[str]: 
         return self.exports_sync._list_exports()
 
@@ -138,6 +213,8 @@ class ScriptWrapper:
         return JsHandle(path, script=self, scope_id=self.scope_id)
 
     def eval(self, source: str) -> JsHandle:
+        # eval可能给scope中任意对象重新赋值, 已缓存的属性不再可信
+        PROPS_CACHE.evict(self.scope_id)
         result = self.exports_sync.scope_eval(source, self.scope_id)
         return JsHandle.new_from_payload(result, script=self, scope_id=self.scope_id)
 
@@ -145,28 +222,53 @@ class ScriptWrapper:
 class SessionWrapper:
     @property
     def is_detached(self) -> bool: ...
-    @overload
-    def on(self, signal: str, callback: Callable[..., Any]) -> None: ...
-    @overload
-    def on(self, signal: Literal["detached"], callback: SessionDetachedCallback) -> None: ...
-    @overload
-    def off(self, signal: Literal["detached"], callback: SessionDetachedCallback) -> None: ...
-    @overload
-    def off(self, signal: str, callback: Callable[..., Any]) -> None: ...
     def detach(self) -> None: ...
     def resume(self) -> None: ...
     def enable_child_gating(self) -> None: ...
     def disable_child_gating(self) -> None: ...
 
     _session: Session
+    _signals: List[Tuple[str, Callable[..., Any]]]
 
     __SESSION_EXPORT__: Final[FrozenSet[str]] = frozenset([
-        'detach', 'resume', 'on', 'off',
+        'detach', 'resume', 'is_detached',
         'enable_child_gating', 'disable_child_gating',
     ])
 
     def __init__(self, session: Session):
         self._session = session
+        self._signals = []
+
+    @overload
+    def on(self, signal: Literal["detached"], callback: SessionDetachedCallback) -> None: ...
+    @overload
+    def on(self, signal: str, callback: Callable[..., Any]) -> None: ...
+    def on(self, signal: str, callback: Callable[..., Any]) -> None:
+        self._session.on(signal, callback)
+        self._signals.append((signal, callback))
+
+    @overload
+    def off(self, signal: Literal["detached"], callback: SessionDetachedCallback) -> None: ...
+    @overload
+    def off(self, signal: str, callback: Callable[..., Any]) -> None: ...
+    def off(self, signal: str, callback: Callable[..., Any]) -> None:
+        self._session.off(signal, callback)
+        self._signals.remove((signal, callback))
+
+    def rebind(self, session: Session) -> None:
+        self._session = session
+        for signal, callback in self._signals:
+            session.on(signal, callback)
+
+    def recreate_script(self, script: ScriptWrapper) -> ScriptWrapper:
+        if script._jsfile is not None:
+            with codecs.open(script._jsfile, 'r', 'utf-8') as f:
+                source = try_inject_environ(f.read(), script._env.model_dump())
+        else:
+            source = script._source
+        script.rebind(self._session.create_script(source))
+        script._source = source
+        return script
 
     def create_script(
         self, source: str, name: Optional[str] = None, snapshot: Optional[bytes] = None, runtime: Optional[str] = None,
@@ -178,7 +280,9 @@ class SessionWrapper:
         source = try_inject_environ(source, env.model_dump())
 
         script = self._session.create_script(source, name, snapshot, runtime)
-        return ScriptWrapper(script, env)
+        wrapper = ScriptWrapper(script, env, resolver)
+        wrapper._source = source
+        return wrapper
 
     def open_script(
         self, jsfile: str, name: Optional[str] = None, snapshot: Optional[bytes] = None, runtime: Optional[str] = None,
@@ -195,7 +299,9 @@ class SessionWrapper:
         with codecs.open(jsfile, 'r', 'utf-8') as f:
             source = f.read()
         
-        return self.create_script(source, name, snapshot, runtime, env, resolver)
+        wrapper = self.create_script(source, name, snapshot, runtime, env, resolver)
+        wrapper._jsfile = jsfile
+        return wrapper
     
     @classmethod
     def from_session(cls, session: Session) -> 'SessionWrapper':
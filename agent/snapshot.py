@@ -0,0 +1,282 @@
+from typing import Final, Optional, List, Dict, Tuple, Any, Iterator, Union
+from concurrent.futures import ThreadPoolExecutor
+from agent.config import Config
+from datetime import datetime
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import mmap
+import json
+import os
+
+
+PAGE_SIZE: Final[int] = 0x1000
+
+# offset为区间在memory.bin中的位置; done标记区间已完整写入, 续传时跳过
+RANGE_DTYPE: Final[np.dtype] = np.dtype([
+    ('base', '<u8'), ('size', '<u8'), ('offset', '<u8'), ('done', 'u1'),
+])
+
+
+class MemorySnapshot:
+    # 目标进程地址空间跨度可达2^48, 直接以vaddr为文件偏移会超出ext4等文件系统的上限,
+    # 因此按区间顺序排布到稀疏文件中, 通过区间索引把vaddr换算成文件偏移
+    root: Final[Path]
+    tag: str
+    state: str
+    ranges: np.ndarray
+    protections: List[str]
+    files: List[str]
+
+    _fd: Optional[int]
+    _mmap: Optional[mmap.mmap]
+    _lock: Lock
+
+    def __init__(self, root: Union[str, Path], tag: str = ''):
+        self.root = Path(root)
+        self.tag = tag
+        self.state = 'empty'
+        self.ranges = np.empty(0, dtype=RANGE_DTYPE)
+        self.protections = []
+        self.files = []
+        self._fd = None
+        self._mmap = None
+        self._lock = Lock()
+        if self.index_path.exists():
+            self._load_index()
+
+    def __repr__(self):
+        done = int(self.ranges['done'].sum()) if len(self.ranges) else 0
+        return f'<MemorySnapshot {self.tag} [{self.state}] ranges={done}/{len(self.ranges)} size={self.size}>'
+
+    def __len__(self):
+        return len(self.ranges)
+
+    @property
+    def data_path(self) -> Path:
+        return self.root / 'memory.bin'
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / 'index.json'
+
+    @property
+    def ranges_path(self) -> Path:
+        return self.root / 'ranges.npy'
+
+    @property
+    def size(self) -> int:
+        if not len(self.ranges):
+            return 0
+        return int((self.ranges['offset'] + self.ranges['size']).max())
+
+    def _load_index(self):
+        meta = json.loads(self.index_path.read_text(encoding='utf-8'))
+        self.tag = meta.get('tag', self.tag)
+        self.state = meta.get('state', 'empty')
+        self.protections = meta.get('protections', [])
+        self.files = meta.get('files', [])
+        if self.ranges_path.exists():
+            self.ranges = np.load(self.ranges_path)
+
+    def _save_ranges(self):
+        tmp = self.ranges_path.with_name(f'ranges.{os.getpid()}.tmp.npy')
+        np.save(tmp, self.ranges)
+        os.replace(tmp, self.ranges_path)
+
+    def _save_index(self):
+        self._save_ranges()
+        meta = {
+            'tag': self.tag,
+            'state': self.state,
+            'updated_at': datetime.now().isoformat(),
+            'protections': self.protections,
+            'files': self.files,
+        }
+        self.index_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+    def begin(self, ranges: List[Dict[str, Any]]):
+        # 与上次中断的索引合并: base/size一致且已完成的区间保留原偏移, 其余区间追加到文件末尾
+        done: Dict[Tuple[int, int], int] = {
+            (int(v['base']), int(v['size'])): int(v['offset'])
+            for v in self.ranges if v['done']
+        }
+        arr = np.zeros(len(ranges), dtype=RANGE_DTYPE)
+        cursor = max((off + size for (_, size), off in done.items()), default=0)
+        cursor = -(-cursor // PAGE_SIZE) * PAGE_SIZE
+        for i, v in enumerate(ranges):
+            base, size = int(v['base'], 16) if isinstance(v['base'], str) else int(v['base']), int(v['size'])
+            arr['base'][i], arr['size'][i] = base, size
+            off = done.get((base, size))
+            if off is not None:
+                arr['offset'][i], arr['done'][i] = off, 1
+            else:
+                arr['offset'][i] = cursor
+                cursor += -(-size // PAGE_SIZE) * PAGE_SIZE
+        order = np.argsort(arr['base'], kind='stable')
+
+        with self._lock:
+            self.close()
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.ranges = arr[order]
+            self.protections = [ranges[i].get('protection', '') for i in order.tolist()]
+            self.files = [ranges[i].get('file', '') for i in order.tolist()]
+            self.state = 'running'
+            fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # 只扩展文件长度, 未写入的部分不占磁盘
+                if os.fstat(fd).st_size < self.size:
+                    os.ftruncate(fd, self.size)
+            finally:
+                os.close(fd)
+            self._save_index()
+
+    def find(self, address: int) -> int:
+        i = int(np.searchsorted(self.ranges['base'], np.uint64(address), side='right')) - 1
+        if i < 0 or address >= int(self.ranges['base'][i] + self.ranges['size'][i]):
+            return -1
+        return i
+
+    def file_offset(self, address: int) -> int:
+        i = self.find(address)
+        if i < 0:
+            raise KeyError(f'{hex(address)} 不在快照区间内')
+        return int(self.ranges['offset'][i]) + address - int(self.ranges['base'][i])
+
+    def _writer_fd(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def write(self, address: int, data: Union[bytes, memoryview]) -> int:
+        return os.pwrite(self._writer_fd(), data, self.file_offset(address))
+
+    def write_many(self, chunks: List[Tuple[int, Union[bytes, memoryview]]], executor: Optional[ThreadPoolExecutor] = None):
+        if executor is None or len(chunks) <= 1:
+            for address, data in chunks:
+                self.write(address, data)
+            return
+        # pwrite会释放GIL, 同一批次的块并行落盘
+        fd = self._writer_fd()
+        jobs = [executor.submit(os.pwrite, fd, data, self.file_offset(address)) for address, data in chunks]
+        for job in jobs:
+            job.result()
+
+    def mark_done(self, base: int):
+        i = self.find(base)
+        if i < 0:
+            return
+        with self._lock:
+            self.ranges['done'][i] = 1
+            self._save_ranges()
+
+    def finish(self):
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+            self.state = 'done' if len(self.ranges) and self.ranges['done'].all() else 'partial'
+            self._save_index()
+
+    def done_ranges(self) -> List[Tuple[str, int]]:
+        # (base, size) 均一致才算已完成, 与 begin 的合并规则相同; 大小变化的区间需要重新读取
+        done = self.ranges[self.ranges['done'] == 1]
+        return [(hex(base), size) for base, size in zip(done['base'].tolist(), done['size'].tolist())]
+
+    @property
+    def mmap(self) -> mmap.mmap:
+        if self._mmap is None:
+            with open(self.data_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def view(self, address: int, size: int) -> memoryview:
+        # 不允许跨区间, 区间之间在文件中并不相邻
+        i = self.find(address)
+        if i < 0 or address + size > int(self.ranges['base'][i] + self.ranges['size'][i]):
+            raise KeyError(f'{hex(address)}+{hex(size)} 不在同一快照区间内')
+        off = self.file_offset(address)
+        return memoryview(self.mmap)[off: off + size]
+
+    def read(self, address: int, size: int) -> bytes:
+        return bytes(self.view(address, size))
+
+    def array(self, address: int, size: int) -> np.ndarray:
+        return np.frombuffer(self.mmap, dtype=np.uint8, count=size, offset=self.file_offset(address))
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, bytes]:
+        if isinstance(key, slice):
+            return self.read(key.start, key.stop - key.start)
+        return self.view(key, 1)[0]
+
+    def iter_ranges(self, done_only: bool = True) -> Iterator[Tuple[int, int, str, str]]:
+        for i, v in enumerate(self.ranges):
+            if done_only and not v['done']:
+                continue
+            yield int(v['base']), int(v['size']), self.protections[i], self.files[i]
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SnapshotManager:
+    root: Final[Path]
+    workers: int
+
+    _items: Dict[str, MemorySnapshot]
+    _executor: Optional[ThreadPoolExecutor]
+    _lock: Lock
+
+    def __init__(self, root: Union[str, Path], workers: int = 4):
+        self.root = Path(root)
+        self.workers = workers
+        self._items = {}
+        self._executor = None
+        self._lock = Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='Snapshot')
+        return self._executor
+
+    def get(self, tag: str) -> MemorySnapshot:
+        with self._lock:
+            snapshot = self._items.get(tag)
+            if snapshot is None:
+                snapshot = self._items[tag] = MemorySnapshot(self.root / tag.replace('/', '_'), tag)
+            return snapshot
+
+    def list(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(v.name for v in self.root.iterdir() if (v / 'index.json').exists())
+
+
+_SNAPSHOTS: Optional[SnapshotManager] = None
+_SNAPSHOTS_LOCK: Final[Lock] = Lock()
+
+
+def get_snapshots() -> Optional[SnapshotManager]:
+    global _SNAPSHOTS
+    if _SNAPSHOTS is None:
+        conf = Config.get()
+        if not conf.agent.datadir:
+            return None
+        with _SNAPSHOTS_LOCK:
+            if _SNAPSHOTS is None:
+                _SNAPSHOTS = SnapshotManager(Path(conf.agent.datadir) / 'snapshot')
+    return _SNAPSHOTS
@@ -0,0 +1,249 @@
+from typing import Final, Optional, List, Tuple, Dict, Any, Literal, Iterator, Union
+from pydantic import BaseModel
+from pathlib import Path
+from datetime import datetime
+from threading import Lock
+from agent.config import Config
+import numpy as np
+import hashlib
+import os
+
+
+PAGE_SIZE: Final[int] = 0x1000
+
+# content-defined 分块: 滑动窗口内 gear 值之和命中掩码即为切点
+_CDC_WINDOW: Final[int] = 48
+_CDC_GEAR: Final[np.ndarray] = np.random.default_rng(0x616e616c796b6974).integers(
+    0, 1 << 63, size=256, dtype=np.uint64,
+)
+_CDC_MIX: Final[np.uint64] = np.uint64(0x9e3779b97f4a7c15)
+
+
+class ChunkRef(BaseModel):
+    hash: str
+    offset: int
+    size: int
+
+
+class Manifest(BaseModel):
+    id: str
+    name: str
+    source: str
+    size: int
+    sha256: str
+    chunking: Literal['fixed', 'cdc']
+    chunks: List[ChunkRef]
+    created_at: str
+    meta: Dict[str, Any] = {}
+
+
+class PageRange(BaseModel):
+    offset: int
+    size: int
+
+    def __repr__(self):
+        return f'<PageRange {hex(self.offset)}-{hex(self.offset + self.size)}>'
+
+
+def split_fixed(data: bytes, chunk_size: int) -> List[Tuple[int, int]]:
+    return [(off, min(chunk_size, len(data) - off)) for off in range(0, len(data), chunk_size)]
+
+
+def split_cdc(data: bytes, avg_size: int) -> List[Tuple[int, int]]:
+    size = len(data)
+    if size == 0:
+        return []
+    min_size, max_size = avg_size // 4, avg_size * 4
+    mask = np.uint64((1 << max(1, avg_size.bit_length() - 1)) - 1)
+
+    gear = _CDC_GEAR[np.frombuffer(data, dtype=np.uint8)]
+    csum = np.cumsum(gear, dtype=np.uint64)
+    window = csum.copy()
+    window[_CDC_WINDOW:] -= csum[:-_CDC_WINDOW]
+    candidates = np.flatnonzero((((window * _CDC_MIX) >> np.uint64(16)) & mask) == 0) + 1
+
+    chunks: List[Tuple[int, int]] = []
+    start = 0
+    for cut in candidates.tolist():
+        while cut - start > max_size:
+            chunks.append((start, max_size))
+            start += max_size
+        if cut - start >= min_size:
+            chunks.append((start, cut - start))
+            start = cut
+    while start < size:
+        n = min(max_size, size - start)
+        chunks.append((start, n))
+        start += n
+    return chunks
+
+
+def page_digests(data: Union[bytes, memoryview], page_size: int = PAGE_SIZE) -> np.ndarray:
+    view = memoryview(data)
+    digests = np.empty((len(view) + page_size - 1) // page_size, dtype=np.uint64)
+    for i in range(len(digests)):
+        page = view[i * page_size: (i + 1) * page_size]
+        digests[i] = int.from_bytes(hashlib.blake2b(page, digest_size=8).digest(), 'little')
+    return digests
+
+
+class ChunkStore:
+    root: Final[Path]
+    chunking: Final[Literal['fixed', 'cdc']]
+    chunk_size: Final[int]
+
+    _lock: Lock
+
+    def __init__(self, root: Union[str, Path], chunking: Literal['fixed', 'cdc'] = 'fixed', chunk_size: int = PAGE_SIZE):
+        self.root = Path(root)
+        self.chunking = chunking
+        self.chunk_size = chunk_size
+        self._lock = Lock()
+        (self.root / 'chunks').mkdir(parents=True, exist_ok=True)
+        (self.root / 'manifests').mkdir(parents=True, exist_ok=True)
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.root / 'chunks' / digest[:2] / digest[2:]
+
+    def _manifest_path(self, manifest_id: str) -> Path:
+        return self.root / 'manifests' / f'{manifest_id}.json'
+
+    def _pages_path(self, manifest_id: str) -> Path:
+        return self.root / 'manifests' / f'{manifest_id}.pages'
+
+    def _write_chunk(self, digest: str, chunk: memoryview) -> bool:
+        path = self._chunk_path(digest)
+        if path.exists():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(chunk)
+        os.replace(tmp, path)
+        return True
+
+    def put(self, name: str, data: bytes, source: str = '', meta: Optional[Dict[str, Any]] = None) -> Manifest:
+        name = name.replace('/', '_').replace('\\', '_')
+        view = memoryview(data)
+        if self.chunking == 'cdc':
+            spans = split_cdc(data, self.chunk_size)
+        else:
+            spans = split_fixed(data, self.chunk_size)
+
+        chunks: List[ChunkRef] = []
+        written = 0
+        for off, size in spans:
+            chunk = view[off: off + size]
+            digest = hashlib.sha256(chunk).hexdigest()
+            if self._write_chunk(digest, chunk):
+                written += size
+            chunks.append(ChunkRef(hash=digest, offset=off, size=size))
+
+        now = datetime.now()
+        manifest = Manifest(
+            id=f'{source or "_"}/{name}/{now.strftime("%Y%m%d%H%M%S%f")}',
+            name=name,
+            source=source,
+            size=len(data),
+            sha256=hashlib.sha256(view).hexdigest(),
+            chunking=self.chunking,
+            chunks=chunks,
+            created_at=now.isoformat(),
+            meta={**(meta or {}), 'new_bytes': written},
+        )
+        path = self._manifest_path(manifest.id)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(manifest.model_dump_json(), encoding='utf-8')
+            page_digests(view).tofile(self._pages_path(manifest.id))
+        return manifest
+
+    def load(self, manifest_id: str) -> Manifest:
+        return Manifest.model_validate_json(self._manifest_path(manifest_id).read_text(encoding='utf-8'))
+
+    def manifests(self, name: Optional[str] = None, source: Optional[str] = None) -> List[Manifest]:
+        base = self.root / 'manifests'
+        pattern = f'{source or "*"}/{name or "*"}/*.json'
+        return sorted(
+            (Manifest.model_validate_json(p.read_text(encoding='utf-8')) for p in base.glob(pattern)),
+            key=lambda v: v.id.rsplit('/', 1)[-1],
+        )
+
+    def latest(self, name: str, source: Optional[str] = None) -> Optional[Manifest]:
+        manifests = self.manifests(name, source)
+        return manifests[-1] if manifests else None
+
+    def find(self, source: Optional[str] = None, **meta: Any) -> Optional[Manifest]:
+        # 按元数据查找最新的manifest, 如 find('elfModule', module='/system/lib64/libc.so')
+        for manifest in reversed(self.manifests(source=source)):
+            if all(manifest.meta.get(k) == v for k, v in meta.items()):
+                return manifest
+        return None
+
+    def iter_chunks(self, manifest: Manifest) -> Iterator[bytes]:
+        for ref in manifest.chunks:
+            with open(self._chunk_path(ref.hash), 'rb') as f:
+                yield f.read()
+
+    def materialize(self, manifest: Union[Manifest, str], dst: Optional[Union[str, Path]] = None) -> Optional[bytes]:
+        if isinstance(manifest, str):
+            manifest = self.load(manifest)
+        if dst is None:
+            return b''.join(self.iter_chunks(manifest))
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with open(dst, 'wb') as f:
+            for chunk in self.iter_chunks(manifest):
+                f.write(chunk)
+        return None
+
+    def pages(self, manifest: Union[Manifest, str]) -> np.ndarray:
+        manifest_id = manifest if isinstance(manifest, str) else manifest.id
+        return np.fromfile(self._pages_path(manifest_id), dtype=np.uint64)
+
+    def diff(self, a: Union[Manifest, str], b: Union[Manifest, str]) -> List[PageRange]:
+        pa, pb = self.pages(a), self.pages(b)
+        n = max(len(pa), len(pb))
+        changed = np.ones(n, dtype=bool)
+        common = min(len(pa), len(pb))
+        changed[:common] = pa[:common] != pb[:common]
+
+        ranges: List[PageRange] = []
+        idx = np.flatnonzero(changed)
+        if len(idx) == 0:
+            return ranges
+        # 合并相邻页
+        breaks = np.flatnonzero(np.diff(idx) != 1)
+        starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+        ends = np.concatenate((idx[breaks], [idx[-1]])) + 1
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            ranges.append(PageRange(offset=s * PAGE_SIZE, size=(e - s) * PAGE_SIZE))
+        return ranges
+
+    def stats(self) -> Dict[str, int]:
+        chunks = [p for p in (self.root / 'chunks').rglob('*') if p.is_file()]
+        manifests = list((self.root / 'manifests').rglob('*.json'))
+        logical = sum(Manifest.model_validate_json(p.read_text(encoding='utf-8')).size for p in manifests)
+        return {
+            'manifests': len(manifests),
+            'chunks': len(chunks),
+            'stored_bytes': sum(p.stat().st_size for p in chunks),
+            'logical_bytes': logical,
+        }
+
+
+_CHUNK_STORE: Optional[ChunkStore] = None
+_CHUNK_STORE_LOCK: Final[Lock] = Lock()
+
+
+def get_chunk_store() -> Optional[ChunkStore]:
+    global _CHUNK_STORE
+    if _CHUNK_STORE is None:
+        conf = Config.get()
+        if not conf.agent.datadir:
+            return None
+        with _CHUNK_STORE_LOCK:
+            if _CHUNK_STORE is None:
+                store = conf.agent.store
+                _CHUNK_STORE = ChunkStore(Path(conf.agent.datadir) / 'store', store.chunking, store.chunk_size)
+    return _CHUNK_STORE
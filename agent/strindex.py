@@ -0,0 +1,384 @@
+from typing import Final, Optional, List, Dict, Tuple, NamedTuple, Iterator, Iterable, Union
+from agent.procmaps import ProcMaps, PROC_MAPS
+from agent.config import Config
+from threading import Lock
+from pathlib import Path
+import numpy as np
+import hashlib
+import shutil
+import json
+import os
+
+
+KIND_ASCII: Final[int] = 0
+KIND_UTF16: Final[int] = 1
+
+# 建索引时每次处理的数据量; 切分点向前查找的范围需覆盖最长的字符串(max_len个UTF-16字符)
+WINDOW_SIZE: Final[int] = 64 << 20
+WINDOW_CUT_SEARCH: Final[int] = 16 << 10
+
+# 每条字符串的位置信息, pos/size指向 .blob 中的文本
+STRING_DTYPE: Final[np.dtype] = np.dtype([
+    ('address', '<u8'), ('pos', '<u8'), ('size', '<u4'), ('kind', 'u1'),
+])
+
+
+class StringHit(NamedTuple):
+    dump: str
+    address: int
+    text: str
+    kind: str
+    # 模块内偏移的段在当前maps中找不到对应模块时为False, 此时address仍是模块内偏移
+    resolved: bool = True
+
+    def toJSON(self):
+        return {
+            'dump': self.dump, 'address': hex(self.address), 'text': self.text, 'kind': self.kind,
+            'resolved': self.resolved,
+        }
+
+
+def _runs(mask: np.ndarray, min_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = ends - starts >= min_len
+    return starts[keep], ends[keep] - starts[keep]
+
+
+def _printable(arr: np.ndarray) -> np.ndarray:
+    return ((arr >= 0x20) & (arr < 0x7f)) | (arr == 0x09)
+
+
+def extract_strings(
+    data: Union[bytes, memoryview, np.ndarray], min_len: int = 4, max_len: int = 4096,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # 返回 (偏移, 长度(字符), 类型, 文本字节) ; UTF-16只提取ASCII范围内的字符, 文本按单字节存放
+    arr = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    offsets, sizes, kinds = [], [], []
+
+    starts, lengths = _runs(_printable(arr), min_len)
+    offsets.append(starts)
+    sizes.append(lengths)
+    kinds.append(np.full(len(starts), KIND_ASCII, dtype=np.uint8))
+
+    for align in (0, 1):
+        count = (len(arr) - align) // 2
+        if count <= 0:
+            continue
+        u16 = arr[align: align + count * 2].view('<u2')
+        starts, lengths = _runs(_printable(u16), min_len)
+        offsets.append(starts * 2 + align)
+        sizes.append(lengths)
+        kinds.append(np.full(len(starts), KIND_UTF16, dtype=np.uint8))
+
+    # 按类型取出文本字节, 依次拼接
+    sizes = [np.minimum(v, max_len) for v in sizes]
+    blobs = []
+    for off, size, kind in zip(offsets, sizes, kinds):
+        if not len(off):
+            continue
+        step = 1 if kind[0] == KIND_ASCII else 2
+        total = int(size.sum())
+        idx = np.repeat(off, size) + (np.arange(total) - np.repeat(np.cumsum(size) - size, size)) * step
+        blobs.append(arr[idx])
+    return (
+        np.concatenate(offsets).astype(np.uint64),
+        np.concatenate(sizes).astype(np.uint32),
+        np.concatenate(kinds),
+        np.concatenate(blobs) if blobs else np.empty(0, dtype=np.uint8),
+    )
+
+
+def _trigrams(blob: np.ndarray, positions: np.ndarray, sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 每条字符串内的所有3字节窗口 -> (trigram, 字符串序号), 去重后按trigram排序
+    counts = np.maximum(sizes.astype(np.int64) - 2, 0)
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    ids = np.repeat(np.arange(len(sizes), dtype=np.uint64), counts)
+    idx = np.repeat(positions.astype(np.int64), counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+    b = blob.astype(np.uint32)
+    codes = (b[idx] << 16) | (b[idx + 1] << 8) | b[idx + 2]
+    pairs = np.unique((codes.astype(np.uint64) << np.uint64(32)) | ids)
+    return (pairs >> np.uint64(32)).astype(np.uint32), (pairs & np.uint64(0xffffffff)).astype(np.uint32)
+
+
+def _windows(
+    ranges: Iterable[Tuple[int, Union[bytes, memoryview, np.ndarray]]], window: int,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    # 大区间按窗口切分, 切分点放在窗口末尾附近的连续两个0字节处, 避免截断其中的ASCII/UTF-16字符串
+    for base, data in ranges:
+        arr = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+        start = 0
+        while start < len(arr):
+            end = min(start + window, len(arr))
+            if end < len(arr):
+                tail_at = max(start, end - WINDOW_CUT_SEARCH)
+                tail = np.asarray(arr[tail_at: end])
+                zeros = np.flatnonzero((tail[:-1] == 0) & (tail[1:] == 0))
+                if len(zeros):
+                    end = tail_at + int(zeros[-1]) + 1
+            yield base + start, arr[start: end]
+            start = end
+
+
+def _open_array(path: str, dtype: np.dtype, count: int) -> np.ndarray:
+    # 按最终大小直接在磁盘上创建 .npy, 分批填入; 空数组无法mmap, 直接写出
+    if not count:
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.empty(0, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(count,))
+
+
+class StringSegment:
+    # 一个dump对应一个只读段: 文本(.blob) + 位置表 + trigram倒排表(CSR)
+    root: Final[Path]
+    id: Final[str]
+    meta: Dict[str, Union[str, int, bool]]
+
+    _blob: Optional[np.ndarray]
+    _strings: Optional[np.ndarray]
+    _keys: Optional[np.ndarray]
+    _indptr: Optional[np.ndarray]
+    _postings: Optional[np.ndarray]
+
+    def __init__(self, root: Union[str, Path], id: str):
+        self.root = Path(root)
+        self.id = id
+        self.meta = json.loads((self.root / f'{id}.json').read_text(encoding='utf-8'))
+        self._blob = None
+        self._strings = None
+        self._keys = None
+        self._indptr = None
+        self._postings = None
+
+    def __repr__(self):
+        return f'<StringSegment {self.meta["dump"]} strings={self.meta["count"]}>'
+
+    def __len__(self):
+        return int(self.meta['count'])
+
+    @property
+    def dump(self) -> str:
+        return str(self.meta['dump'])
+
+    @property
+    def module(self) -> Optional[str]:
+        # 段来自模块dump时为模块路径
+        return self.meta.get('module')
+
+    def _load(self):
+        if self._strings is not None:
+            return
+        prefix = self.root / self.id
+        self._strings = np.load(f'{prefix}.strings.npy', mmap_mode='r')
+        self._keys = np.load(f'{prefix}.keys.npy', mmap_mode='r')
+        self._indptr = np.load(f'{prefix}.indptr.npy', mmap_mode='r')
+        self._postings = np.load(f'{prefix}.postings.npy', mmap_mode='r')
+        blob_path = f'{prefix}.blob'
+        self._blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8)
+
+    def candidates(self, query: bytes) -> Optional[np.ndarray]:
+        # 返回可能包含query的字符串序号; query不足3字节时返回None, 由调用方全量校验
+        self._load()
+        if len(query) < 3:
+            return None
+        q = np.frombuffer(query, dtype=np.uint8).astype(np.uint32)
+        codes = np.unique((q[:-2] << 16) | (q[1:-1] << 8) | q[2:])
+        lists = []
+        for code in codes.tolist():
+            i = int(np.searchsorted(self._keys, code))
+            if i >= len(self._keys) or int(self._keys[i]) != code:
+                return np.empty(0, dtype=np.uint32)
+            lists.append(self._postings[int(self._indptr[i]): int(self._indptr[i + 1])])
+        lists.sort(key=len)
+        result = np.asarray(lists[0])
+        for v in lists[1:]:
+            result = np.intersect1d(result, v, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def text(self, i: int) -> bytes:
+        self._load()
+        row = self._strings[i]
+        return self._blob[int(row['pos']): int(row['pos']) + int(row['size'])].tobytes()
+
+    def search(self, query: bytes, base: int = 0, resolved: bool = True) -> Iterator[StringHit]:
+        # 同一字符串中的每次出现都单独返回
+        self._load()
+        ids = self.candidates(query)
+        if ids is None:
+            ids = np.arange(len(self._strings))
+        for i in ids.tolist():
+            text = self.text(i)
+            pos = text.find(query)
+            if pos < 0:
+                continue
+            row = self._strings[i]
+            kind = int(row['kind'])
+            # UTF-16字符串中每个字符占2字节
+            step = 2 if kind == KIND_UTF16 else 1
+            decoded = text.decode('latin-1')
+            while pos >= 0:
+                address = base + int(row['address']) + pos * step
+                yield StringHit(self.dump, address, decoded, 'utf16' if kind == KIND_UTF16 else 'ascii', resolved)
+                pos = text.find(query, pos + 1)
+
+
+class StringIndex:
+    # 增量索引: 每个新dump写成独立的段, 以内容hash命名, 已索引过的内容直接跳过.
+    # 段之间没有共享文件, 可在多个进程中并行写入
+    root: Final[Path]
+    min_len: int
+    window: int
+    maps: ProcMaps
+
+    _segments: Dict[str, StringSegment]
+    _lock: Lock
+
+    def __init__(self, root: Union[str, Path], min_len: int = 4, maps: ProcMaps = PROC_MAPS, window: int = WINDOW_SIZE):
+        self.root = Path(root)
+        self.min_len = min_len
+        self.window = window
+        self.maps = maps
+        self._segments = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f'<StringIndex {self.root} segments={len(self.segments())}>'
+
+    def has(self, sha256: str) -> bool:
+        return (self.root / f'{sha256[:32]}.json').exists()
+
+    def add_ranges(
+        self, dump: str, ranges: Iterable[Tuple[int, Union[bytes, memoryview, np.ndarray]]],
+        sha256: str, source: str = '', relative: bool = False, module: Optional[str] = None,
+    ) -> Optional[str]:
+        # ranges: [(起始地址, 数据)]; relative为True时地址是模块内偏移, 查询时按module(模块路径)在maps中的基址换算.
+        # 按窗口逐段提取, 每个窗口的字符串与(trigram, 序号)先写到临时目录, 再按trigram计数一次性排进postings;
+        # 峰值内存取决于窗口大小而不是dump大小
+        seg_id = sha256[:32]
+        if self.has(sha256):
+            return None
+        self.root.mkdir(parents=True, exist_ok=True)
+        prefix = self.root / seg_id
+        workdir = self.root / f'.{seg_id}.{os.getpid()}.tmp'
+        workdir.mkdir(parents=True, exist_ok=True)
+        try:
+            count, blob_size, windows = 0, 0, 0
+            # 所有窗口中出现过的trigram(有序)及其postings长度; 可打印字符的trigram不超过96^3种
+            all_keys = np.empty(0, dtype=np.uint32)
+            key_counts = np.empty(0, dtype=np.int64)
+            with open(f'{prefix}.blob', 'wb') as blob_f:
+                for base, data in _windows(ranges, self.window):
+                    off, size, kind, blob = extract_strings(data, self.min_len)
+                    strings = np.empty(len(size), dtype=STRING_DTYPE)
+                    strings['address'] = off + np.uint64(base)
+                    strings['size'] = size
+                    strings['kind'] = kind
+                    pos = np.cumsum(size, dtype=np.uint64) - size
+                    strings['pos'] = pos + np.uint64(blob_size)
+                    keys, ids = _trigrams(blob, pos, size)
+                    ids += np.uint32(count)
+                    ukeys, ucounts = np.unique(keys, return_counts=True)
+                    merged = np.union1d(all_keys, ukeys)
+                    counts = np.zeros(len(merged), dtype=np.int64)
+                    counts[np.searchsorted(merged, all_keys)] = key_counts
+                    counts[np.searchsorted(merged, ukeys)] += ucounts
+                    all_keys, key_counts = merged, counts
+
+                    np.save(workdir / f'{windows}.strings.npy', strings)
+                    np.save(workdir / f'{windows}.keys.npy', keys)
+                    np.save(workdir / f'{windows}.ids.npy', ids)
+                    blob.tofile(blob_f)
+                    count += len(strings)
+                    blob_size += len(blob)
+                    windows += 1
+                    del off, size, kind, blob, strings, pos, keys, ids
+
+            indptr = np.zeros(len(all_keys) + 1, dtype=np.uint64)
+            np.cumsum(key_counts, out=indptr[1:])
+            strings_out = _open_array(f'{prefix}.strings.npy', STRING_DTYPE, count)
+            postings = _open_array(f'{prefix}.postings.npy', np.dtype(np.uint32), int(indptr[-1]))
+            # 各窗口的序号递增, 按窗口顺序填入即可保证每个trigram的postings有序
+            cursor = indptr[:-1].astype(np.int64)
+            row = 0
+            for i in range(windows):
+                strings = np.load(workdir / f'{i}.strings.npy', mmap_mode='r')
+                strings_out[row: row + len(strings)] = strings
+                row += len(strings)
+                keys = np.load(workdir / f'{i}.keys.npy', mmap_mode='r')
+                if not len(keys):
+                    continue
+                ids = np.load(workdir / f'{i}.ids.npy', mmap_mode='r')
+                ukeys, first, ucounts = np.unique(keys, return_index=True, return_counts=True)
+                slots = np.searchsorted(all_keys, ukeys)
+                postings[np.repeat(cursor[slots] - first, ucounts) + np.arange(len(keys))] = ids
+                cursor[slots] += ucounts
+            for arr in (strings_out, postings):
+                if isinstance(arr, np.memmap):
+                    arr.flush()
+            del strings_out, postings
+            np.save(f'{prefix}.keys.npy', all_keys)
+            np.save(f'{prefix}.indptr.npy', indptr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        # 元数据最后写入, 存在即表示段完整
+        meta = {'dump': dump, 'source': source, 'sha256': sha256, 'count': count, 'relative': relative}
+        if module:
+            meta['module'] = module
+        tmp = self.root / f'{seg_id}.{os.getpid()}.tmp'
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.root / f'{seg_id}.json')
+        return seg_id
+
+    def add_bytes(
+        self, dump: str, data: Union[bytes, memoryview], base: int = 0, source: str = '',
+        relative: bool = False, module: Optional[str] = None,
+    ) -> Optional[str]:
+        sha256 = hashlib.sha256(data).hexdigest()
+        return self.add_ranges(dump, [(base, data)], sha256, source, relative, module)
+
+    def segments(self) -> List[StringSegment]:
+        with self._lock:
+            for fp in self.root.glob('*.json'):
+                if fp.stem not in self._segments:
+                    self._segments[fp.stem] = StringSegment(self.root, fp.stem)
+            return list(self._segments.values())
+
+    def search(self, query: Union[str, bytes], limit: int = 100, dump: Optional[str] = None) -> List[StringHit]:
+        if isinstance(query, str):
+            query = query.encode('latin-1')
+        hits: List[StringHit] = []
+        for seg in self.segments():
+            if dump is not None and seg.dump != dump:
+                continue
+            base, resolved = 0, True
+            if seg.meta.get('relative'):
+                # dump名是tag, 不一定是模块名; 没有记录模块路径或模块当前未加载时返回模块内偏移
+                mod = self.maps.find_module_by_name(seg.module) if seg.module else None
+                base, resolved = (mod.base, True) if mod is not None else (0, False)
+            for hit in seg.search(query, base, resolved):
+                hits.append(hit)
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+
+_STRING_INDEX: Dict[str, StringIndex] = {}
+_STRING_INDEX_LOCK: Final[Lock] = Lock()
+
+
+def get_string_index(datadir: Optional[str] = None) -> Optional[StringIndex]:
+    if datadir is None:
+        datadir = Config.get().agent.datadir
+        if not datadir:
+            return None
+    with _STRING_INDEX_LOCK:
+        index = _STRING_INDEX.get(datadir)
+        if index is None:
+            index = _STRING_INDEX[datadir] = StringIndex(Path(datadir) / 'strindex')
+        return index
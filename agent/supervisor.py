@@ -0,0 +1,136 @@
+from agent.session import SessionWrapper, ScriptWrapper
+from agent.config import Reattach
+from agent.utils import find_app_pid
+from typing import Final, Optional, List, Literal, FrozenSet
+from dataclasses import dataclass
+from threading import Thread, Lock, Event
+import frida
+import time
+import sys
+
+
+# 以下原因说明是主动断开或设备已不可用, 不做重连
+NO_REATTACH_REASONS: Final[FrozenSet[str]] = frozenset([
+    'application-requested',
+    'device-lost',
+])
+
+
+@dataclass
+class ReattachRecord:
+    reason: str
+    old_pid: Optional[int]
+    new_pid: Optional[int]
+    detached_at: float
+    attached_at: Optional[float] = None
+
+    @property
+    def latency(self) -> Optional[float]:
+        if self.attached_at is None:
+            return None
+        return self.attached_at - self.detached_at
+
+
+class SessionSupervisor:
+    device: Final[frida.core.Device]
+    session: Final[SessionWrapper]
+    script: Final[ScriptWrapper]
+    mode: Final[Literal['attach', 'spawn']]
+    app: Final[Optional[str]]
+    history: List[ReattachRecord]
+
+    _conf: Reattach
+    _pid: Optional[int]
+    _lock: Lock
+    _stopped: Event
+
+    def __init__(
+        self, device: frida.core.Device, session: SessionWrapper, script: ScriptWrapper, pid: int, *,
+        mode: Literal['attach', 'spawn'], app: Optional[str], conf: Reattach,
+    ):
+        self.device = device
+        self.session = session
+        self.script = script
+        self.mode = mode
+        self.app = app
+        self.history = []
+        self._conf = conf
+        self._pid = pid
+        self._lock = Lock()
+        self._stopped = Event()
+        session.on('detached', self._on_detached)
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._pid
+
+    @property
+    def lost_time(self) -> float:
+        return sum(v.latency for v in self.history if v.latency is not None)
+
+    def stop(self):
+        self._stopped.set()
+
+    def _on_detached(self, reason: str, crash: Optional[frida._frida.Crash]) -> None:
+        if self._stopped.is_set() or reason in NO_REATTACH_REASONS:
+            return
+        if not self.app:
+            print(f'[reattach] 未指定目标app, 无法重连', file=sys.stderr)
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        record = ReattachRecord(reason=reason, old_pid=self._pid, new_pid=None, detached_at=time.time())
+        self.history.append(record)
+        # frida的回调线程中不能阻塞
+        Thread(target=self._reattach, args=(record,), daemon=True).start()
+
+    def _reattach(self, record: ReattachRecord):
+        try:
+            print(f'[reattach] pid[{record.old_pid}] reason[{record.reason}] 等待目标[{self.app}]重新就绪...', file=sys.stderr)
+            while not self._stopped.is_set():
+                pid = self._locate(record)
+                if pid is None:
+                    print(f'[reattach] 等待目标[{self.app}]超时, 放弃重连', file=sys.stderr)
+                    return
+                try:
+                    self.session.rebind(self.device.attach(pid))
+                    self.session.recreate_script(self.script)
+                    self.script.load()
+                    if self.script._flow_controller is not None:
+                        self.script.start_flow_control()
+                    if self.mode == 'spawn':
+                        self.device.resume(pid)
+                except (frida.ProcessNotFoundError, frida.TransportError, frida.InvalidOperationError) as e:
+                    print(f'[reattach] pid[{pid}] 重连失败: {e}', file=sys.stderr)
+                    if self.mode == 'spawn':
+                        # 下一轮会重新spawn, 先结束这次挂起的进程
+                        try:
+                            self.device.kill(pid)
+                        except (frida.ProcessNotFoundError, frida.TransportError, frida.InvalidOperationError):
+                            pass
+                    self._stopped.wait(self._conf.interval)
+                    continue
+
+                self._pid = pid
+                record.new_pid = pid
+                record.attached_at = time.time()
+                print(f'[reattach] pid[{record.old_pid} => {pid}] 耗时 {record.latency * 1000:.0f} ms, '
+                      f'累计丢失 {self.lost_time * 1000:.0f} ms', file=sys.stderr)
+                return
+        finally:
+            self._lock.release()
+
+    def _locate(self, record: ReattachRecord) -> Optional[int]:
+        # 连接断开(如frida-server重启)时目标进程仍在, pid不变也可以重新附加
+        allow_same = record.reason != 'process-terminated'
+        deadline = None if self._conf.timeout is None else time.time() + self._conf.timeout
+        while not self._stopped.is_set():
+            if self.mode == 'spawn':
+                return self.device.spawn([self.app])
+            pid = find_app_pid(self.device, self.app)
+            if pid and (allow_same or pid != self._pid):
+                return pid
+            if deadline is not None and time.time() >= deadline:
+                break
+            self._stopped.wait(self._conf.interval)
+        return None
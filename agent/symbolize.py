@@ -0,0 +1,130 @@
+from typing import Final, Optional, List, Dict, Sequence, Union, Callable
+from agent.procmaps import ProcMaps, ModuleRange, PROC_MAPS
+from agent.elf.symbols import SymbolTable
+from agent.elf.cache import ElfCache, get_elf_cache
+from agent.store.chunk import ChunkStore, get_chunk_store
+from collections import OrderedDict
+from threading import Lock
+from pathlib import Path
+import numpy as np
+
+
+class Symbolizer:
+    maps: Final[ProcMaps]
+    symbol_dirs: List[Path]
+    cache_size: Final[int]
+
+    _store_getter: Callable[[], Optional[ChunkStore]]
+    _elf_cache_getter: Callable[[], ElfCache]
+    _tables: Dict[str, SymbolTable]
+    # 未找到符号表的模块 -> 当时的maps generation; 模块dump可能稍后才到, 只在同一generation内不再重试
+    _missing: Dict[str, int]
+    _cache: 'OrderedDict[int, str]'
+    _generation: int
+    _lock: Lock
+
+    def __init__(
+        self, maps: ProcMaps = PROC_MAPS, symbol_dirs: Sequence[Union[str, Path]] = (),
+        store_getter: Callable[[], Optional[ChunkStore]] = get_chunk_store,
+        elf_cache_getter: Callable[[], ElfCache] = get_elf_cache, cache_size: int = 1 << 16,
+    ):
+        self.maps = maps
+        self.symbol_dirs = [Path(v) for v in symbol_dirs]
+        self.cache_size = cache_size
+        self._store_getter = store_getter
+        self._elf_cache_getter = elf_cache_getter
+        self._tables = {}
+        self._missing = {}
+        self._cache = OrderedDict()
+        self._generation = maps.generation
+        self._lock = Lock()
+
+    def _load_table(self, mod: ModuleRange) -> Optional[SymbolTable]:
+        for d in self.symbol_dirs:
+            for fp in (d / mod.path.lstrip('/'), d / mod.name):
+                if fp.is_file():
+                    try:
+                        return self._elf_cache_getter().analyze_file(fp).symbols
+                    except (ValueError, IndexError, OSError):
+                        pass
+        store = self._store_getter()
+        if store is not None:
+            # dump以tag命名, 按记录的模块路径查找
+            manifest = store.find('elfModule', module=mod.path)
+            if manifest is not None:
+                try:
+                    data = store.materialize(manifest)
+                    return self._elf_cache_getter().analyze_bytes(data, is_image=True, base=mod.base).symbols
+                except (ValueError, IndexError, OSError):
+                    pass
+        return None
+
+    def symbols_for(self, mod: ModuleRange) -> Optional[SymbolTable]:
+        table = self._tables.get(mod.path)
+        if table is not None:
+            return table
+        generation = self.maps.generation
+        if self._missing.get(mod.path) == generation:
+            return None
+        table = self._load_table(mod)
+        if table is None:
+            self._missing[mod.path] = generation
+        else:
+            self._tables[mod.path] = table
+            self._missing.pop(mod.path, None)
+        return table
+
+    def invalidate(self, path: Optional[str] = None):
+        # 模块的符号来源变化(如收到新的dump)后调用, 已格式化的地址一并清掉
+        with self._lock:
+            if path is None:
+                self._tables.clear()
+                self._missing.clear()
+            else:
+                self._tables.pop(path, None)
+                self._missing.pop(path, None)
+            self._cache.clear()
+
+    def _format(self, addr: int, mod: Optional[ModuleRange], offset: int) -> str:
+        if mod is None:
+            return hex(addr)
+        table = self.symbols_for(mod)
+        sym = table.lookup(offset) if table is not None else None
+        if sym is None:
+            return f'{hex(addr)} {mod.name}!{hex(offset)}'
+        name, delta = sym
+        return f'{hex(addr)} {mod.name}!{name}+{hex(delta)}'
+
+    def symbolize(self, addrs: Union[np.ndarray, Sequence[int]]) -> List[str]:
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        with self._lock:
+            if self._generation != self.maps.generation:
+                # maps变化后地址归属可能改变
+                self._generation = self.maps.generation
+                self._cache.clear()
+            cache = self._cache
+            results: List[Optional[str]] = [cache.get(v) for v in addrs.tolist()]
+            missing = [i for i, v in enumerate(results) if v is None]
+            if missing:
+                miss_addrs = addrs[missing]
+                module_ids, offsets = self.maps.resolve(miss_addrs)
+                for i, addr, mid, off in zip(missing, miss_addrs.tolist(), module_ids.tolist(), offsets.tolist()):
+                    text = self._format(addr, self.maps.modules[mid] if mid >= 0 else None, off)
+                    results[i] = text
+                    cache[addr] = text
+            for addr in addrs.tolist():
+                cache.move_to_end(addr)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return results
+
+
+_SYMBOLIZER: Optional[Symbolizer] = None
+
+
+def get_symbolizer() -> Symbolizer:
+    global _SYMBOLIZER
+    if _SYMBOLIZER is None:
+        from agent.config import Config
+        _SYMBOLIZER = Symbolizer(symbol_dirs=Config.get().agent.symbol_dirs)
+    return _SYMBOLIZER
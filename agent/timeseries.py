@@ -0,0 +1,420 @@
+from typing import Final, Optional, List, Dict, Tuple, Any, Iterator, Callable, Union
+from agent.config import Config, TimeSeries
+from threading import Lock, Timer
+from pathlib import Path
+import numpy as np
+import shutil
+import atexit
+import json
+import time
+import sys
+import os
+
+
+# 每行固定的列, 其余为 data.xxx 展开后的字段
+COLUMN_TS: Final[str] = 'ts'
+COLUMN_TID: Final[str] = 'tid'
+COLUMN_SOURCE: Final[str] = 'source'
+COLUMN_SIZE: Final[str] = 'data_size'
+
+# 列文件按块内序号命名(c0000.npy), 列名可能含有'/'等字符, 对应关系记录在meta.json的files中.
+# 字符串列按块做字典编码: <列文件>.npy 为int32编码, -1表示空值
+KIND_INT: Final[str] = 'i8'
+KIND_FLOAT: Final[str] = 'f8'
+KIND_BOOL: Final[str] = 'b1'
+KIND_STR: Final[str] = 'str'
+
+ColumnFilter = Union[Any, Tuple[Any, Any], List[Any], Callable[[np.ndarray], np.ndarray]]
+
+
+def flatten_payload(data: Dict[str, Any], prefix: str = 'data.', out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # 嵌套dict按 a.b 展开, list等其他类型序列化为json字符串
+    if out is None:
+        out = {}
+    for k, v in data.items():
+        key = prefix + k
+        if isinstance(v, dict):
+            flatten_payload(v, key + '.', out)
+        elif isinstance(v, (list, tuple)):
+            out[key] = json.dumps(v, ensure_ascii=False, default=str)
+        else:
+            out[key] = v
+    return out
+
+
+def _column_kind(values: List[Any]) -> str:
+    kinds = set()
+    for v in values:
+        if v is None:
+            kinds.add(None)
+        elif isinstance(v, bool):
+            kinds.add(KIND_BOOL)
+        elif isinstance(v, int):
+            kinds.add(KIND_INT if -(1 << 63) <= v < (1 << 63) else KIND_STR)
+        elif isinstance(v, float):
+            kinds.add(KIND_FLOAT)
+        else:
+            kinds.add(KIND_STR)
+    has_none = None in kinds
+    kinds.discard(None)
+    if kinds == {KIND_BOOL} and not has_none:
+        return KIND_BOOL
+    if kinds == {KIND_INT} and not has_none:
+        return KIND_INT
+    # 数值列中的空值以NaN表示
+    if kinds and kinds <= {KIND_INT, KIND_FLOAT}:
+        return KIND_FLOAT
+    return KIND_STR
+
+
+def _encode_column(values: List[Any]) -> Tuple[str, np.ndarray, Optional[List[str]]]:
+    kind = _column_kind(values)
+    if kind == KIND_BOOL:
+        return kind, np.array(values, dtype=np.bool_), None
+    if kind == KIND_INT:
+        return kind, np.array(values, dtype=np.int64), None
+    if kind == KIND_FLOAT:
+        return kind, np.array([np.nan if v is None else v for v in values], dtype=np.float64), None
+    vocab: Dict[str, int] = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            codes[i] = -1
+            continue
+        v = v if isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str)
+        code = vocab.get(v)
+        if code is None:
+            code = vocab[v] = len(vocab)
+        codes[i] = code
+    return kind, codes, list(vocab)
+
+
+class ColumnBlock:
+    # 一个已落盘的只读块, 列按需以mmap加载
+    path: Final[Path]
+    meta: Dict[str, Any]
+
+    _cache: Dict[str, np.ndarray]
+    _vocab: Dict[str, List[str]]
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / 'meta.json').read_text(encoding='utf-8'))
+        self._cache = {}
+        self._vocab = {}
+
+    def __repr__(self):
+        return f'<ColumnBlock {self.path.name} rows={self.rows}>'
+
+    @property
+    def rows(self) -> int:
+        return int(self.meta['rows'])
+
+    @property
+    def columns(self) -> Dict[str, str]:
+        return self.meta['columns']
+
+    def _file(self, name: str) -> str:
+        # 早期的块直接以列名作为文件名
+        return self.meta.get('files', {}).get(name, name)
+
+    def overlaps(self, start: Optional[int], end: Optional[int]) -> bool:
+        return (start is None or self.meta['ts_max'] >= start) and (end is None or self.meta['ts_min'] < end)
+
+    def raw(self, name: str) -> Optional[np.ndarray]:
+        if name not in self.columns:
+            return None
+        arr = self._cache.get(name)
+        if arr is None:
+            arr = self._cache[name] = np.load(self.path / f'{self._file(name)}.npy', mmap_mode='r')
+        return arr
+
+    def vocab(self, name: str) -> List[str]:
+        vocab = self._vocab.get(name)
+        if vocab is None:
+            vocab = self._vocab[name] = json.loads((self.path / f'{self._file(name)}.dict.json').read_text(encoding='utf-8'))
+        return vocab
+
+    def mask(self, name: str, cond: ColumnFilter) -> np.ndarray:
+        arr = self.raw(name)
+        if arr is None:
+            return np.zeros(self.rows, dtype=np.bool_)
+        if self.columns[name] == KIND_STR:
+            # 先在字典上求值, 再按编码筛选, 不解码整列
+            vocab = self.vocab(name)
+            if callable(cond):
+                hit = np.flatnonzero(cond(np.array(vocab, dtype=object))) if vocab else np.empty(0, dtype=np.int64)
+            else:
+                wanted = set(cond) if isinstance(cond, list) else {cond}
+                hit = [i for i, v in enumerate(vocab) if v in wanted]
+            return np.isin(arr, np.asarray(hit, dtype=np.int32))
+        if callable(cond):
+            return np.asarray(cond(arr), dtype=np.bool_)
+        if isinstance(cond, tuple):
+            lo, hi = cond
+            mask = np.ones(self.rows, dtype=np.bool_)
+            if lo is not None:
+                mask &= arr >= lo
+            if hi is not None:
+                mask &= arr < hi
+            return mask
+        if isinstance(cond, list):
+            return np.isin(arr, cond)
+        return arr == cond
+
+    def take(self, name: str, index: np.ndarray) -> np.ndarray:
+        arr = self.raw(name)
+        if arr is None:
+            return np.full(len(index), None, dtype=object)
+        values = np.asarray(arr[index])
+        if self.columns[name] != KIND_STR:
+            return values
+        vocab = np.array(self.vocab(name) + [None], dtype=object)
+        return vocab[values]
+
+
+class ColumnTable:
+    # 单个消息类型的追加写表: 内存中按行缓冲, 满block_rows行或定时刷新时转为一个列式块
+    root: Final[Path]
+    name: Final[str]
+    block_rows: int
+
+    _rows: List[Dict[str, Any]]
+    _blocks: List[ColumnBlock]
+    _seq: int
+    _lock: Lock
+
+    def __init__(self, root: Union[str, Path], name: str, block_rows: int = 8192):
+        self.root = Path(root)
+        self.name = name
+        self.block_rows = block_rows
+        self._rows = []
+        self._lock = Lock()
+        self._blocks = []
+        self._seq = 0
+        if self.root.is_dir():
+            for fp in sorted(self.root.glob('block_*/meta.json')):
+                self._blocks.append(ColumnBlock(fp.parent))
+            if self._blocks:
+                self._seq = int(self._blocks[-1].path.name.split('_', 1)[1]) + 1
+
+    def __repr__(self):
+        return f'<ColumnTable {self.name} blocks={len(self._blocks)} pending={len(self._rows)}>'
+
+    def __len__(self):
+        return sum(v.rows for v in self._blocks) + len(self._rows)
+
+    def append(self, row: Dict[str, Any]):
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.block_rows:
+                return
+            rows, self._rows = self._rows, []
+            self._write(rows)
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        # 先写到临时目录再整体改名; 失败时删除临时目录并把行放回缓冲, 下次刷新时重试
+        path = self.root / f'block_{self._seq:08d}'
+        tmp = self.root / f'.{path.name}.{os.getpid()}.tmp'
+        try:
+            self._write_block(tmp, rows)
+            os.replace(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            self._rows[:0] = rows
+            raise
+        self._seq += 1
+        self._blocks.append(ColumnBlock(path))
+
+    @staticmethod
+    def _write_block(path: Path, rows: List[Dict[str, Any]]):
+        names: Dict[str, None] = {}
+        for row in rows:
+            names.update(dict.fromkeys(row))
+        path.mkdir(parents=True, exist_ok=True)
+        columns: Dict[str, str] = {}
+        files: Dict[str, str] = {}
+        for i, name in enumerate(names):
+            kind, arr, vocab = _encode_column([row.get(name) for row in rows])
+            columns[name] = kind
+            files[name] = f'c{i:04d}'
+            np.save(path / f'{files[name]}.npy', arr)
+            if vocab is not None:
+                (path / f'{files[name]}.dict.json').write_text(json.dumps(vocab, ensure_ascii=False), encoding='utf-8')
+        ts = [row[COLUMN_TS] for row in rows]
+        meta = {'rows': len(rows), 'ts_min': min(ts), 'ts_max': max(ts), 'columns': columns, 'files': files}
+        (path / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+    def blocks(self) -> List[ColumnBlock]:
+        with self._lock:
+            return list(self._blocks)
+
+    def columns(self) -> Dict[str, str]:
+        columns: Dict[str, str] = {}
+        for block in self.blocks():
+            columns.update(block.columns)
+        return columns
+
+    def query(
+        self, start: Optional[int] = None, end: Optional[int] = None,
+        where: Optional[Dict[str, ColumnFilter]] = None, columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        # 时间范围按块元数据剪枝, 只读取ts/过滤列/输出列; 时间为纳秒, 区间左闭右开
+        self.flush()
+        where = where or {}
+        # 输出列在遍历前确定: 各块的列集合可能不同, 块中缺少的列由take补None, 保证各列行数一致
+        names = columns or list(self.columns())
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        matched = False
+        for block in self.blocks():
+            if not block.overlaps(start, end):
+                continue
+            mask = np.ones(block.rows, dtype=np.bool_)
+            if start is not None or end is not None:
+                mask &= block.mask(COLUMN_TS, (start, end))
+            for name, cond in where.items():
+                if not mask.any():
+                    break
+                mask &= block.mask(name, cond)
+            index = np.flatnonzero(mask)
+            if not len(index):
+                continue
+            matched = True
+            for name, values in parts.items():
+                values.append(block.take(name, index))
+        result: Dict[str, np.ndarray] = {}
+        if not matched:
+            return result
+        for name, values in parts.items():
+            # 各块中同名列类型可能不同, 不一致时退化为object
+            dtypes = {v.dtype for v in values}
+            result[name] = np.concatenate(values) if len(dtypes) == 1 else np.concatenate([v.astype(object) for v in values])
+        return result
+
+
+class TimeSeriesStore:
+    # RPCResolver收到的消息按类型写入各自的列式表, 用于事后按时间/字段查询
+    root: Final[Path]
+    conf: Final[TimeSeries]
+
+    _tables: Dict[str, ColumnTable]
+    _lock: Lock
+    _timer: Optional[Timer]
+
+    def __init__(self, root: Union[str, Path], conf: TimeSeries):
+        self.root = Path(root)
+        self.conf = conf
+        self._tables = {}
+        self._lock = Lock()
+        self._timer = None
+        if self.root.is_dir():
+            for fp in sorted(self.root.iterdir()):
+                if fp.is_dir():
+                    self._tables[fp.name] = ColumnTable(fp, fp.name, conf.block_rows)
+
+    def __repr__(self):
+        return f'<TimeSeriesStore {self.root} types={list(self._tables)}>'
+
+    def table(self, typ: str) -> ColumnTable:
+        table = self._tables.get(typ)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(typ)
+                if table is None:
+                    table = self._tables[typ] = ColumnTable(self.root / typ, typ, self.conf.block_rows)
+        return table
+
+    def types(self) -> List[str]:
+        return list(self._tables)
+
+    def _accept(self, typ: Optional[str]) -> bool:
+        if not typ or typ in self.conf.exclude:
+            return False
+        return not self.conf.types or typ in self.conf.types
+
+    def _append(self, message: Dict[str, Any], ts: int, size: int, source: Optional[str] = None):
+        typ = message.get('type')
+        if not self._accept(typ):
+            return
+        row = {COLUMN_TS: ts, COLUMN_TID: message.get('tid'), COLUMN_SOURCE: message.get('source') or source, COLUMN_SIZE: size}
+        data = message.get('data')
+        if isinstance(data, dict):
+            flatten_payload(data, out=row)
+        self.table(typ).append(row)
+
+    def record(self, message: Dict[str, Any], data: Optional[bytes] = None, ts: Optional[int] = None):
+        # message为agent发送的原始payload, BATCH直接展开其中的消息列表, 不需要切分二进制数据.
+        # 在RPC线程中调用, 出错只打印, 不影响消息分发
+        ts = time.time_ns() if ts is None else ts
+        try:
+            if message.get('type') == 'BATCH':
+                batch = message.get('data') or {}
+                sizes = batch.get('data_sizes') or []
+                for i, msg in enumerate(batch.get('message_list') or []):
+                    self._append(msg, ts, sizes[i] if i < len(sizes) else 0, message.get('source'))
+            else:
+                self._append(message, ts, len(data) if data else 0)
+        except Exception as e:
+            print(f'[timeseries] 记录{message.get("type")}失败: {e}', file=sys.stderr)
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = Timer(self.conf.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            tables = list(self._tables.values())
+        for table in tables:
+            try:
+                table.flush()
+            except Exception as e:
+                print(f'[timeseries] 写入{table.name}失败: {e}', file=sys.stderr)
+
+    def query(
+        self, typ: str, start: Optional[float] = None, end: Optional[float] = None,
+        where: Optional[Dict[str, ColumnFilter]] = None, columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        # start/end为秒级时间戳(time.time())
+        table = self._tables.get(typ)
+        if table is None:
+            return {}
+        return table.query(
+            None if start is None else int(start * 1e9), None if end is None else int(end * 1e9),
+            where, columns,
+        )
+
+    def iter_rows(self, typ: str, **kwargs) -> Iterator[Dict[str, Any]]:
+        result = self.query(typ, **kwargs)
+        names = list(result)
+        for values in zip(*(result[v] for v in names)):
+            yield dict(zip(names, values))
+
+
+_TIMESERIES: Optional[TimeSeriesStore] = None
+_TIMESERIES_LOCK: Final[Lock] = Lock()
+
+
+def get_timeseries() -> Optional[TimeSeriesStore]:
+    global _TIMESERIES
+    if _TIMESERIES is None:
+        conf = Config.get()
+        if not conf.agent.datadir or not conf.agent.timeseries.enable:
+            return None
+        with _TIMESERIES_LOCK:
+            if _TIMESERIES is None:
+                _TIMESERIES = TimeSeriesStore(Path(conf.agent.datadir) / 'timeseries', conf.agent.timeseries)
+                atexit.register(_TIMESERIES.flush)
+    return _TIMESERIES
@@ -7,6 +7,7 @@ import atexit
 import io
 import os
 import sys
+import frida
 
 
 def ensure_filepath(filepath: str):
@@ -38,3 +39,13 @@ def ensure_filepath_open(
         yield f
             
     
+
+
+def find_app_pid(device: frida.core.Device, app_id: str) -> Optional[int]:
+    scope = 'minimal'
+    apps = device.enumerate_applications(scope=scope)
+    for app in apps:
+        if app.identifier.strip() == app_id:
+            return app.pid
+
+    return None
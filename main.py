@@ -1,7 +1,11 @@
 from agent.rpc.handler.js_handle import JsHandle
 from agent.config import Config
 from agent.rpc.resolver import RPC
-from agent.session import SessionWrapper
+from agent.session import SessionWrapper, ScriptEnv
+from agent.supervisor import SessionSupervisor
+from agent.builder import build_agent
+from agent.timeseries import get_timeseries
+from agent.utils import find_app_pid
 from typing import Optional
 from frida_tools import ps
 import subprocess
@@ -14,23 +18,12 @@ import sys
 import os
 
 
-def find_app_pid(device: frida.core.Device, app_id: str):
-    scope = 'minimal'
-    apps = device.enumerate_applications(scope=scope)
-    for app in apps:
-        if app.identifier.strip() == app_id:
-            return app.pid
-
-    return None
-
-
-
 def on_session_detached(reason: str, crash: Optional[frida._frida.Crash]) -> None:
     print(reason, file=sys.stderr)
     if crash:
         print(crash.report, file=sys.stderr)
     time.sleep(1)
-    if os.environ.get('REPL', False):
+    if os.environ.get('REPL', False) and not Config.get().agent.reattach.enable:
         print('脚本已中止，可自行退出REPL')
     
 
@@ -71,17 +64,39 @@ def spawn(config: str = 'config.yml'):
     if not conf.app:
         raise AttributeError('未指定目标app')
 
+    # 目标进程挂起/附加前完成打包, 保证加载的是最新产物
+    builder = build_agent(conf.jsfile, conf.agent.build)
+    timeseries = get_timeseries()
+    if timeseries is not None:
+        RPC.set_recorder(timeseries.record)
     device = frida.get_device_manager().add_remote_device(conf.server.host)
     pid = device.spawn([conf.app])
     session = SessionWrapper.from_session(device.attach(pid))
     session.on('detached', on_session_detached)
 
-    script = session.open_script(conf.jsfile)
-    script.set_logger(conf.agent.stdout, conf.agent.stderr)
+    env = ScriptEnv(
+        SendRules=[v.model_dump(exclude_none=True) for v in conf.agent.send_rules],
+        SymbolCache=conf.agent.symbol_cache and conf.agent.datadir is not None,
+    )
+    script = session.open_script(conf.jsfile, env=env)
+    script.set_logger(conf.agent.stdout, conf.agent.stderr, conf.agent.log_collapse)
+    if env.SymbolCache:
+        script.serve_symbol_cache()
     script.load()
+    if conf.agent.flow_control.enable:
+        script.start_flow_control(conf.agent.flow_control)
+        if not conf.agent.reattach.enable:
+            session.on('detached', lambda reason, crash: script.stop_flow_control())
     device.resume(pid)
+
+    supervisor = None
+    if conf.agent.reattach.enable:
+        supervisor = SessionSupervisor(device, session, script, pid, mode='spawn', app=conf.app, conf=conf.agent.reattach)
     
     def on_exit():
+        if supervisor:
+            supervisor.stop()
+        script.stop_flow_control()
         session.detach()
 
     atexit.register(on_exit)
@@ -99,6 +114,11 @@ def attach(pid: Optional[int] = None, config: str = 'config.yml'):
     conf = Config.get()
 
 
+    # 目标进程挂起/附加前完成打包, 保证加载的是最新产物
+    builder = build_agent(conf.jsfile, conf.agent.build)
+    timeseries = get_timeseries()
+    if timeseries is not None:
+        RPC.set_recorder(timeseries.record)
     device = frida.get_device_manager().add_remote_device(conf.server.host)
     if pid is None and conf.app:
         pid = find_app_pid(device, conf.app)
@@ -108,11 +128,28 @@ def attach(pid: Optional[int] = None, config: str = 'config.yml'):
     session = SessionWrapper.from_session(device.attach(pid))
     session.on('detached', on_session_detached)
 
-    script = session.open_script(conf.jsfile)
-    script.set_logger(conf.agent.stdout, conf.agent.stderr)
+    env = ScriptEnv(
+        SendRules=[v.model_dump(exclude_none=True) for v in conf.agent.send_rules],
+        SymbolCache=conf.agent.symbol_cache and conf.agent.datadir is not None,
+    )
+    script = session.open_script(conf.jsfile, env=env)
+    script.set_logger(conf.agent.stdout, conf.agent.stderr, conf.agent.log_collapse)
+    if env.SymbolCache:
+        script.serve_symbol_cache()
     script.load()
+    if conf.agent.flow_control.enable:
+        script.start_flow_control(conf.agent.flow_control)
+        if not conf.agent.reattach.enable:
+            session.on('detached', lambda reason, crash: script.stop_flow_control())
+
+    supervisor = None
+    if conf.agent.reattach.enable:
+        supervisor = SessionSupervisor(device, session, script, pid, mode='attach', app=conf.app, conf=conf.agent.reattach)
 
     def on_exit():
+        if supervisor:
+            supervisor.stop()
+        script.stop_flow_control()
         session.detach()
 
     atexit.register(on_exit)
@@ -2,6 +2,9 @@
 
 
 
+import { RPCMsgType } from './message.js'
+
+
 export function setGlobalProperties(keyValues: { [key: string]: any }): void {
     for (let [k, v] of Object.entries(keyValues)) {
         if (k in global) {
@@ -35,14 +38,41 @@ declare global {
 
 }
 
+export type SendRule = {
+    type?: string
+    source?: string
+    tag?: string
+    action: string
+    // sample: 每n条放行1条
+    n?: number
+    // rate_limit: 每秒放行条数及突发容量
+    rate?: number
+    burst?: number
+}
+
+
 export class Config {
     static OnRPC: boolean = false
     static OutputDir?: string
     static LogLevel: number = LogLevel.INFO
     static LogCollapse: boolean = true
+    static SendRules: SendRule[] = []
+    static SymbolCache: boolean = false
 }
 
 
+function listenConfigUpdate() {
+    recv(RPCMsgType.INIT_CONFIG, (message: { data: { [key: string]: any } }) => {
+        Object.entries(message.data || {}).forEach(([k, v]) => {
+            (Config as any)[k] = v
+        })
+        listenConfigUpdate()
+    })
+}
+
+listenConfigUpdate()
+
+
 
 setGlobalProperties({
     'Config': Config,
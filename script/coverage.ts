@@ -0,0 +1,80 @@
+import { EventChannel, EventFieldType } from './event.js'
+import { setGlobalProperties } from './config.js'
+import { help } from './helper.js'
+
+
+export class Coverage {
+    private static _channel: EventChannel | null = null
+    private static _seen: Set<string> = new Set()
+    private static _threads: Set<number> = new Set()
+
+    private static get channel(): EventChannel {
+        if (this._channel === null) {
+            this._channel = new EventChannel('coverage', [
+                ['start', EventFieldType.PTR],
+                ['size', EventFieldType.U16],
+            ], { capacity: 8192 })
+        }
+        return this._channel
+    }
+
+    // 只上报编译事件: 每个基本块只在首次编译时产生一次, 主机侧按模块位图累积
+    static follow(threadId: number = Process.getCurrentThreadId(), { modules = [] }: { modules?: string[] } = {}) {
+        if (this._threads.has(threadId)) {
+            return
+        }
+        if (!this._threads.size) {
+            // 主机侧需要最新的maps来把地址归属到模块
+            help.dumpProcMaps('coverage')
+            if (modules.length) {
+                const wanted = new Set(modules)
+                for (const mod of Process.enumerateModules()) {
+                    if (!wanted.has(mod.name) && !wanted.has(mod.path)) {
+                        Stalker.exclude(mod)
+                    }
+                }
+            }
+        }
+        const channel = this.channel
+        const seen = this._seen
+        this._threads.add(threadId)
+        Stalker.follow(threadId, {
+            events: { compile: true },
+            onReceive(events: ArrayBuffer) {
+                const blocks = Stalker.parse(events, { annotate: false, stringify: false }) as [NativePointer, NativePointer][]
+                for (const [start, end] of blocks) {
+                    // 多线程各自编译同一块, 只发送一次
+                    const key = start.toString()
+                    if (seen.has(key)) {
+                        continue
+                    }
+                    seen.add(key)
+                    channel.emit(start, Math.min(end.sub(start).toInt32(), 0xffff))
+                }
+            },
+        })
+    }
+
+    static unfollow(threadId: number = Process.getCurrentThreadId()) {
+        if (!this._threads.delete(threadId)) {
+            return
+        }
+        Stalker.unfollow(threadId)
+        Stalker.flush()
+        this._channel?.flush()
+    }
+
+    static flush() {
+        Stalker.flush()
+        this._channel?.flush()
+    }
+
+    static stats() {
+        return { threads: [...this._threads], blocks: this._seen.size }
+    }
+}
+
+
+setGlobalProperties({
+    Coverage,
+})
@@ -9,6 +9,7 @@ import { help , downAlign, upAlign, page_end, page_start } from '../helper.js'
 import { ArrayPointer } from '../utils/array_pointer.js'
 import { setGlobalProperties } from '../config.js'
 import { saveFileSource } from '../message.js'
+import { SymbolCache, CachedSymbol, CachedTables } from './symcache.js'
 
 
 interface ElfModuleX extends BaseModule {}
@@ -19,7 +20,7 @@ declare global {
         name: string
         base: NativePointer
         size: number
-
+        path?: string
     }
 }
 
@@ -36,6 +37,7 @@ class ElfModuleX {
     dyntabs: Dyn[] | null
     shdrs: Shdr[] | null = null
     soinfo: Soinfo | null
+    buildId: string | null
     dynSymbols: Sym[] | null
     rela: Rela[] | null
     plt_rela: Rela[] | null
@@ -55,7 +57,14 @@ class ElfModuleX {
         this.phdrs = this.readPhdrs()
         this.dyntabs = this.readDyntabs()
         this.soinfo = this.prelink_image()
-        this.dynSymbols = this.scanSymbols(0, symbolScanLimit)
+        this.buildId = this.readBuildId()
+
+        // 主机侧有该build-id的符号表时直接使用, 否则在设备上解析
+        const cached: CachedTables | null = this.buildId ? SymbolCache.query(this.buildId, this.name) : null
+        this.dynSymbols = cached?.dynsym ? this.loadCachedSymbols(cached.dynsym) : this.scanSymbols(0, symbolScanLimit)
+        if (cached?.symtab) {
+            this.symtab = this.loadCachedSymbols(cached.symtab)
+        }
 
         try {
             this.shdrs = this.readShdrs()
@@ -165,6 +174,31 @@ class ElfModuleX {
 
     load_bias(value: number | NativePointer) { return this.module.base.add(value) }
 
+    readBuildId(): string | null {
+        const NT_GNU_BUILD_ID = 3
+        const align4 = (v: number) => (v + 3) & ~3
+        for (let phdr of this.phdrs) {
+            // PT_NOTE
+            if (phdr.p_type !== 0x4) {
+                continue
+            }
+            let off = 0
+            while (off + 12 <= phdr.p_filesz) {
+                const note = this.module.base.add(phdr.p_vaddr + off)
+                const namesz = note.readU32()
+                const descsz = note.add(4).readU32()
+                const type = note.add(8).readU32()
+                const desc = note.add(12 + align4(namesz))
+                if (type === NT_GNU_BUILD_ID && note.add(12).readCString(namesz) === 'GNU') {
+                    return Array.from(new Uint8Array(desc.readByteArray(descsz)!))
+                        .map(v => v.toString(16).padStart(2, '0')).join('')
+                }
+                off += 12 + align4(namesz) + align4(descsz)
+            }
+        }
+        return null
+    }
+
     prelink_image() {
         if (this.dyntabs === null) {
             return null
@@ -335,36 +369,46 @@ class ElfModuleX {
             if (name == null) {
                 break
             }
-            let implPtr = ptr(structOf.St_Value(cellBase))
-            const st_info = structOf.St_Info(cellBase)
-            const st_shndx = structOf.St_Shndx(cellBase)
-            const st_other = structOf.St_Other(cellBase)
+            const sym = this.makeSym(
+                name, nameIDX,
+                structOf.St_Info(cellBase), structOf.St_Other(cellBase), structOf.St_Shndx(cellBase),
+                ptr(structOf.St_Value(cellBase)), structOf.St_Size(cellBase),
+            )
+            symbols.push(sym)
+        }
+        return symbols
+    }
 
-            if ([SYM_SHNDX.SHN_UNDEF, SYM_SHNDX.SHN_ABS].indexOf(st_shndx) === -1) {
-                if ([SYM_INFO_TYPE.STT_FUNC, SYM_INFO_TYPE.STT_OBJECT].indexOf(st_info & 0xF) !== -1) {
-                    if (!this.isMyAddr(implPtr)) {
-                        implPtr = this.module.base.add(implPtr)
-                    }
+    private makeSym(
+        name: string, st_name: number, st_info: number, st_other: number, st_shndx: number,
+        st_value: NativePointer, st_size: number,
+    ): Sym {
+        let implPtr = st_value
+        if ([SYM_SHNDX.SHN_UNDEF, SYM_SHNDX.SHN_ABS].indexOf(st_shndx) === -1) {
+            if ([SYM_INFO_TYPE.STT_FUNC, SYM_INFO_TYPE.STT_OBJECT].indexOf(st_info & 0xF) !== -1) {
+                if (!this.isMyAddr(implPtr)) {
+                    implPtr = this.module.base.add(implPtr)
                 }
             }
+        }
+        return {
+            name: name,
+            relocPtr: null,
+            hook: null,
+            implPtr: implPtr,
+            linked: true,
 
-            const sym: Sym = {
-                name: name,
-                relocPtr: null,
-                hook: null,
-                implPtr: implPtr,
-                linked: true,
-
-                st_name: nameIDX,
-                st_info: st_info,
-                st_other: st_other,
-                st_shndx: st_shndx,
-                st_value: implPtr,
-                st_size: structOf.St_Size(cellBase),
-            }
-            symbols.push(sym)
+            st_name: st_name,
+            st_info: st_info,
+            st_other: st_other,
+            st_shndx: st_shndx,
+            st_value: implPtr,
+            st_size: st_size,
         }
-        return symbols
+    }
+
+    loadCachedSymbols(cached: CachedSymbol[]): Sym[] {
+        return cached.map(v => this.makeSym(v.name, v.st_name, v.st_info, v.st_other, v.st_shndx, v.st_value, v.st_size))
     }
 
     readRela() {
@@ -496,7 +540,7 @@ class ElfModuleX {
             makeRecovery()
         })
         if (buff) {
-            help.saveFile(tag, buff, 'wb', saveFileSource.elfModule)
+            help.saveFile(tag, buff, 'wb', saveFileSource.elfModule, { module: this.module.path, build_id: this.buildId })
         }
     }
 
@@ -733,10 +777,14 @@ export class ElfFileFixer implements ElfModuleFixer {
         try {
             const shdrs = this.readShdrs()
             if(shdrs){
+                modx.shdrs = shdrs
+                // 符号表已由主机侧缓存提供
+                if (modx.symtab) {
+                    return true
+                }
                 this.strtab = this.readStrtab()  
                 const symtab = this.readSymtab()
                 
-                modx.shdrs = shdrs
                 modx.strtab = this.strtab || null
                 modx.symtab = symtab
                 return true
@@ -0,0 +1,101 @@
+import { Config, setGlobalProperties } from '../config.js'
+import { RPCMsgType } from '../message.js'
+
+
+export type CachedSymbol = {
+    name: string
+    st_name: number
+    st_info: number
+    st_other: number
+    st_shndx: number
+    st_value: NativePointer
+    st_size: number
+}
+
+
+type CachedTableLayout = {
+    kind: string
+    offset: number
+    count: number
+    names_size: number
+}
+
+
+export type CachedTables = { [kind: string]: CachedSymbol[] }
+
+
+export class SymbolCache {
+    static hits: number = 0
+    static misses: number = 0
+
+    // 向主机查询模块符号表, 同步等待应答; 未启用或未命中时返回null, 由调用方在设备上解析
+    static query(buildId: string, name: string): CachedTables | null {
+        if (!Config.SymbolCache) {
+            return null
+        }
+        let result: CachedTables | null = null
+        send({
+            type: RPCMsgType.SYMBOL_CACHE,
+            data: { build_id: buildId, name },
+        })
+        const op = recv(RPCMsgType.SYMBOL_CACHE, (message: { data: any }, data: ArrayBuffer | null) => {
+            const reply = message.data
+            if (reply?.hit && data) {
+                result = SymbolCache.decode(reply.tables, data)
+            }
+        })
+        op.wait()
+        if (result) {
+            this.hits++
+        } else {
+            this.misses++
+        }
+        return result
+    }
+
+    // 布局见 agent/elf/symcache.py: 每张表按列存放 st_value/st_size(u64), st_name(u32), st_shndx(u16), st_info/st_other(u8), 随后是以\0分隔的符号名
+    static decode(tables: CachedTableLayout[], data: ArrayBuffer): CachedTables {
+        const result: CachedTables = {}
+        for (const { kind, offset, count, names_size } of tables) {
+            const values = new Uint32Array(data, offset, count * 2)
+            const sizes = new Uint32Array(data, offset + count * 8, count * 2)
+            const nameIdx = new Uint32Array(data, offset + count * 16, count)
+            const shndx = new Uint16Array(data, offset + count * 20, count)
+            const info = new Uint8Array(data, offset + count * 22, count)
+            const other = new Uint8Array(data, offset + count * 23, count)
+            const namesOffset = offset + count * 24
+            const names = new Uint8Array(data, namesOffset, names_size)
+
+            const strtab = Memory.alloc(names_size)
+            strtab.writeByteArray(data.slice(namesOffset, namesOffset + names_size))
+
+            const symbols: CachedSymbol[] = []
+            let cursor = 0
+            for (let i = 0; i < count; i++) {
+                let end = cursor
+                while (end < names_size && names[end] !== 0) end++
+                symbols.push({
+                    name: end > cursor ? strtab.add(cursor).readUtf8String(end - cursor)! : '',
+                    st_name: nameIdx[i],
+                    st_info: info[i],
+                    st_other: other[i],
+                    st_shndx: shndx[i],
+                    st_value: ptr(values[i * 2 + 1]).shl(32).or(values[i * 2]),
+                    st_size: sizes[i * 2] + sizes[i * 2 + 1] * 0x100000000,
+                })
+                cursor = end + 1
+            }
+            result[kind] = symbols
+        }
+        return result
+    }
+
+    static stats() {
+        return { hits: this.hits, misses: this.misses }
+    }
+}
+
+
+setGlobalProperties({
+    SymbolCache,
+})
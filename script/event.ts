@@ -0,0 +1,153 @@
+import { BatchSender, help } from './helper.js'
+import { RPCMsgType, batchSendSource } from './message.js'
+import { setGlobalProperties } from './config.js'
+
+
+// 字段类型名与numpy dtype一致(小端, 紧凑排布), 主机侧按此直接解码为结构化数组
+export const enum EventFieldType {
+    U8 = 'u1',
+    I8 = 'i1',
+    U16 = 'u2',
+    I16 = 'i2',
+    U32 = 'u4',
+    I32 = 'i4',
+    U64 = 'u8',
+    I64 = 'i8',
+    F32 = 'f4',
+    F64 = 'f8',
+    // 指针按u64存放
+    PTR = 'ptr',
+}
+
+
+const FIELD_SIZES: { [key: string]: number } = {
+    u1: 1, i1: 1, u2: 2, i2: 2, u4: 4, i4: 4, u8: 8, i8: 8, f4: 4, f8: 8, ptr: 8,
+}
+
+
+export type EventField = [string, string]
+
+
+export class EventSchema {
+    readonly name: string
+    readonly fields: EventField[]
+    readonly offsets: number[]
+    readonly size: number
+
+    constructor(name: string, fields: EventField[]) {
+        this.name = name
+        this.fields = fields
+        this.offsets = []
+        let size = 0
+        for (const [fieldName, type] of fields) {
+            if (!(type in FIELD_SIZES)) {
+                throw new Error(`[EventSchema] ${name}.${fieldName} 未知类型[${type}]`)
+            }
+            this.offsets.push(size)
+            size += FIELD_SIZES[type]
+        }
+        this.size = size
+    }
+
+    write(view: DataView, base: number, values: any[]) {
+        for (let i = 0; i < this.fields.length; i++) {
+            const off = base + this.offsets[i]
+            const v = values[i]
+            switch (this.fields[i][1]) {
+                case 'u1': view.setUint8(off, v); break
+                case 'i1': view.setInt8(off, v); break
+                case 'u2': view.setUint16(off, v, true); break
+                case 'i2': view.setInt16(off, v, true); break
+                case 'u4': view.setUint32(off, v, true); break
+                case 'i4': view.setInt32(off, v, true); break
+                case 'f4': view.setFloat32(off, v, true); break
+                case 'f8': view.setFloat64(off, v, true); break
+                case 'u8':
+                case 'i8':
+                case 'ptr': {
+                    // 避免BigInt, 拆成高低两个u32写入
+                    if (typeof v === 'number') {
+                        view.setUint32(off, v >>> 0, true)
+                        view.setUint32(off + 4, Math.floor(v / 0x100000000) >>> 0, true)
+                    } else {
+                        const p = ptr(v ?? 0)
+                        view.setUint32(off, p.and(0xffffffff).toUInt32(), true)
+                        view.setUint32(off + 4, p.shr(32).toUInt32(), true)
+                    }
+                    break
+                }
+            }
+        }
+    }
+}
+
+
+export class EventChannel {
+    readonly schema: EventSchema
+    readonly capacity: number
+    private _sender: BatchSender
+    private _buffer: ArrayBuffer
+    private _view: DataView
+    private _count: number = 0
+    private _timer: any = null
+    private _maxAge: number
+
+    constructor(name: string, fields: EventField[], { capacity = 4096, maxAge = 200 }: { capacity?: number, maxAge?: number } = {}) {
+        this.schema = new EventSchema(name, fields)
+        this.capacity = capacity
+        this._maxAge = maxAge
+        this._buffer = new ArrayBuffer(this.schema.size * capacity)
+        this._view = new DataView(this._buffer)
+        this._sender = help.newBatchSender(batchSendSource.event, { autoFlush: true })
+        // schema需先于事件到达主机
+        help.$send({
+            type: RPCMsgType.EVENT_SCHEMA,
+            data: {
+                name: this.schema.name,
+                fields: this.schema.fields,
+            },
+        })
+    }
+
+    emit(...values: any[]) {
+        this.schema.write(this._view, this._count * this.schema.size, values)
+        this._count++
+        if (this._count >= this.capacity) {
+            this.commit()
+        } else if (this._timer === null) {
+            this._timer = setTimeout(() => {
+                this._timer = null
+                this.commit()
+            }, this._maxAge)
+        }
+    }
+
+    // 把已填充的记录交给BatchSender, 由其按流控参数合批发送
+    private commit() {
+        if (this._timer !== null) {
+            clearTimeout(this._timer)
+            this._timer = null
+        }
+        if (!this._count) {
+            return
+        }
+        this._sender.send({
+            type: RPCMsgType.EVENT,
+            data: {
+                schema: this.schema.name,
+                count: this._count,
+            },
+        }, this._buffer.slice(0, this._count * this.schema.size))
+        this._count = 0
+    }
+
+    flush() {
+        this.commit()
+        this._sender.flush()
+    }
+}
+
+
+setGlobalProperties({
+    EventChannel,
+})
@@ -0,0 +1,110 @@
+import { Config, SendRule, setGlobalProperties } from './config.js'
+
+
+export const enum SendRuleAction {
+    KEEP = 'keep',
+    DROP = 'drop',
+    SAMPLE = 'sample',
+    RATE_LIMIT = 'rate_limit',
+}
+
+
+class SendRuleState {
+    readonly rule: SendRule
+    hits: number = 0
+    passed: number = 0
+    private tokens: number
+    private lastRefill: number
+
+    constructor(rule: SendRule) {
+        this.rule = rule
+        this.tokens = this.burst
+        this.lastRefill = Date.now()
+    }
+
+    get burst(): number {
+        return this.rule.burst || Math.max(1, this.rule.rate || 1)
+    }
+
+    match(type: string, source?: string, tag?: string): boolean {
+        const rule = this.rule
+        if (rule.type && rule.type !== type) return false
+        if (rule.source && rule.source !== source) return false
+        if (rule.tag && rule.tag !== tag) return false
+        return true
+    }
+
+    accept(): boolean {
+        this.hits++
+        let ok: boolean
+        switch (this.rule.action) {
+            case SendRuleAction.DROP:
+                ok = false
+                break
+            case SendRuleAction.SAMPLE:
+                ok = (this.hits - 1) % Math.max(1, this.rule.n || 1) === 0
+                break
+            case SendRuleAction.RATE_LIMIT: {
+                const now = Date.now()
+                this.tokens = Math.min(this.burst, this.tokens + (now - this.lastRefill) * (this.rule.rate || 0) / 1000)
+                this.lastRefill = now
+                ok = this.tokens >= 1
+                if (ok) this.tokens--
+                break
+            }
+            default:
+                ok = true
+        }
+        if (ok) this.passed++
+        return ok
+    }
+
+    toJSON() {
+        return {
+            rule: this.rule,
+            hits: this.hits,
+            passed: this.passed,
+            dropped: this.hits - this.passed,
+        }
+    }
+}
+
+
+export class SendFilter {
+    private static _rules: SendRule[] | undefined
+    private static _states: SendRuleState[] = []
+
+    private static get states(): SendRuleState[] {
+        // Config.SendRules 可能在运行中被 INIT_CONFIG 整体替换
+        if (this._rules !== Config.SendRules) {
+            this._rules = Config.SendRules
+            this._states = (Config.SendRules || []).map(v => new SendRuleState(v))
+        }
+        return this._states
+    }
+
+    static accept(message: any): boolean {
+        const states = this.states
+        if (!states.length || !message) {
+            return true
+        }
+        const type = message.type
+        const source = message.source
+        const tag = message.data?.tag
+        for (const state of states) {
+            if (state.match(type, source, tag)) {
+                return state.accept()
+            }
+        }
+        return true
+    }
+
+    static stats() {
+        return this.states.map(v => v.toJSON())
+    }
+}
+
+
+setGlobalProperties({
+    SendFilter,
+})
@@ -1,8 +1,9 @@
 import { Libc } from './lib/libc.js'
 import { FixedQueue } from './utils/queue.js'
-import { RPCMsgType, saveFileSource } from './message.js'
+import { RPCMsgType, saveFileSource, batchSendSource } from './message.js'
 import { Config, LogLevel, setGlobalProperties } from './config.js'
 import { TextEncoder } from './utils/text_endec.js'
+import { SendFilter } from './filter.js'
 
 
 export class NativePointerObject {
@@ -143,22 +144,97 @@ export type MemoryPage = {
 } & MemoryProtect
 
 
+export class FlowControl {
+    // 单批最多消息数
+    static batchSize: number = 64
+    // 单批最多字节数
+    static batchBytes: number = 1 << 20
+    // 批次最长滞留时间(ms)
+    static maxAge: number = 200
+    // 主机允许的批次数, <0为不限制; 额度耗尽时继续累积, 直到超过硬上限才强制发送
+    static credit: number = -1
+    static hardLimitFactor: number = 4
+
+    static update(data: { batch_size?: number, batch_bytes?: number, max_age?: number, credit?: number }) {
+        if (data.batch_size !== undefined) FlowControl.batchSize = Math.max(1, data.batch_size)
+        if (data.batch_bytes !== undefined) FlowControl.batchBytes = Math.max(1, data.batch_bytes)
+        if (data.max_age !== undefined) FlowControl.maxAge = Math.max(1, data.max_age)
+        if (data.credit !== undefined) FlowControl.credit = data.credit
+    }
+
+    static listen() {
+        recv(RPCMsgType.FLOW_CONTROL, (message: { data: any }) => {
+            FlowControl.update(message.data || {})
+            FlowControl.listen()
+        })
+    }
+
+    static consume(force: boolean): boolean {
+        if (FlowControl.credit < 0) {
+            return true
+        }
+        if (FlowControl.credit === 0) {
+            return force
+        }
+        FlowControl.credit--
+        return true
+    }
+}
+
+
 export class BatchSender {
     private _source: string
     private _batch_list: {
         message: any,
         data?: ArrayBuffer | null,
     }[] = []
+    private _batch_bytes: number = 0
+    private _autoFlush: boolean
+    private _timer: any = null
 
-    constructor(source: string) {
+    constructor(source: string, { autoFlush = false }: { autoFlush?: boolean } = {}) {
         this._source = source
+        this._autoFlush = autoFlush
     }
 
     send(message: any, data?: ArrayBuffer | null) {
+        if (!SendFilter.accept(message)) {
+            return
+        }
         this._batch_list.push({
             message: message,
             data: data,
         })
+        this._batch_bytes += data?.byteLength || 0
+        if (!this._autoFlush) {
+            return
+        }
+        if (this._batch_list.length >= FlowControl.batchSize || this._batch_bytes >= FlowControl.batchBytes) {
+            this.autoFlush()
+        } else if (this._timer === null) {
+            this._timer = setTimeout(() => {
+                this._timer = null
+                this.autoFlush()
+            }, FlowControl.maxAge)
+        }
+    }
+
+    private autoFlush() {
+        if (!this._batch_list.length) {
+            return
+        }
+        const force = this._batch_list.length >= FlowControl.batchSize * FlowControl.hardLimitFactor
+            || this._batch_bytes >= FlowControl.batchBytes * FlowControl.hardLimitFactor
+        if (!FlowControl.consume(force)) {
+            if (this._timer === null) {
+                this._timer = setTimeout(() => {
+                    this._timer = null
+                    this.autoFlush()
+                }, FlowControl.maxAge)
+            }
+            return
+        }
+        this.flush()
     }
 
     rpcResponse() {
@@ -192,14 +268,20 @@ export class BatchSender {
 
     clear(){
         this._batch_list = []
+        this._batch_bytes = 0
     }
 
     flush(){
+        if (this._timer !== null) {
+            clearTimeout(this._timer)
+            this._timer = null
+        }
         const [message, buff] = this.rpcResponse()
         if(!message && !buff) {
             return 
         }
-        Helper.$send(message, buff as ArrayBuffer)
+        // 批内消息已在send()中过滤, 信封不再经过SendFilter
+        send(message, buff as ArrayBuffer)
         this.clear()
     }
 
@@ -278,6 +360,11 @@ class Helper {
     private static _android_api_level?: number
     private static _dataDir: string
     private static _logfiles: {[key: string]: FileHelper}
+    private static _backtraceSender?: BatchSender
+    private static _backtraceModules?: ModuleMap
+    private static _backtraceMapsAt: number = 0
+    private static _backtracePending: NativePointer[] | null = null
+    private static _backtraceTimer: any = null
 
     static get dataDir(): string {
         if (!Helper._dataDir) {
@@ -440,7 +527,9 @@ class Helper {
     static dumpProcMaps(tag: string, pid: number | string = 'self') {
         const prog = new ProgressNotify('Helper.dumpProcMaps')
         const sm = this.readProcMaps(pid)
-        this.saveFile(tag, sm, 'w', saveFileSource.procMaps)
+        // 其他进程的maps带上pid, 主机不会用它覆盖本进程的地址索引
+        const foreign = pid !== 'self' && Number(pid) !== Process.id
+        this.saveFile(tag, sm, 'w', saveFileSource.procMaps, foreign ? { pid: Number(pid) } : {})
         prog.log(pid, `[${sm.length}]${tag}`)
     }
 
@@ -451,11 +540,16 @@ class Helper {
         prog.log(srcPath, `[${sm.length}](${tag})`)
     }
 
-    static backtrace({ context = undefined, addrHandler = DebugSymbol.fromAddress, backtracer = Backtracer.ACCURATE }: {
+    static backtrace({ context = undefined, addrHandler = DebugSymbol.fromAddress, backtracer = Backtracer.ACCURATE, raw = false, tag = '' }: {
         context?: undefined | CpuContext,
         addrHandler?: (addr: any) => any,
         backtracer?: Backtracer,
+        raw?: boolean,
+        tag?: string,
     } = {}) {
+        if (raw) {
+            return this.backtraceRaw({ context, backtracer, tag })
+        }
         const prog = new ProgressNotify('Helper.backtrace')
         const stacks = Thread.backtrace(context, backtracer).map(addr => {
             return `${addrHandler(addr)}`
@@ -463,18 +557,94 @@ class Helper {
         prog.log(Process.getCurrentThreadId(), '', stacks)
     }
 
+    // 只发送原始返回地址, 由主机侧按maps快照符号化
+    static backtraceRaw({ context = undefined, backtracer = Backtracer.ACCURATE, tag = '' }: {
+        context?: undefined | CpuContext,
+        backtracer?: Backtracer,
+        tag?: string,
+    } = {}) {
+        const addrs = Thread.backtrace(context, backtracer)
+        this._ensureBacktraceMaps(addrs)
+        const buff = new ArrayBuffer(addrs.length * 8)
+        const u32s = new Uint32Array(buff)
+        for (let i = 0; i < addrs.length; i++) {
+            u32s[i * 2] = addrs[i].and(0xffffffff).toUInt32()
+            u32s[i * 2 + 1] = addrs[i].shr(32).toUInt32()
+        }
+        if (!this._backtraceSender) {
+            this._backtraceSender = new BatchSender(batchSendSource.backtrace, { autoFlush: true })
+        }
+        this._backtraceSender.send({
+            type: RPCMsgType.BACKTRACE,
+            data: {
+                tag,
+                tid: Process.getCurrentThreadId(),
+                time: Date.now(),
+            },
+        }, buff)
+    }
 
-    static saveFile(tag: string, bs: string | ArrayBuffer | null, mode: string, source: string) {
+    // 在安装调用backtraceRaw的hook之前调用, 预先上报maps; 未调用时在首次回溯后(hook之外)补上
+    static prepareBacktrace() {
+        if (this._backtraceModules) {
+            return
+        }
+        this._backtraceModules = new ModuleMap()
+        this._backtraceMapsAt = Date.now()
+        this.dumpProcMaps('backtrace.maps')
+    }
+
+    private static _ensureBacktraceMaps(addrs: NativePointer[]) {
+        // hook中只记下最近一次的地址并安排检查, maps的比对与刷新都在hook之外进行
+        this._backtracePending = addrs
+        if (this._backtraceTimer !== null) {
+            return
+        }
+        const delay = this._backtraceModules ? Math.max(0, this._backtraceMapsAt + 1000 - Date.now()) : 0
+        this._backtraceTimer = setTimeout(() => {
+            this._backtraceTimer = null
+            this._refreshBacktraceMaps()
+        }, delay)
+    }
+
+    private static _refreshBacktraceMaps() {
+        const addrs = this._backtracePending
+        this._backtracePending = null
+        const modules = this._backtraceModules
+        if (!modules) {
+            this.prepareBacktrace()
+            return
+        }
+        if (!addrs) {
+            return
+        }
+        const unknown = addrs.filter(v => !modules.has(v))
+        if (!unknown.length) {
+            return
+        }
+        // 存在未知模块的地址时才刷新, 并限制频率(JIT等匿名内存总是无法命中)
+        this._backtraceMapsAt = Date.now()
+        modules.update()
+        if (unknown.some(v => modules.has(v))) {
+            this.dumpProcMaps('backtrace.maps')
+        }
+    }
+
+
+    static saveFile(
+        tag: string, bs: string | ArrayBuffer | null, mode: string, source: string,
+        extra: { pid?: number, module?: string, build_id?: string | null } = {},
+    ) {
         if (bs === null || bs === undefined) {
             return false
         }
 
         if (Config.OnRPC) {
             let buff: ArrayBuffer
-            if(bs instanceof String) {
+            if(typeof bs === 'string' || bs instanceof String) {
                 const enc = new TextEncoder()
-                const view = enc.encode(bs as string)
-                buff = view.buffer as ArrayBuffer
+                const view = enc.encode(String(bs))
+                buff = view.buffer.slice(view.byteOffset, view.byteOffset + view.byteLength) as ArrayBuffer
             }else{
                 buff = bs as ArrayBuffer
             }
@@ -484,6 +654,7 @@ class Helper {
                     source,
                     filepath: Helper.joinPath(this.outputDir, tag),
                     mode,
+                    ...extra,
                 }
             }, buff)
         }else{
@@ -592,8 +763,94 @@ class Helper {
         return page_infos
     }
 
-    static newBatchSender(source: string): BatchSender {
-        return new BatchSender(source)
+    // 进程内存快照: 先上报全部区间, 再逐个区间分块读取, 经BatchSender发给主机按区间写入稀疏文件
+    // skip为已完成区间的基址, 用于中断后续传; 每个区间之间让出事件循环, 以便处理流控消息
+    static snapshotMemory(tag: string, { protection = 'r--', chunkSize = 1 << 20, skip = [] }: {
+        protection?: string,
+        chunkSize?: number,
+        skip?: [string, number][],
+    } = {}): number {
+        const prog = new ProgressNotify('Helper.snapshotMemory')
+        // 只跳过base与size都一致的区间, 与主机侧合并已完成区间的规则相同
+        const rangeKey = (base: NativePointer, size: number) => `${base}:${size}`
+        const skipped = new Set(skip.map(([base, size]) => rangeKey(ptr(base), size)))
+        const ranges = Process.enumerateRanges({ protection, coalesce: false })
+        Helper.$send({
+            type: RPCMsgType.SNAPSHOT,
+            data: {
+                tag,
+                state: 'begin',
+                ranges: ranges.map(v => ({
+                    base: v.base,
+                    size: v.size,
+                    protection: v.protection,
+                    file: v.file?.path ?? '',
+                })),
+            },
+        })
+        const pending = ranges.filter(v => !skipped.has(rangeKey(v.base, v.size)))
+        const count = pending.length
+        const sender = new BatchSender(batchSendSource.snapshot, { autoFlush: true })
+        const pageSize = Process.pageSize
+        let total = 0
+
+        const sendChunk = (address: NativePointer, size: number): boolean => {
+            let buff: ArrayBuffer | null = null
+            try {
+                buff = address.readByteArray(size)
+            } catch (e) {
+                return false
+            }
+            if (buff === null) {
+                return false
+            }
+            sender.send({
+                type: RPCMsgType.SNAPSHOT_CHUNK,
+                data: { tag, address, size },
+            }, buff)
+            total += size
+            return true
+        }
+
+        const next = () => {
+            const range = pending.shift()
+            if (range === undefined) {
+                sender.flush()
+                Helper.$send({
+                    type: RPCMsgType.SNAPSHOT,
+                    data: { tag, state: 'end' },
+                })
+                prog.log(tag, `${count} ranges, ${total} bytes`)
+                return
+            }
+            this.memoryReadDo(range.base, range.size, (makeReadable, makeRecovery) => {
+                makeReadable()
+                for (let off = 0; off < range.size; off += chunkSize) {
+                    const address = range.base.add(off)
+                    const size = Math.min(chunkSize, range.size - off)
+                    if (sendChunk(address, size)) {
+                        continue
+                    }
+                    // 整块读取失败时逐页读取, 不可读的页留空
+                    for (let poff = 0; poff < size; poff += pageSize) {
+                        sendChunk(address.add(poff), Math.min(pageSize, size - poff))
+                    }
+                }
+                makeRecovery()
+            })
+            // 区间完成标记与数据走同一批次通道, 保证主机先写完数据
+            sender.send({
+                type: RPCMsgType.SNAPSHOT,
+                data: { tag, state: 'range', base: range.base },
+            })
+            setTimeout(next, 0)
+        }
+        setTimeout(next, 0)
+        return count
+    }
+
+    static newBatchSender(source: string, { autoFlush = false }: { autoFlush?: boolean } = {}): BatchSender {
+        return new BatchSender(source, { autoFlush })
     }
 
     static getLogfile(tag: string, mode: string): FileHelper {
@@ -607,6 +864,9 @@ class Helper {
     }
 
     static $send(message: any, data?: ArrayBuffer | number[] | null): void {
+        if (!SendFilter.accept(message)) {
+            return
+        }
         send(message, data)
     }
 
@@ -683,3 +943,6 @@ setGlobalProperties({
     'printErr': printErr,
 })
 
+
+FlowControl.listen()
+
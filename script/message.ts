@@ -12,10 +12,21 @@ export const enum RPCMsgType {
     SAVE_FILE = 'SAVE_FILE',
     SSL_SECRET = 'SSL_SECRET',
     PROGRESSING = 'PROGRESSING',
+    FLOW_CONTROL = 'FLOW_CONTROL',
+    SEND_RULE_STATS = 'SEND_RULE_STATS',
+    BACKTRACE = 'BACKTRACE',
+    SYMBOL_CACHE = 'SYMBOL_CACHE',
+    EVENT_SCHEMA = 'EVENT_SCHEMA',
+    EVENT = 'EVENT',
+    SNAPSHOT = 'SNAPSHOT',
+    SNAPSHOT_CHUNK = 'SNAPSHOT_CHUNK',
 }
 
 
 export const enum batchSendSource {
+    backtrace = 'backtrace',
+    event = 'event',
+    snapshot = 'snapshot',
 }
 
 
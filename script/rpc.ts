@@ -5,6 +5,9 @@ import { help } from "./helper.js"
 import { Libssl } from "./lib/libssl.js"
 import { proc } from "./process.js"
 import { ElfTools } from "./elf/tools.js"
+import { SendFilter } from "./filter.js"
+import { EventChannel } from "./event.js"
+import { Coverage } from "./coverage.js"
 
 const _BASE_CONTEXT = {
     Java,
@@ -34,6 +37,8 @@ const _BASE_CONTEXT = {
     SSLTools,
     ElfTools,
     Libssl,
+    EventChannel,
+    Coverage,
 
     Object, Array, String, Number, Boolean, Symbol, BigInt, Function,
     Math, Date, RegExp, Map, Set, WeakMap, WeakSet,
@@ -96,8 +101,98 @@ function getObj(instIdOrObjChain: string, scopeId: string, bind: boolean = false
 }
 
 
-function enumerateObjProps(instIdOrObjChain: string | Array<string>, scopeId: string) {
+// 原型链 -> shape id. 同一类的实例共享原型链, 主机按shape缓存原型链上的属性表, 只需首次发送
+const PROTO_IDS: WeakMap<object, number> = new WeakMap()
+const SHAPE_IDS: Map<string, number> = new Map()
+// 脚本重新加载后shape id重新分配, 主机据此丢弃旧的缓存
+const SHAPE_EPOCH = `${Process.id}:${Date.now().toString(16)}`
+let PROTO_ID_INCR = 0
+
+function protoChain(obj: any): Array<any> {
+    const chain: Array<any> = []
+    let proto = Object.getPrototypeOf(obj)
+    while (proto && proto !== Object.prototype) {
+        chain.push(proto)
+        proto = Object.getPrototypeOf(proto)
+    }
+    return chain
+}
+
+function shapeOf(chain: Array<any>): number {
+    // 带上每层的key数量, 原型被修改后得到新的shape
+    const parts: Array<string> = []
+    for (const proto of chain) {
+        let id = PROTO_IDS.get(proto)
+        if (id === undefined) {
+            id = ++PROTO_ID_INCR
+            PROTO_IDS.set(proto, id)
+        }
+        parts.push(`${id}:${Reflect.ownKeys(proto).length}`)
+    }
+    const key = parts.join(',')
+    let shape = SHAPE_IDS.get(key)
+    if (shape === undefined) {
+        shape = SHAPE_IDS.size
+        SHAPE_IDS.set(key, shape)
+    }
+    return shape
+}
+
+function describeProps(target: any, levels: Array<any>): { [key: string]: string } {
+    const props: { [key: string]: string } = {}
+    const numKeys: Array<number> = []
+    for (const level of levels) {
+        for (const key of Reflect.ownKeys(level)) {
+            if (typeof (key) === 'symbol') {
+                continue
+            }
+            if(/^\d+$/.test(key)){
+                numKeys.push(parseInt(key))
+                continue
+            }
+            let type
+            const desc = Reflect.getOwnPropertyDescriptor(level, key)
+            if (desc?.get) {
+                type = 'getter'
+            }else if (desc?.set) {
+                type = 'setter'
+            }else{
+                type = typeof(level[key])
+            }
+            props[String(key)] = type
+        }
+    }
+    if(numKeys.length > 0) {
+        if(numKeys.length <= 50) {
+            for(let n of numKeys) {
+                const key = n.toString()
+                const desc = Reflect.getOwnPropertyDescriptor(target, key)
+                let type
+                if (desc?.get) {
+                    type = 'getter'
+                } else if (desc?.set) {
+                    type = 'setter'
+                } else {
+                    type = typeof (target[key])
+                }
+                props[String(key)] = type
+            }
+        }else{
+            const minN: number = Math.min(...numKeys)
+            const maxN: number = Math.max(...numKeys)
+            props[`[${minN}:${maxN+1}]`] = 'index'
+        }
+    }
+    return props
+}
+
+
+function enumerateObjProps(instIdOrObjChain: string | Array<string>, scopeId: string, knownShapes: Array<number> = [], epoch: string = '') {
+    // props只含对象自身的属性, 原型链上的属性在 shape_props 中, 主机已缓存的shape不再发送
     const propsList: Array<{ [key: string]: string }> = []
+    const shapes: Array<number> = []
+    const shapeProps: { [key: number]: { [key: string]: string } } = {}
+    const known = new Set(epoch === SHAPE_EPOCH ? knownShapes : [])
     const objList: Array<string> = []
     if(typeof(instIdOrObjChain) === 'string') {
         objList.push(instIdOrObjChain)
@@ -105,65 +200,36 @@ function enumerateObjProps(instIdOrObjChain: string | Array<string>, scopeId: st
         objList.push(...instIdOrObjChain)
     }
     for (let v of objList) {
-        const props: { [key: string]: string } = {}
+        let props: { [key: string]: string } = {}
+        let shape = -1
         let obj
         try{
             obj = getObj(v, scopeId)
         }catch(e){}
         try {
-            const numKeys: Array<number> = []
-            while (obj && obj !== Object.prototype) {
-                for (const key of Reflect.ownKeys(obj)) {
-                    if (typeof (key) === 'symbol') {
-                        continue
-                    }
-                    if(/^\d+$/.test(key)){
-                        numKeys.push(parseInt(key))
-                        continue
-                    }
-                    let type
-                    const desc = Reflect.getOwnPropertyDescriptor(obj, key)
-                    if (desc?.get) {
-                        type = 'getter'
-                    }else if (desc?.set) {
-                        type = 'setter'
-                    }else{
-                        type = typeof(obj[key])
+            if (obj && (typeof (obj) === 'object' || typeof (obj) === 'function') && obj !== Object.prototype) {
+                const chain = protoChain(obj)
+                props = describeProps(obj, [obj])
+                if (chain.length > 0) {
+                    shape = shapeOf(chain)
+                    if (!known.has(shape) && !(shape in shapeProps)) {
+                        shapeProps[shape] = describeProps(obj, chain)
                     }
-                    props[String(key)] = type
-                }
-                obj = Object.getPrototypeOf(obj)
-            }
-            if(numKeys.length > 0) {
-                if(numKeys.length <= 50) {
-                    for(let n of numKeys) {
-                        const key = n.toString()
-                        const desc = Reflect.getOwnPropertyDescriptor(obj, key)
-                        let type
-                        if (desc?.get) {
-                            type = 'getter'
-                        } else if (desc?.set) {
-                            type = 'setter'
-                        } else {
-                            type = typeof (obj[key])
-                        }
-                        props[String(key)] = type
-                    }
-                }else{
-                    const minN: number = Math.min(...numKeys)
-                    const maxN: number = Math.max(...numKeys)
-                    props[`[${minN}:${maxN+1}]`] = 'index'
                 }
             }
         } catch (e) {
         }
 
         propsList.push(props)
+        shapes.push(shape)
     }
     return {
         type: RPCMsgType.ENUMERATE_OBJ_PROPS,
         data: {
             props: propsList,
+            shapes,
+            shape_props: shapeProps,
+            epoch: SHAPE_EPOCH,
         },
     }
 }
@@ -255,6 +321,21 @@ function scopeEval(source: string, scopeId: string) {
 }
 
 
+function sendRuleStats() {
+    return {
+        type: RPCMsgType.SEND_RULE_STATS,
+        data: {
+            stats: SendFilter.stats(),
+        }
+    }
+}
+
+
+function snapshotMemory(tag: string, skip: [string, number][] = []) {
+    return help.snapshotMemory(tag, { skip })
+}
+
+
 rpc.exports = {
     enumerateObjProps,
     scopeCall,
@@ -263,5 +344,7 @@ rpc.exports = {
     scopeGet,
     scopeSave,
     scopeDel,
+    sendRuleStats,
+    snapshotMemory,
 }
 
@@ -0,0 +1,24 @@
+from agent.config import TimeSeries
+from agent.timeseries import TimeSeriesStore
+
+
+def test_query_mixed_schemas(tmp_path):
+    # 第二个块才出现 data.error, 查询结果各列行数必须一致, 缺失处为None
+    store = TimeSeriesStore(tmp_path, TimeSeries(enable=True, block_rows=2))
+    for step in range(4):
+        data = {'step': step}
+        if step >= 2:
+            data['error'] = f'boom{step}'
+        store.record({'type': 'PROGRESSING', 'data': data}, ts=step + 1)
+    store.flush()
+
+    result = store.table('PROGRESSING').query()
+    assert [len(v) for v in result.values()] == [4] * len(result)
+    assert list(result['data.step']) == [0, 1, 2, 3]
+    assert list(result['data.error']) == [None, None, 'boom2', 'boom3']
+
+    rows = list(store.iter_rows('PROGRESSING'))
+    assert [(v['data.step'], v['data.error']) for v in rows] == [(0, None), (1, None), (2, 'boom2'), (3, 'boom3')]
+
+    result = store.table('PROGRESSING').query(columns=['data.error'], start=3)
+    assert list(result['data.error']) == ['boom2', 'boom3']